@@ -0,0 +1,629 @@
+"""
+    This module runs the PDF manager operations without any prompt, over many documents at once.
+    Inputs are paths or glob patterns, or are listed in a manifest file (one path or pattern per line).
+    Each document is handled by a pool of worker processes and its result is printed as a JSON line,
+    while the progress messages of the PDF manager go to the standard error.
+
+    Usage: python main.py <command> [options] inputs...
+"""
+# Necessary modules
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+import concurrent.futures
+from concurrent.futures import as_completed
+from contextlib import redirect_stdout
+from typing import Iterator, List, Optional
+
+from extraction_cache import Extraction_cache
+from instrumentation import Instrumentation
+from job_journal import Job_journal, atomic_output, options_key
+from metadata_scanner import scan_documents, scan_formats, scan_metadata, walk_pdf_files, write_scan
+from pdf_manager import PDF_manager
+from search_index import PDF_search_index
+
+# Commands run on each input document separately
+document_commands = [
+    "split",
+    "encrypt",
+    "decrypt",
+    "watermark",
+    "rotate",
+    "crop",
+    "extract-text",
+    "extract-images",
+    "metadata",
+    "optimize",
+]
+
+
+# Expand the glob patterns and manifest file into the list of input documents
+def expand_inputs(patterns: List[str], manifest: Optional[str] = None) -> List[str]:
+    """
+    Expands input paths, glob patterns and manifest entries into a list of files.
+
+    Args:
+        patterns (List[str]): Paths or glob patterns ("**" matches nested directories).
+        manifest (Optional[str]): Path of a file listing one path or pattern per line.
+            Blank lines and lines starting with "#" are ignored.
+
+    Returns:
+        List[str]: The matching files, in the order given, without duplicates.
+    """
+    patterns = list(patterns)
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as manifest_file:
+            patterns.extend(line.strip() for line in manifest_file
+                            if line.strip() and not line.lstrip().startswith("#"))
+
+    filenames = []
+    for pattern in patterns:
+        # A pattern without any match is kept as-is, so that its error is reported
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for filename in matches:
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+# Print the profile report of an operation (stdout is redirected to stderr while it runs)
+def _print_profile(event: dict) -> None:
+    if event["type"] == "profile":
+        print(f"Profile of {event['name']}:\n{event['report']}")
+
+
+# Instrumentation of a batch run
+def _instrumentation(options: dict) -> Instrumentation:
+    instrumentation = Instrumentation(profile=options.get("profile", False), trace_memory=options.get("metrics", False))
+    if options.get("profile"):
+        instrumentation.add_hook(_print_profile)
+    return instrumentation
+
+
+# Output path for a document in the output directory
+def _output_path(output_dir: str, filename: str, suffix: str, extension: str = ".pdf") -> str:
+    name_without_ext = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(output_dir, f"{name_without_ext}{suffix}{extension}")
+
+
+# Path of the document written by an editing command
+def _edited_path(output_dir: str, filename: str, suffix: str, options: dict) -> str:
+    return filename if options.get("in_place") else _output_path(output_dir, filename, suffix)
+
+
+# Move an unreadable input to the quarantine directory, under a name not taken yet
+def _quarantine(filename: str, quarantine_dir: str) -> str:
+    os.makedirs(quarantine_dir, exist_ok=True)
+    name, extension = os.path.splitext(os.path.basename(filename))
+    destination = os.path.join(quarantine_dir, name + extension)
+    copy_number = 1
+    while os.path.exists(destination):
+        destination = os.path.join(quarantine_dir, f"{name}_{copy_number}{extension}")
+        copy_number += 1
+    shutil.move(filename, destination)
+    return destination
+
+
+# Run one command on one document (runs in a worker process)
+def run_operation(command: str, filename: str, options: dict) -> dict:
+    """
+    Runs a command on a single document.
+
+    Args:
+        command (str): One of document_commands.
+        filename (str): Path of the input document.
+        options (dict): Command options ("output_dir", "cache_dir", "metrics", "profile", "password",
+            "text", "image" and "watermark_pdf" for watermark,
+            "pages", "chunk_size", "by_bookmarks", "max_chunk_bytes", "split_workers" for split,
+            "angle" and "pages" for rotate, "box", "margin" and "pages" for crop,
+            "save_options" for split, watermark, rotate and crop, "in_place" for watermark, rotate, crop and optimize,
+            "max_image_dpi", "jpeg_quality", "image_workers", "dry_run" and "save_options" for optimize,
+            "raw_streams" for extract-images,
+            and "journal" (path of the job journal) and "quarantine_dir" for every command).
+
+    Returns:
+        dict: The result of the command with the keys "input", "command", "ok", "outputs"
+            and "error", plus "metadata" for the metadata command, "report" for the optimize command
+            (see PDF_manager.optimize_pdf()), "quarantined" (the new path of
+            an unreadable input moved to the quarantine directory) and "metrics" (counters and span
+            totals) when the "metrics" option is set.
+    """
+    result = {"input": filename, "command": command, "ok": False, "outputs": [], "error": None}
+    cache = Extraction_cache(options["cache_dir"]) if options.get("cache_dir") else None
+    instrumentation = _instrumentation(options)
+    manager = PDF_manager(cache, instrumentation)
+    output_dir = options["output_dir"]
+    journal = Job_journal(options["journal"]) if options.get("journal") else None
+
+    # The messages of the PDF manager must not mix with the JSON results
+    try:
+        with redirect_stdout(sys.stderr):
+            if not os.path.isfile(filename):
+                raise FileNotFoundError(f"The file '{filename}' does not exist.")
+            os.makedirs(output_dir, exist_ok=True)
+
+            match command:
+                case "split":
+                    result["outputs"] = manager.splitting_pdf_document(
+                        filename, output_dir, page_ranges=options.get("pages"), chunk_size=options.get("chunk_size"),
+                        by_bookmarks=options.get("by_bookmarks", False), max_chunk_bytes=options.get("max_chunk_bytes"),
+                        workers=options.get("split_workers", 1), journal=journal,
+                        save_options=options.get("save_options"))
+                    result["ok"] = bool(result["outputs"])
+
+                case "encrypt":
+                    output_pdf_path = _output_path(output_dir, filename, "_encrypted")
+                    result["ok"] = manager.encrypt_pdf_aes256(filename, options["password"], output_pdf_path)
+                    result["outputs"] = [output_pdf_path]
+
+                case "decrypt":
+                    output_pdf_path = _output_path(output_dir, filename, "_decrypted")
+                    result["ok"] = manager.decrypt_pdf_aes256(filename, options["password"], output_pdf_path)
+                    result["outputs"] = [output_pdf_path]
+
+                case "watermark":
+                    output_pdf_path = _edited_path(output_dir, filename, "_watermarked", options)
+                    manager.add_watermark(filename, output_pdf_path, options.get("text"),
+                                          options.get("image"), options.get("watermark_pdf"),
+                                          save_options=options.get("save_options"))
+                    result["ok"] = True
+                    result["outputs"] = [output_pdf_path]
+
+                case "rotate":
+                    output_pdf_path = _edited_path(output_dir, filename, "_rotated", options)
+                    manager.rotate_pdf(filename, output_pdf_path, options["angle"], options.get("pages"),
+                                       save_options=options.get("save_options"))
+                    result["ok"] = True
+                    result["outputs"] = [output_pdf_path]
+
+                case "crop":
+                    result["outputs"] = [manager.cropping_pdf_document(
+                        filename, _edited_path(output_dir, filename, "_cropped", options), options.get("box"),
+                        options.get("pages"), options.get("margin", 0.0), save_options=options.get("save_options"))]
+                    result["ok"] = True
+
+                case "extract-text":
+                    # Stream the pages straight into the text file; a page failing raises and discards it
+                    output_text_path = _output_path(output_dir, filename, "", ".txt")
+                    with atomic_output(output_text_path, "w", encoding="utf-8") as text_file:
+                        for page_number, text in manager.iter_pdf_pages(filename):
+                            text_file.write(f"--- Page {page_number} ---\n{text}\n")
+                    result["ok"] = True
+                    result["outputs"] = [output_text_path]
+
+                case "extract-images":
+                    images_dir = _output_path(output_dir, filename, "", "")
+                    manifest = manager.extract_images_from_pdf(filename, images_dir, options.get("raw_streams", False),
+                                                               journal=journal)
+                    result["ok"] = manifest is not None
+                    result["outputs"] = [images_dir]
+
+                case "optimize":
+                    output_pdf_path = _edited_path(output_dir, filename, "_optimized", options)
+                    result["report"] = manager.optimize_pdf(
+                        filename, output_pdf_path, options.get("max_image_dpi"), options.get("jpeg_quality"),
+                        options.get("image_workers", 1), options.get("dry_run", False), options.get("save_options"))
+                    result["ok"] = result["report"] is not None
+                    result["outputs"] = [] if options.get("dry_run") else [output_pdf_path]
+
+                case "metadata":
+                    metadata = manager.display_pdf_metadata(filename)
+                    result["metadata"] = {key: None if value is None else str(value)
+                                          for key, value in metadata.items()}
+                    result["ok"] = True
+
+                case _:
+                    raise ValueError(f"Unknown command: {command}")
+
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # An input that cannot even be opened is moved aside, so that later runs do not trip on it again
+    if not result["ok"] and options.get("quarantine_dir") and os.path.isfile(filename):
+        error = scan_metadata(filename)["error"]
+        if error is not None:
+            result["quarantined"] = _quarantine(filename, options["quarantine_dir"])
+            result["error"] = result["error"] or error
+            if journal is not None:
+                journal.record_quarantine(command, filename, result["quarantined"], error)
+
+    if options.get("metrics"):
+        result["metrics"] = instrumentation.summary()
+    if journal is not None:
+        if "quarantined" not in result:
+            journal.record_document(command, filename, result, options_key(options))
+        journal.close()
+    return result
+    ## End run_operation() function ##
+
+
+# Merge all the documents into one (runs in the calling process)
+def run_merge(filenames: List[str], output_filename: str, options: dict) -> dict:
+    """
+    Merges documents, in order, into a single document.
+
+    Args:
+        filenames (List[str]): Paths of the input documents.
+        output_filename (str): Path of the merged document.
+        options (dict): Command options ("cache_dir", "metrics", "profile", "journal", and "engine",
+            "deduplicate", "max_open_readers" and "save_options" for the merge).
+
+    Returns:
+        dict: The result of the merge with the keys "inputs", "command", "ok", "outputs" and
+            "report" (see PDF_manager.merge_pdf_documents()), plus "metrics" when the
+            "metrics" option is set, and "resumed" when the journal shows the same merge done.
+    """
+    # The merged document stands for the job in the journal, keyed by the inputs and their state
+    journal = Job_journal(options["journal"]) if options.get("journal") else None
+    if journal is not None:
+        key = options_key({**options, "inputs": [[os.path.abspath(filename), os.path.getsize(filename),
+                                                  os.stat(filename).st_mtime_ns] if os.path.isfile(filename) else filename
+                                                 for filename in filenames]})
+        try:
+            completed = journal.completed("merge", output_filename, key)
+        finally:
+            journal.close()
+        if completed is not None:
+            return {**completed, "resumed": True}
+
+    cache = Extraction_cache(options["cache_dir"]) if options.get("cache_dir") else None
+    instrumentation = _instrumentation(options)
+    manager = PDF_manager(cache, instrumentation)
+    try:
+        with redirect_stdout(sys.stderr):
+            report = manager.merge_pdf_documents(filenames, output_filename,
+                                                 max_open_readers=options.get("max_open_readers"),
+                                                 deduplicate=options.get("deduplicate", False),
+                                                 engine=options.get("engine", "pypdf2"),
+                                                 save_options=options.get("save_options"))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    result = {"inputs": filenames, "command": "merge", "ok": report is not None,
+              "outputs": [output_filename], "report": report}
+    if options.get("metrics"):
+        result["metrics"] = instrumentation.summary()
+    if journal is not None and result["ok"]:
+        try:
+            journal.record_document("merge", output_filename, result, key)
+        finally:
+            journal.close()
+    return result
+
+
+# Index the text of all the documents (runs in the calling process)
+def run_index(filenames: List[str], options: dict) -> dict:
+    """
+    Brings the search index up to date with documents.
+
+    Args:
+        filenames (List[str]): Paths of the documents.
+        options (dict): Command options ("cache_dir", "metrics", "profile", "workers", and "index_dir",
+            "prune" and "optimize" for the index).
+
+    Returns:
+        dict: The result of the update with the keys "inputs" (count), "command", "ok", "report"
+            (see PDF_search_index.update(), plus "removed" when pruning) and "index" (see
+            PDF_search_index.stats()), plus "metrics" when the "metrics" option is set.
+    """
+    cache = Extraction_cache(options["cache_dir"]) if options.get("cache_dir") else None
+    instrumentation = _instrumentation(options)
+    index = PDF_search_index(options["index_dir"], PDF_manager(cache, instrumentation))
+    try:
+        with redirect_stdout(sys.stderr):
+            report = index.update(filenames, options.get("workers", 1))
+            if options.get("prune"):
+                report["removed"] = index.prune()
+            if options.get("optimize"):
+                index.optimize()
+        result = {"inputs": len(filenames), "command": "index", "ok": not report["failed"], "report": report,
+                  "index": index.stats()}
+    finally:
+        index.close()
+        if cache is not None:
+            cache.close()
+
+    if options.get("metrics"):
+        result["metrics"] = instrumentation.summary()
+    return result
+
+
+# Inputs of a scan, expanded lazily
+def _scan_inputs(patterns: List[str], manifest: Optional[str] = None) -> Iterator[str]:
+    def entries():
+        yield from patterns
+        if manifest:
+            with open(manifest, "r", encoding="utf-8") as manifest_file:
+                for line in manifest_file:
+                    if line.strip() and not line.lstrip().startswith("#"):
+                        yield line.strip()
+
+    for pattern in entries():
+        if any(character in pattern for character in "*?["):
+            yield from glob.iglob(pattern, recursive=True)
+        else:
+            yield pattern
+
+
+# Scan the metadata of every document of directories
+def run_scan(patterns: List[str], options: dict) -> dict:
+    """
+    Scans the metadata of documents and writes a record per document as soon as it is read.
+
+    Args:
+        patterns (List[str]): Directories (walked recursively), paths or glob patterns.
+        options (dict): Command options ("manifest", "workers", "chunk_size", "format" and "output",
+            a path or None for the standard output).
+
+    Returns:
+        dict: The totals of the scan (see metadata_scanner.write_scan()) with the keys "command",
+            "ok" (no document failed) and "elapsed_seconds".
+    """
+    start = time.perf_counter()
+    paths = walk_pdf_files(_scan_inputs(patterns, options.get("manifest")))
+    records = scan_documents(paths, options.get("workers", 1), options.get("chunk_size", 64))
+    if options.get("output"):
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            totals = write_scan(records, output, options.get("format", "jsonl"))
+    else:
+        totals = write_scan(records, sys.stdout, options.get("format", "jsonl"))
+    return {"command": "scan", "ok": not totals["errors"], **totals,
+            "elapsed_seconds": time.perf_counter() - start}
+
+
+# Run a command over many documents with a pool of workers
+def run_batch(command: str, filenames: List[str], options: dict, workers: int = 1):
+    """
+    Runs a command on every document, yielding the results as they complete.
+
+    Args:
+        command (str): One of document_commands.
+        filenames (List[str]): Paths of the input documents.
+        options (dict): Command options, see run_operation().
+        workers (int): Number of worker processes. With 1, documents are handled in this process.
+
+    Yields:
+        dict: The result of each document, see run_operation(); with a journal, the results of
+            the documents done by an earlier run come first, from the journal, with "resumed" set.
+    """
+    # Documents done by an earlier run of the job are not processed again
+    if options.get("journal"):
+        journal = Job_journal(options["journal"])
+        key = options_key(options)
+        pending = []
+        try:
+            for filename in filenames:
+                completed = journal.completed(command, filename, key)
+                if completed is not None:
+                    yield {**completed, "resumed": True}
+                else:
+                    pending.append(filename)
+        finally:
+            journal.close()
+        filenames = pending
+
+    if workers <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield run_operation(command, filename, options)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_operation, command, filename, options) for filename in filenames]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# Command line parser
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Process PDF documents in batch, without prompts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("inputs", nargs="*", help="PDF files or glob patterns (quote patterns using **)")
+    common.add_argument("--manifest", help="file listing one input path or pattern per line")
+    common.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    common.add_argument("--output-dir", default="./treated_documents", help="directory of the output files")
+    common.add_argument("--cache-dir", help="extraction cache directory (no cache by default)")
+    common.add_argument("--metrics", action="store_true", help="add the counters and phase timings to each result")
+    common.add_argument("--profile", action="store_true", help="print a cProfile report of each operation to stderr")
+    common.add_argument("--journal", help="job journal: a rerun with it skips the documents, chunks and images done")
+    common.add_argument("--quarantine", dest="quarantine_dir", metavar="DIR",
+                        help="move the inputs that cannot be opened to this directory")
+
+    # Password options of the encryption commands
+    password = argparse.ArgumentParser(add_help=False)
+    password_source = password.add_mutually_exclusive_group(required=True)
+    password_source.add_argument("--password", help="password (visible in the process list)")
+    password_source.add_argument("--password-env", metavar="VARIABLE", help="environment variable holding the password")
+
+    # Save options of the commands editing documents
+    save = argparse.ArgumentParser(add_help=False)
+    save.add_argument("--incremental", action="store_true",
+                      help="append the changes to the document instead of rewriting it")
+    save.add_argument("--in-place", action="store_true",
+                      help="update the input documents instead of writing copies (with --incremental, only the changes are written)")
+    save.add_argument("--object-streams", choices=["preserve", "generate", "disable"],
+                      help="object streams of rewritten documents (generate packs the small objects together; "
+                           "default: preserve, generate with --optimize)")
+    save.add_argument("--linearize", action="store_true", help="linearize rewritten documents for fast web view")
+
+    # Options of the optimizer, run by the optimize command or before saving with --optimize
+    optimizer = argparse.ArgumentParser(add_help=False)
+    optimizer.add_argument("--max-image-dpi", type=float, metavar="DPI", help="downsample the images drawn above this resolution")
+    optimizer.add_argument("--jpeg-quality", type=int, metavar="QUALITY",
+                           help="recompress the images as JPEG with this quality (1 to 95)")
+    optimizer.add_argument("--image-workers", type=int, default=1, help="processes resampling the images of a document")
+    optimize_output = argparse.ArgumentParser(add_help=False, parents=[optimizer])
+    optimize_output.add_argument("--optimize", action="store_true",
+                                 help="optimize the outputs: unused resources, duplicate objects, streams and images")
+
+    split_parser = subparsers.add_parser("split", parents=[common, optimize_output], help="split documents into single pages or chunks")
+    split_boundaries = split_parser.add_mutually_exclusive_group()
+    split_boundaries.add_argument("--pages", help='page ranges of the chunks, e.g. "1-3,7,10-"')
+    split_boundaries.add_argument("--chunk-size", type=int, help="number of pages per chunk")
+    split_boundaries.add_argument("--by-bookmarks", action="store_true", help="start a chunk at each top-level bookmark")
+    split_boundaries.add_argument("--max-chunk-bytes", type=int, help="approximate size of each chunk, in bytes")
+    split_parser.add_argument("--split-workers", type=int, default=1, help="processes writing the chunks of a document")
+    merge_parser = subparsers.add_parser("merge", parents=[common, optimize_output], help="merge the inputs, in order, into one document")
+    merge_parser.add_argument("--output", required=True, help="path of the merged document")
+    merge_parser.add_argument("--engine", choices=["pypdf2", "pikepdf"], default="pypdf2", help="page copying engine")
+    merge_parser.add_argument("--deduplicate", action="store_true", help="write identical fonts and images once")
+    merge_parser.add_argument("--max-open-readers", type=int, help="maximum number of inputs open at once")
+    subparsers.add_parser("encrypt", parents=[common, password], help="encrypt documents with AES-256")
+    subparsers.add_parser("decrypt", parents=[common, password], help="decrypt AES-256 encrypted documents")
+    watermark_parser = subparsers.add_parser("watermark", parents=[common, save, optimize_output], help="add a text, image or PDF watermark")
+    watermark_source = watermark_parser.add_mutually_exclusive_group(required=True)
+    watermark_source.add_argument("--text", help="watermark text")
+    watermark_source.add_argument("--image", help="image file used as watermark")
+    watermark_source.add_argument("--pdf", dest="watermark_pdf", help="PDF file whose first page is the watermark")
+    rotate_parser = subparsers.add_parser("rotate", parents=[common, save, optimize_output], help="rotate pages")
+    rotate_parser.add_argument("--angle", type=int, default=90, help="clockwise rotation, a multiple of 90")
+    rotate_parser.add_argument("--pages", help='pages to rotate, e.g. "1-3,7,10-" (default: every page)')
+    crop_parser = subparsers.add_parser("crop", parents=[common, save, optimize_output], help="crop pages to a box or to their content")
+    crop_parser.add_argument("--box", type=float, nargs=4, metavar=("LEFT", "BOTTOM", "RIGHT", "TOP"),
+                             help="crop box in points (default: the bounding box of the content of each page)")
+    crop_parser.add_argument("--margin", type=float, default=0.0, help="space kept around the crop box, in points")
+    crop_parser.add_argument("--pages", help='pages to crop, e.g. "1-3,7,10-" (default: every page)')
+    subparsers.add_parser("extract-text", parents=[common], help="write the text of documents to .txt files")
+    images_parser = subparsers.add_parser("extract-images", parents=[common], help="extract the images of documents")
+    images_parser.add_argument("--raw", dest="raw_streams", action="store_true",
+                               help="write the raw stream bytes instead of decoding the images")
+    subparsers.add_parser("metadata", parents=[common], help="print the metadata of documents")
+    optimize_parser = subparsers.add_parser("optimize", parents=[common, optimizer], help="make documents smaller")
+    optimize_parser.add_argument("--dry-run", action="store_true", help="report the size of the outputs without writing them")
+    optimize_parser.add_argument("--in-place", action="store_true", help="replace the input documents")
+    optimize_parser.add_argument("--object-streams", choices=["preserve", "generate", "disable"], default="generate",
+                                 help="object streams of the outputs (generate packs the small objects together)")
+    optimize_parser.add_argument("--linearize", action="store_true", help="linearize the outputs for fast web view")
+    index_parser = subparsers.add_parser("index", parents=[common], help="add new and changed documents to the search index")
+    index_parser.add_argument("--index-dir", default=".pdf_index", help="search index directory")
+    index_parser.add_argument("--prune", action="store_true", help="remove the documents whose files are gone")
+    index_parser.add_argument("--optimize", action="store_true", help="merge the index segments after the update")
+    scan_parser = subparsers.add_parser("scan", help="stream the metadata of every document of directories")
+    scan_parser.add_argument("inputs", nargs="*", help="directories (walked recursively), PDF files or glob patterns")
+    scan_parser.add_argument("--manifest", help="file listing one input directory, path or pattern per line")
+    scan_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    scan_parser.add_argument("--chunk-size", type=int, default=64, help="documents sent to a worker at once")
+    scan_parser.add_argument("--format", choices=scan_formats, default="jsonl", help="format of the records")
+    scan_parser.add_argument("--output", help="file receiving the records (default: the standard output)")
+    search_parser = subparsers.add_parser("search", help="print the pages matching a query, one JSON line per hit")
+    search_parser.add_argument("query", help="terms every page found contains")
+    search_parser.add_argument("--index-dir", default=".pdf_index", help="search index directory")
+    search_parser.add_argument("--limit", type=int, default=20, help="maximum number of hits")
+    search_parser.add_argument("--offset", type=int, default=0, help="hits to skip")
+    search_parser.add_argument("--raw", action="store_true", help="use the FTS5 query syntax (OR, NOT, prefix*, ...)")
+
+    return parser
+
+
+# Entry point of the batch mode
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the batch command line.
+
+    Args:
+        argv (Optional[List[str]]): Command line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit status, 0 when every document succeeded, 1 otherwise.
+    """
+    args = build_parser().parse_args(argv)
+
+    # Searching reads the index only
+    if args.command == "search":
+        index = PDF_search_index(args.index_dir, PDF_manager(instrumentation=Instrumentation(hooks=[])))
+        try:
+            hits = index.search(args.query, args.limit, args.offset, args.raw)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        finally:
+            index.close()
+        for hit in hits:
+            print(json.dumps(hit))
+        return 0 if hits else 1
+
+    # Scans stream their inputs, which may be whole archives
+    if args.command == "scan":
+        if not args.inputs and not args.manifest:
+            print("No input documents.", file=sys.stderr)
+            return 1
+        result = run_scan(args.inputs, {"manifest": args.manifest, "workers": args.workers,
+                                        "chunk_size": args.chunk_size, "format": args.format, "output": args.output})
+        print(json.dumps(result), file=sys.stderr if not args.output else sys.stdout)
+        return 0 if result["ok"] else 1
+
+    filenames = expand_inputs(args.inputs, args.manifest)
+    if not filenames:
+        print("No input documents.", file=sys.stderr)
+        return 1
+
+    options = {"output_dir": args.output_dir, "cache_dir": args.cache_dir, "metrics": args.metrics,
+               "profile": args.profile, "journal": args.journal, "quarantine_dir": args.quarantine_dir}
+
+    # Optimizer options, for the outputs or the optimize command itself
+    if getattr(args, "jpeg_quality", None) is not None and not 1 <= args.jpeg_quality <= 95:
+        print("--jpeg-quality must be between 1 and 95.", file=sys.stderr)
+        return 1
+    optimize = {"max_image_dpi": args.max_image_dpi, "jpeg_quality": args.jpeg_quality,
+                "workers": args.image_workers} if getattr(args, "optimize", False) else False
+
+    # Merging is a single operation over all the inputs
+    if args.command == "merge":
+        options.update(engine=args.engine, deduplicate=args.deduplicate, max_open_readers=args.max_open_readers,
+                       save_options={"optimize": optimize} if optimize else None)
+        result = run_merge(filenames, args.output, options)
+        print(json.dumps(result))
+        return 0 if result["ok"] else 1
+    if args.command == "index":
+        options.update(workers=args.workers, index_dir=args.index_dir, prune=args.prune, optimize=args.optimize)
+        result = run_index(filenames, options)
+        print(json.dumps(result))
+        return 0 if result["ok"] else 1
+
+    if args.command in ("encrypt", "decrypt"):
+        options["password"] = args.password if args.password is not None else os.environ.get(args.password_env)
+        if options["password"] is None:
+            print(f"The environment variable {args.password_env} is not set.", file=sys.stderr)
+            return 1
+    if args.command == "split":
+        options.update(pages=args.pages, chunk_size=args.chunk_size, by_bookmarks=args.by_bookmarks,
+                       max_chunk_bytes=args.max_chunk_bytes, split_workers=args.split_workers,
+                       save_options={"optimize": optimize} if optimize else None)
+    if args.command == "watermark":
+        options.update(text=args.text, image=args.image, watermark_pdf=args.watermark_pdf)
+    if args.command == "extract-images":
+        options["raw_streams"] = args.raw_streams
+    if args.command == "rotate":
+        options.update(angle=args.angle, pages=args.pages)
+    if args.command == "crop":
+        options.update(box=args.box, margin=args.margin, pages=args.pages)
+    if args.command in ("watermark", "rotate", "crop"):
+        if args.incremental and (args.linearize or args.optimize):
+            print(f"--incremental and --{'linearize' if args.linearize else 'optimize'} cannot be combined.", file=sys.stderr)
+            return 1
+        options.update(in_place=args.in_place, save_options={
+            "incremental": args.incremental, "linearize": args.linearize, "optimize": optimize,
+            "object_streams": args.object_streams or ("generate" if optimize else "preserve")})
+    if args.command == "optimize":
+        options.update(in_place=args.in_place, max_image_dpi=args.max_image_dpi, jpeg_quality=args.jpeg_quality,
+                       image_workers=args.image_workers, dry_run=args.dry_run,
+                       save_options={"object_streams": args.object_streams, "linearize": args.linearize})
+
+    # Print each result as soon as its document is done
+    failures = 0
+    for result in run_batch(args.command, filenames, options, args.workers):
+        failures += not result["ok"]
+        print(json.dumps(result), flush=True)
+
+    return 1 if failures else 0
+    ## End main() function ##
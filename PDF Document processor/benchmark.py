@@ -0,0 +1,392 @@
+"""
+    This module benchmarks the PDF manager operations on synthetic documents.
+    The documents are generated with reportlab for a configurable page count, text density,
+    image count and image size. Every operation is timed, and its throughput and peak memory
+    are written to a JSON file, so that runs can be compared to find regressions.
+    The startup of the command line (python -X importtime) is measured too, against a budget.
+
+    Usage: python benchmark.py --pages 10 100 1000 --images-per-page 2 --output bench.json
+           python benchmark.py --pages 100 --compare bench.json
+           python benchmark.py --pages 10 --startup-budget 200
+"""
+# Necessary modules
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+import pikepdf
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from lazy_modules import preload_modules
+from pdf_manager import PDF_manager, peak_rss_bytes
+
+# Operations measured, in order
+operations = [
+    "read",
+    "metadata",
+    "split",
+    "merge",
+    "rotate",
+    "rotate_incremental",
+    "crop",
+    "encrypt",
+    "decrypt",
+    "extract_images",
+    "watermark",
+    "watermark_incremental",
+    "metadata_incremental",
+    "optimize",
+    "chain",
+    "pipeline",
+]
+
+
+# Generate a synthetic pdf document
+def generate_synthetic_pdf(path: str, pages: int = 10, lines_per_page: int = 40, images_per_page: int = 0,
+                           image_size: int = 256, distinct_images: int = 4, seed: int = 0) -> str:
+    """
+    Generates a PDF document with text and images.
+
+    Args:
+        path (str): Path of the PDF file to create.
+        pages (int): Number of pages. Defaults to 10.
+        lines_per_page (int): Lines of text on each page. Defaults to 40.
+        images_per_page (int): Images drawn on each page. Defaults to 0.
+        image_size (int): Width and height of the images, in pixels. Defaults to 256.
+        distinct_images (int): Number of different images, reused across pages as logos would be.
+            Defaults to 4.
+        seed (int): Seed of the random text and pixels. Defaults to 0.
+
+    Returns:
+        str: The path of the PDF file.
+    """
+    generator = random.Random(seed)
+    words = ["contract", "invoice", "amount", "party", "clause", "payment", "term", "delivery", "annex", "total"]
+
+    # Text pages with reportlab
+    can = canvas.Canvas(path, pagesize=letter)
+    for page_number in range(1, pages + 1):
+        can.setFont("Helvetica", 9)
+        for line in range(lines_per_page):
+            text = " ".join(generator.choice(words) for _ in range(12))
+            can.drawString(40, 760 - line * (720 / max(lines_per_page, 1)), f"{page_number}.{line} {text}")
+        can.showPage()
+    can.save()
+
+    if not images_per_page:
+        return path
+
+    # Images are added with pikepdf, as Flate compressed RGB pixels
+    with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+        images = []
+        for _ in range(distinct_images):
+            pixels = generator.randbytes(image_size * image_size * 3)
+            images.append(pikepdf.Stream(pdf, zlib.compress(pixels), Type=pikepdf.Name.XObject,
+                                         Subtype=pikepdf.Name.Image, Width=image_size, Height=image_size,
+                                         ColorSpace=pikepdf.Name.DeviceRGB, BitsPerComponent=8,
+                                         Filter=pikepdf.Name.FlateDecode))
+
+        for page_index, page in enumerate(pdf.pages):
+            resources = page.obj.Resources
+            if "/XObject" not in resources:
+                resources.XObject = pikepdf.Dictionary()
+            drawing = []
+            for image_index in range(images_per_page):
+                name = f"/Im{image_index}"
+                resources.XObject[name] = images[(page_index + image_index) % distinct_images]
+                drawing.append(f"q 120 0 0 120 {40 + 130 * (image_index % 4)} {40 + 130 * (image_index // 4)} cm {name} Do Q")
+            page.contents_add(pikepdf.Stream(pdf, "\n".join(drawing).encode()), prepend=False)
+        pdf.save(path)
+
+    return path
+    ## End generate_synthetic_pdf() function ##
+
+
+# Time one call, with its peak memory
+def measure(function: Callable, repeat: int = 1) -> dict:
+    """
+    Runs a function and measures it.
+
+    The timed runs are not traced; the peak memory is measured in one more run under tracemalloc,
+    which would slow the timed runs down.
+
+    Args:
+        function (Callable): The function to run, without arguments.
+        repeat (int): Number of timed runs; the wall time reported is their median. Defaults to 1.
+
+    Returns:
+        dict: The keys "wall_seconds", "runs", "peak_python_bytes" (Python allocation peak of the
+            traced run, from tracemalloc) and "peak_rss_bytes" (peak resident memory of the
+            process so far, None where unavailable).
+    """
+    wall_times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        wall_times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak_python_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_seconds": statistics.median(wall_times),
+        "runs": wall_times,
+        "peak_python_bytes": peak_python_bytes,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+# Import time of a module in a fresh interpreter, by imported package
+def measure_startup(module: str = "main", repeat: int = 5) -> dict:
+    """
+    Imports a module in new interpreters with python -X importtime, as the command line does.
+
+    Args:
+        module (str): Module imported, from the directory of the benchmark. Defaults to "main".
+        repeat (int): Number of interpreters started; the times reported are their medians. Defaults to 5.
+
+    Returns:
+        dict: The keys "module", "import_seconds" (cumulative import time of the module),
+            "interpreter_seconds" (wall time of an interpreter doing nothing), "wall_seconds"
+            (wall time of an interpreter importing the module) and "heaviest" (the ten slowest
+            modules it imports directly, as [name, seconds] pairs).
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Wall time of an interpreter running a statement
+    def run(statement: str, import_time: bool = False) -> tuple:
+        start_time = time.perf_counter()
+        completed = subprocess.run([sys.executable, *(["-X", "importtime"] if import_time else []), "-c", statement],
+                                   cwd=script_dir, capture_output=True, text=True, check=True)
+        return time.perf_counter() - start_time, completed.stderr
+
+    import_times, interpreter_times, wall_times, children = [], [], [], {}
+    for _ in range(repeat):
+        interpreter_times.append(run("pass")[0])
+        wall_seconds, report = run(f"import {module}", import_time=True)
+        wall_times.append(wall_seconds)
+        imported = []  # Direct imports of the next top-level module, which is reported after them
+        for line in report.splitlines():
+            # "import time: self [us] | cumulative | imported package", nested imports indented by two spaces
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if not cumulative.strip().isdigit():
+                continue
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 1:
+                imported.append((name.strip(), int(cumulative) / 1e6))
+            elif depth == 0:
+                if name.strip() == module:
+                    import_times.append(int(cumulative) / 1e6)
+                    for child, seconds in imported:
+                        children.setdefault(child, []).append(seconds)
+                imported = []
+
+    heaviest = sorted(((name, statistics.median(times)) for name, times in children.items()),
+                      key=lambda child: child[1], reverse=True)[:10]
+    return {
+        "module": module,
+        "import_seconds": statistics.median(import_times),
+        "interpreter_seconds": statistics.median(interpreter_times),
+        "wall_seconds": statistics.median(wall_times),
+        "heaviest": [list(child) for child in heaviest],
+    }
+    ## End measure_startup() function ##
+
+
+# Chain operations by calling them in turn, each parsing and writing the whole document
+def chain_operations(manager: PDF_manager, encrypted_path: str, password: str, work_dir: str) -> None:
+    decrypted_path = os.path.join(work_dir, "chain_decrypted.pdf")
+    rotated_path = os.path.join(work_dir, "chain_rotated.pdf")
+    watermarked_path = os.path.join(work_dir, "chain_watermarked.pdf")
+    manager.decrypt_pdf_aes256(encrypted_path, password, decrypted_path)
+    manager.rotate_pdf(decrypted_path, rotated_path, 90)
+    manager.add_watermark(rotated_path, watermarked_path, "BENCHMARK")
+    manager.encrypt_pdf_aes256(watermarked_path, password, os.path.join(work_dir, "chain.pdf"))
+
+
+# Benchmark every operation on one document
+def benchmark_document(manager: PDF_manager, path: str, pages: int, work_dir: str, repeat: int = 1,
+                       selected_operations: Optional[List[str]] = None) -> list:
+    """
+    Benchmarks the PDF manager operations on a document.
+
+    Args:
+        manager (PDF_manager): The manager to benchmark.
+        path (str): Path of the PDF document.
+        pages (int): Number of pages of the document.
+        work_dir (str): Directory of the output files.
+        repeat (int): Runs of each operation. Defaults to 1.
+        selected_operations (Optional[List[str]]): Operations to run. Defaults to all of them.
+
+    Returns:
+        list: A result per operation with the keys "operation", "pages", "pages_per_second",
+            "bytes_written" (output bytes of a run, as counted by the instrumentation) and those
+            returned by measure().
+    """
+    password = "benchmark"
+    incremental = {"incremental": True}  # Append the changes to a copy of the document instead of rewriting it
+    encrypted_path = os.path.join(work_dir, "encrypted.pdf")
+    runs = {
+        "read": (lambda: manager.read_pdf_document(path), pages),
+        "metadata": (lambda: manager.display_pdf_metadata(path), pages),
+        "split": (lambda: manager.splitting_pdf_document(path, os.path.join(work_dir, "split")), pages),
+        "merge": (lambda: manager.merge_pdf_documents([path, path], os.path.join(work_dir, "merged.pdf")), 2 * pages),
+        "rotate": (lambda: manager.rotate_pdf(path, os.path.join(work_dir, "rotated.pdf"), 90), pages),
+        "rotate_incremental": (lambda: manager.rotate_pdf(path, os.path.join(work_dir, "rotated_incremental.pdf"), 90,
+                                                          save_options=incremental), pages),
+        "crop": (lambda: manager.cropping_pdf_document(path, os.path.join(work_dir, "cropped.pdf")), pages),
+        "encrypt": (lambda: manager.encrypt_pdf_aes256(path, password, encrypted_path), pages),
+        "decrypt": (lambda: manager.decrypt_pdf_aes256(encrypted_path, password,
+                                                       os.path.join(work_dir, "decrypted.pdf")), pages),
+        "extract_images": (lambda: manager.extract_images_from_pdf(path, os.path.join(work_dir, "images")), pages),
+        "watermark": (lambda: manager.add_watermark(path, os.path.join(work_dir, "watermarked.pdf"), "BENCHMARK"), pages),
+        "watermark_incremental": (lambda: manager.add_watermark(path, os.path.join(work_dir, "watermarked_incremental.pdf"),
+                                                                "BENCHMARK", save_options=incremental), pages),
+        "metadata_incremental": (lambda: manager.set_pdf_metadata(path, os.path.join(work_dir, "metadata_incremental.pdf"),
+                                                                  {"title": "Benchmark"}, save_options=incremental), pages),
+        "optimize": (lambda: manager.optimize_pdf(path, os.path.join(work_dir, "optimized.pdf"), max_image_dpi=150), pages),
+        # Decrypt, rotate, watermark and encrypt again, one operation after the other then as a pipeline
+        "chain": (lambda: chain_operations(manager, encrypted_path, password, work_dir), pages),
+        "pipeline": (lambda: manager.pipeline(encrypted_path).decrypt(password).rotate(90).watermark("BENCHMARK")
+                     .encrypt(password).save(os.path.join(work_dir, "pipeline.pdf")), pages),
+    }
+
+    results = []
+    for operation in operations:
+        if selected_operations and operation not in selected_operations:
+            continue
+        # Decryption needs the output of the encryption
+        if operation in ("decrypt", "chain", "pipeline") and not os.path.isfile(encrypted_path):
+            manager.encrypt_pdf_aes256(path, password, encrypted_path)
+
+        function, pages_processed = runs[operation]
+        bytes_written = manager.instrumentation.counters.get("bytes_written", 0)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            result = measure(function, repeat)
+        result.update(operation=operation, pages=pages_processed,
+                      pages_per_second=pages_processed / max(result["wall_seconds"], 1e-9),
+                      # measure() runs the function once more to trace its memory
+                      bytes_written=(manager.instrumentation.counters.get("bytes_written", 0) - bytes_written)
+                      // (repeat + 1))
+        results.append(result)
+    return results
+    ## End benchmark_document() function ##
+
+
+# Compare a run with a previous one
+def compare_results(current: dict, previous: dict, threshold: float = 0.10) -> list:
+    """
+    Finds the operations that got slower than in a previous run.
+
+    Args:
+        current (dict): Results of this run.
+        previous (dict): Results of the previous run, as written by main().
+        threshold (float): Relative slowdown reported as a regression. Defaults to 0.10 (10%).
+
+    Returns:
+        list: (corpus name, operation, previous seconds, current seconds) tuples of the regressions.
+    """
+    previous_times = {(result["corpus"], result["operation"]): result["wall_seconds"]
+                      for result in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        previous_seconds = previous_times.get((result["corpus"], result["operation"]))
+        if previous_seconds and result["wall_seconds"] > previous_seconds * (1 + threshold):
+            regressions.append((result["corpus"], result["operation"], previous_seconds, result["wall_seconds"]))
+    return regressions
+
+
+# Entry point of the benchmark
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the PDF manager operations on synthetic documents.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100], help="page counts of the documents")
+    parser.add_argument("--lines-per-page", type=int, default=40, help="lines of text on each page")
+    parser.add_argument("--images-per-page", type=int, default=1, help="images drawn on each page")
+    parser.add_argument("--image-size", type=int, default=256, help="width and height of the images, in pixels")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each operation")
+    parser.add_argument("--operations", nargs="+", choices=operations, help="operations to run (default: all)")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file of the results")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    parser.add_argument("--startup-repeat", type=int, default=5, help="interpreters started to measure the startup")
+    parser.add_argument("--startup-budget", type=float, metavar="MS",
+                        help="import time of the command line allowed, in milliseconds (exceeding it fails the run)")
+    args = parser.parse_args(argv)
+
+    # Startup of the command line, before this process loads anything else
+    startup = measure_startup("main", args.startup_repeat)
+    print(f"{'startup':<28} {'import main':<22} {startup['import_seconds']:>9.3f} s "
+          f"(interpreter {startup['interpreter_seconds']:.3f} s, wall {startup['wall_seconds']:.3f} s)")
+    for name, seconds in startup["heaviest"][:5]:
+        print(f"{'':<28} {name:<22} {seconds:>9.3f} s")
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {"lines_per_page": args.lines_per_page, "images_per_page": args.images_per_page,
+                       "image_size": args.image_size, "repeat": args.repeat},
+        "startup": startup,
+        "results": [],
+    }
+    manager = PDF_manager()
+    # The libraries are imported now, so that the first operation using each is not charged for it
+    preload_modules()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for pages in args.pages:
+            # Generate the document of this size
+            corpus = f"{pages}p_{args.lines_per_page}l_{args.images_per_page}x{args.image_size}px"
+            path = generate_synthetic_pdf(os.path.join(work_dir, f"{corpus}.pdf"), pages, args.lines_per_page,
+                                          args.images_per_page, args.image_size)
+            document_dir = os.path.join(work_dir, corpus)
+            os.makedirs(document_dir)
+
+            for result in benchmark_document(manager, path, pages, document_dir, args.repeat, args.operations):
+                result.update(corpus=corpus, file_bytes=os.path.getsize(path))
+                report["results"].append(result)
+                print(f"{corpus:<28} {result['operation']:<22} {result['wall_seconds']:>9.3f} s "
+                      f"{result['pages_per_second']:>10.1f} pages/s {result['peak_python_bytes'] / 1e6:>9.1f} MB "
+                      f"{result['bytes_written'] / 1e6:>9.2f} MB written")
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results saved as {args.output}")
+
+    failed = False
+    if args.startup_budget is not None and startup["import_seconds"] * 1000 > args.startup_budget:
+        print(f"Startup over budget: {startup['import_seconds'] * 1000:.0f} ms > {args.startup_budget:.0f} ms")
+        failed = True
+
+    # Report the regressions against the previous run
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as previous_file:
+            regressions = compare_results(report, json.load(previous_file), args.threshold)
+        for corpus, operation, previous_seconds, current_seconds in regressions:
+            print(f"Regression: {corpus} {operation} {previous_seconds:.3f} s -> {current_seconds:.3f} s")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+# Running the benchmark
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+    This module keeps the results of pdf parsing on disk between runs.
+    Entries are keyed by a content hash of the pdf file, the operation and the page index,
+    so an unchanged file is never parsed twice, whatever its path or modification time.
+    The cache is bounded in size and evicts the least recently used entries first.
+"""
+# Necessary modules
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+# Size of the blocks read while hashing a file
+hash_block_size = 1024 * 1024
+
+
+# Content hash of a file
+def hash_file(filename: str) -> str:
+    """
+    Computes the SHA-256 of a file, reading it block by block.
+
+    Args:
+        filename (str): Path to the file.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(hash_block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# class to cache extraction results of pdf files
+class Extraction_cache:
+    def __init__(self, cache_dir: str = ".pdf_cache", max_bytes: int = 512 * 1024 * 1024):
+        """
+        Opens (or creates) an extraction cache.
+
+        The cache can be used from several threads: each thread gets its own connection to the
+        database, and several processes can share the same cache directory.
+
+        Args:
+            cache_dir (str): Directory holding the cache database. Defaults to ".pdf_cache".
+            max_bytes (int): Maximum total size of the cached values, in bytes. Defaults to 512 MiB.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._local = threading.local()  # Connection of each thread
+        self._connections = []  # Every connection opened, closed together
+        self._lock = threading.Lock()
+
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS file_hashes_hash ON file_hashes (hash)")
+        # Running total of the entry sizes, so that no put has to sum the whole table
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "INSERT OR IGNORE INTO totals (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+        )
+
+    # Connection of the calling thread, opened on first use
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit connection in WAL mode so that several processes can share the cache
+            connection = sqlite3.connect(os.path.join(self.cache_dir, "cache.sqlite3"),
+                                         isolation_level=None, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    # Content hash of a pdf file, remembered per path, size and modification time
+    def file_hash(self, filename: str) -> str:
+        """
+        Computes the SHA-256 of a file.
+
+        The hash of a path is remembered along with its size and modification time, so an
+        unchanged file is only read once. It is forgotten once the entries of the content are evicted.
+
+        Args:
+            filename (str): Path to the file.
+
+        Returns:
+            str: The hexadecimal SHA-256 digest of the file content.
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+
+        # Reuse the known hash when the file has not changed
+        row = self._connection.execute(
+            "SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        if row:
+            return row[0]
+
+        file_hash = hash_file(path)
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, file_hash),
+        )
+        return file_hash
+
+    # Content hash of a pdf document held in memory
+    @staticmethod
+    def buffer_hash(data) -> str:
+        """
+        Computes the SHA-256 of a document held in memory, matching file_hash() for the same content.
+
+        Args:
+            data: A bytes-like object (bytes, bytearray, memoryview, mmap).
+
+        Returns:
+            str: The hexadecimal SHA-256 digest of the content.
+        """
+        return hashlib.sha256(data).hexdigest()
+
+    # Build the key of an entry
+    @staticmethod
+    def _key(file_hash: str, operation: str, page_index: Optional[int]) -> str:
+        return f"{file_hash}:{operation}:{'' if page_index is None else page_index}"
+
+    # Look an entry up
+    def get(self, file_hash: str, operation: str, page_index: Optional[int] = None) -> Optional[Any]:
+        """
+        Returns a cached value, or None when it is not cached.
+
+        Args:
+            file_hash (str): Content hash of the pdf file, as returned by file_hash().
+            operation (str): Name of the operation that produced the value (e.g. "text", "metadata").
+            page_index (Optional[int]): Page the value belongs to, or None for a document-wide value.
+
+        Returns:
+            Optional[Any]: The cached value.
+        """
+        key = self._key(file_hash, operation, page_index)
+        row = self._connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        # Mark the entry as recently used
+        self._connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    # Store an entry
+    def put(self, file_hash: str, operation: str, value: Any, page_index: Optional[int] = None) -> None:
+        """
+        Stores a value in the cache, evicting the least recently used entries if needed.
+
+        Args:
+            file_hash (str): Content hash of the pdf file, as returned by file_hash().
+            operation (str): Name of the operation that produced the value (e.g. "text", "metadata").
+            value (Any): JSON serializable value to store.
+            page_index (Optional[int]): Page the value belongs to, or None for a document-wide value.
+        """
+        serialized = json.dumps(value)
+        key = self._key(file_hash, operation, page_index)
+
+        # The entry and the total change together, whatever the other processes do
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, serialized, len(serialized), time.time()),
+            )
+            connection.execute("UPDATE totals SET size = size + ? WHERE id = 0",
+                               (len(serialized) - (row[0] if row else 0),))
+            total_size = connection.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+            if total_size > self.max_bytes:
+                self._evict(total_size)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    # Drop the least recently used entries, and the file hashes of their contents, until the cache fits in max_bytes
+    def _evict(self, total_size: int) -> None:
+        # Walk the entries from the oldest access and remove them until enough space is freed
+        evicted_keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total_size <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        self._connection.executemany("DELETE FROM entries WHERE key = ?", evicted_keys)
+        self._connection.execute("UPDATE totals SET size = ? WHERE id = 0", (total_size,))
+
+        # A content without any entry left does not need its hash remembered
+        for file_hash in {key.split(":", 1)[0] for key, in evicted_keys}:
+            if self._connection.execute("SELECT 1 FROM entries WHERE key >= ? AND key < ? LIMIT 1",
+                                        (f"{file_hash}:", f"{file_hash};")).fetchone() is None:
+                self._connection.execute("DELETE FROM file_hashes WHERE hash = ?", (file_hash,))
+
+    # Remove every entry
+    def clear(self) -> None:
+        """Removes every cached value and remembered file hash."""
+        self._connection.execute("DELETE FROM entries")
+        self._connection.execute("DELETE FROM file_hashes")
+        self._connection.execute("UPDATE totals SET size = 0 WHERE id = 0")
+
+    # Close the cache database
+    def close(self) -> None:
+        """Closes the connections of every thread to the cache database."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+    ## End of Extraction_cache class
@@ -0,0 +1,189 @@
+"""
+    This module saves the edits of a pdf document as an incremental update.
+    Instead of rewriting the whole document, the objects that changed since it was opened are
+    appended to the original bytes, followed by a cross-reference section pointing back to the
+    previous one (/Prev), as PDF editors do when saving small changes to large files.
+    Changes are found by comparing each object with a fingerprint taken when the document was
+    opened; stream data is not compared, so edits must create new streams rather than rewrite
+    existing ones (as the PDF manager operations do).
+"""
+# Necessary modules
+from __future__ import annotations
+
+import re
+import zlib
+from io import BytesIO
+from typing import Optional
+
+from lazy_modules import lazy_import
+
+# Imported on first use
+pikepdf = lazy_import("pikepdf")
+
+# Bytes at the end of a document searched for its startxref keyword
+tail_size = 4096
+# Unfiltered streams longer than this are compressed in the update
+min_compressed_size = 64
+
+
+# Fingerprint of an object, without its stream data
+def _fingerprint(obj) -> bytes:
+    if isinstance(obj, pikepdf.Stream):
+        return obj.stream_dict.unparse(resolved=True)
+    return obj.unparse(resolved=True)
+
+
+# State of the objects of a document just opened
+def object_fingerprints(pdf: pikepdf.Pdf) -> dict:
+    """
+    Records the state of every object of a document, before it is edited.
+
+    Args:
+        pdf (pikepdf.Pdf): The document, as opened.
+
+    Returns:
+        dict: Object (number, generation) to its fingerprint.
+    """
+    # Indirect scalars (e.g. a /Length) come back as Python values, and are never edited
+    return {obj.objgen: _fingerprint(obj) for obj in pdf.objects if isinstance(obj, pikepdf.Object)}
+
+
+# Objects created or modified since the fingerprints were taken
+def changed_objects(pdf: pikepdf.Pdf, fingerprints: dict) -> list:
+    """
+    Lists the objects of a document that differ from their fingerprints.
+
+    Args:
+        pdf (pikepdf.Pdf): The edited document.
+        fingerprints (dict): Fingerprints taken by object_fingerprints() when it was opened.
+
+    Returns:
+        list: The new and modified objects, by object number.
+    """
+    changed = []
+    for obj in pdf.objects:
+        if not isinstance(obj, pikepdf.Object):
+            continue
+        fingerprint = fingerprints.get(obj.objgen)
+        if fingerprint is None:
+            # Objects created and never filled are not worth writing
+            if not isinstance(obj, pikepdf.Stream) and obj.unparse() == b"null":
+                continue
+            changed.append(obj)
+        elif _fingerprint(obj) != fingerprint:
+            changed.append(obj)
+    return sorted(changed, key=lambda obj: obj.objgen)
+
+
+# Offset of the last cross-reference section of a document
+def find_startxref(tail: bytes) -> int:
+    """
+    Finds the offset given by the last startxref keyword of a document.
+
+    Args:
+        tail (bytes): The last bytes of the document (at least the trailer).
+
+    Returns:
+        int: The offset of the last cross-reference section.
+    """
+    offsets = re.findall(rb"startxref\s+(\d+)\s+%%EOF", tail)
+    if not offsets:
+        raise ValueError("The document has no startxref keyword to update.")
+    return int(offsets[-1])
+
+
+# Serialization of an indirect object
+def _object_bytes(obj) -> bytes:
+    number, generation = obj.objgen
+    if isinstance(obj, pikepdf.Stream):
+        data = obj.read_raw_bytes()
+        stream_dict = pikepdf.Dictionary(obj.stream_dict)
+        # Streams created by the edits are not compressed yet, as a full save would do
+        if "/Filter" not in stream_dict and len(data) > min_compressed_size:
+            data = zlib.compress(data)
+            stream_dict.Filter = pikepdf.Name.FlateDecode
+        stream_dict.Length = len(data)
+        body = stream_dict.unparse(resolved=True) + b"\nstream\n" + data + b"\nendstream"
+    else:
+        body = obj.unparse(resolved=True)
+    return b"%d %d obj\n" % (number, generation) + body + b"\nendobj\n"
+
+
+# Runs of consecutive object numbers, as the subsections of a cross-reference section
+def _subsections(numbers: list) -> list:
+    runs = []
+    for number in numbers:
+        if runs and number == runs[-1][0] + runs[-1][1]:
+            runs[-1][1] += 1
+        else:
+            runs.append([number, 1])
+    return runs
+
+
+# Serialize the incremental update of an edited document
+def build_update(pdf: pikepdf.Pdf, fingerprints: dict, original_size: int, previous_xref: int,
+                 xref_stream: bool = False, separator: bytes = b"") -> Optional[bytes]:
+    """
+    Serializes the changed objects and their cross-reference section.
+
+    Args:
+        pdf (pikepdf.Pdf): The edited document, not encrypted.
+        fingerprints (dict): Fingerprints taken by object_fingerprints() when it was opened.
+        original_size (int): Size of the original document, in bytes; the update is appended to it.
+        previous_xref (int): Offset of the last cross-reference section of the original (see find_startxref()).
+        xref_stream (bool): Write a cross-reference stream (PDF 1.5) instead of a table, as the
+            original does. Defaults to False.
+        separator (bytes): Bytes written before the update, e.g. a newline when the original does not
+            end with one. Defaults to b"".
+
+    Returns:
+        Optional[bytes]: The update (separator included), or None when nothing changed.
+    """
+    if pdf.is_encrypted:
+        raise ValueError("Encrypted documents cannot be updated incrementally.")
+    objects = changed_objects(pdf, fingerprints)
+    if not objects:
+        return None
+
+    # The objects, remembering where each one starts
+    update = BytesIO()
+    update.write(separator)
+    offsets = {}
+    for obj in objects:
+        offsets[obj.objgen[0]] = (original_size + update.tell(), obj.objgen[1])
+        update.write(_object_bytes(obj))
+
+    # The trailer keeps the catalog, information and identifiers, and points to the previous section
+    size = max(int(pdf.trailer.get("/Size", 0)), max(offsets) + 1, max(number for number, _ in fingerprints) + 1)
+    trailer = pikepdf.Dictionary(Root=pdf.trailer.Root, Prev=previous_xref)
+    for key in ("/Info", "/ID"):
+        if key in pdf.trailer:
+            trailer[key] = pdf.trailer[key]
+
+    xref_offset = original_size + update.tell()
+    if xref_stream:
+        # The cross-reference stream lists itself too, with the widest offset it needs
+        offsets[size] = (xref_offset, 0)
+        numbers = sorted(offsets)
+        offset_width = max(4, (xref_offset.bit_length() + 7) // 8)
+        rows = b"".join(b"\x01" + offsets[number][0].to_bytes(offset_width, "big")
+                        + offsets[number][1].to_bytes(2, "big") for number in numbers)
+        data = zlib.compress(rows)
+        trailer.update({"/Type": pikepdf.Name.XRef, "/Size": size + 1, "/W": [1, offset_width, 2],
+                        "/Index": [value for run in _subsections(numbers) for value in run],
+                        "/Filter": pikepdf.Name.FlateDecode, "/Length": len(data)})
+        update.write(b"%d 0 obj\n" % size + trailer.unparse(resolved=True) + b"\nstream\n" + data
+                     + b"\nendstream\nendobj\n")
+    else:
+        trailer.Size = size
+        numbers = sorted(offsets)
+        # The head of the free list comes first, as readers expect sections to start at object 0
+        update.write(b"xref\n0 1\n0000000000 65535 f\r\n")
+        for first_number, count in _subsections(numbers):
+            update.write(b"%d %d\n" % (first_number, count))
+            for number in range(first_number, first_number + count):
+                update.write(b"%010d %05d n\r\n" % offsets[number])
+        update.write(b"trailer\n" + trailer.unparse(resolved=True) + b"\n")
+    update.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+    return update.getvalue()
+    ## End build_update() function ##
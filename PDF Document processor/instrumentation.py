@@ -0,0 +1,216 @@
+"""
+    This module instruments the PDF manager operations.
+    Operations report structured events to hooks instead of printing: messages, timing spans
+    per operation, phase and page, and counters (pages, bytes read and written, images, cache hits).
+    Operations can also be profiled with cProfile and tracemalloc.
+    A hook is any callable taking the event dictionary; console_hook prints the messages as before.
+"""
+# Necessary modules
+import functools
+import io
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from lazy_modules import lazy_import
+
+# Profilers, imported only when an operation is profiled
+cProfile = lazy_import("cProfile")
+pstats = lazy_import("pstats")
+
+
+# Print the message of an event, as the PDF manager did before instrumentation
+def console_hook(event: dict) -> None:
+    if event["type"] == "event" and event.get("message") is not None:
+        print(event["message"])
+
+
+# class to collect and dispatch instrumentation events
+class Instrumentation:
+    def __init__(self, hooks: Optional[List[Callable]] = None, profile: bool = False, trace_memory: bool = False):
+        """
+        Creates an instrumentation surface.
+
+        Args:
+            hooks (Optional[List[Callable]]): Callables receiving each event dictionary.
+                Defaults to [console_hook].
+            profile (bool): Profile every operation with cProfile. Defaults to False.
+            trace_memory (bool): Record the peak Python memory of every operation with tracemalloc.
+                Defaults to False.
+
+        Every event dictionary has the keys "type" ("event", "span", "counter" or "profile"),
+        "name", "timestamp" and "fields", plus:
+            - "level" and "message" for events,
+            - "duration_seconds" and "parent" (enclosing span name or None) for spans,
+            - "value" and "total" for counters,
+            - "stats" (pstats.Stats) and "report" (text of the top functions) for profiles.
+        Without hooks no event is built, while the counters and totals are still kept.
+        """
+        self.hooks = list(hooks) if hooks is not None else [console_hook]
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.counters = {}  # Counter name to total
+        self.span_totals = {}  # Span name to [count, total seconds]
+        self.profiles = {}  # Operation name to the pstats.Stats of its last run
+        self.memory_peaks = {}  # Operation name to its largest peak Python memory, in bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # Register a hook
+    def add_hook(self, hook: Callable) -> None:
+        """Adds a callable receiving every event dictionary."""
+        self.hooks.append(hook)
+
+    # Dispatch an event to the hooks (callers skip building the event when there is no hook)
+    def _emit(self, event: dict) -> None:
+        event.setdefault("timestamp", time.time())
+        for hook in self.hooks:
+            hook(event)
+
+    # Report something that happened
+    def event(self, name: str, message: Optional[str] = None, level: str = "info", **fields) -> None:
+        """
+        Emits an event.
+
+        Args:
+            name (str): Dotted event name, e.g. "split.done".
+            message (Optional[str]): Human readable message.
+            level (str): "debug", "info", "warning" or "error". Defaults to "info".
+            **fields: Structured values of the event.
+        """
+        if self.hooks:
+            self._emit({"type": "event", "name": name, "level": level, "message": message, "fields": fields})
+
+    # Add to a counter
+    def count(self, name: str, value: int = 1, **fields) -> None:
+        """
+        Adds a value to a counter and emits it.
+
+        Args:
+            name (str): Counter name, e.g. "pages", "bytes_written", "cache_hits".
+            value (int): Amount to add. Defaults to 1.
+            **fields: Structured values of the counter event.
+        """
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+        if self.hooks:
+            self._emit({"type": "counter", "name": name, "value": value, "total": total, "fields": fields})
+
+    # Time a block of work
+    @contextmanager
+    def span(self, name: str, **fields) -> Iterator[dict]:
+        """
+        Times a block and emits a span when it ends.
+
+        Args:
+            name (str): Span name, e.g. "split.write" or "read.page".
+            **fields: Structured values of the span. The block may add more to the yielded dictionary.
+
+        Yields:
+            dict: The fields of the span.
+        """
+        stack = self._local.__dict__.setdefault("spans", [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start_time = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            duration = time.perf_counter() - start_time
+            stack.pop()
+            with self._lock:
+                totals = self.span_totals.setdefault(name, [0, 0.0])
+                totals[0] += 1
+                totals[1] += duration
+            if self.hooks:
+                self._emit({"type": "span", "name": name, "duration_seconds": duration, "parent": parent,
+                            "fields": fields})
+
+    # Time a whole operation, with the optional profiling
+    @contextmanager
+    def operation(self, name: str, **fields) -> Iterator[dict]:
+        """
+        Times an operation like span(), profiling it when profile or trace_memory is set.
+
+        The peak Python memory is added to the span fields as "peak_python_bytes", and the
+        profile is stored in profiles[name] and emitted as a "profile" event.
+
+        Args:
+            name (str): Operation name, e.g. "split".
+            **fields: Structured values of the span.
+
+        Yields:
+            dict: The fields of the span.
+        """
+        # Nested operations are covered by the profile of the outer one
+        nested = getattr(self._local, "operations", 0)
+        profiler = cProfile.Profile() if self.profile and not nested else None
+        tracing = self.trace_memory and not nested and not tracemalloc.is_tracing()
+
+        self._local.operations = nested + 1
+        with self.span(name, **fields) as span_fields:
+            if tracing:
+                tracemalloc.start()
+            if profiler:
+                profiler.enable()
+            try:
+                yield span_fields
+            finally:
+                if profiler:
+                    profiler.disable()
+                if tracing:
+                    peak = span_fields["peak_python_bytes"] = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    with self._lock:
+                        self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak)
+                self._local.operations = nested
+
+        if profiler:
+            report = io.StringIO()
+            stats = pstats.Stats(profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(20)
+            self.profiles[name] = stats
+            if self.hooks:
+                self._emit({"type": "profile", "name": name, "stats": stats, "report": report.getvalue(),
+                            "fields": fields})
+
+    # Totals collected so far
+    def summary(self) -> dict:
+        """
+        Returns the totals collected so far.
+
+        Returns:
+            dict: The keys "counters" (name to total), "spans" (name to "count" and "total_seconds")
+                and "peak_python_bytes" (operation name to its largest peak, when memory is traced).
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "spans": {name: {"count": count, "total_seconds": seconds}
+                          for name, (count, seconds) in self.span_totals.items()},
+                "peak_python_bytes": dict(self.memory_peaks),
+            }
+    ## End of Instrumentation class
+
+
+# Run a PDF manager method as an instrumented operation
+def instrumented(name: str) -> Callable:
+    """
+    Decorates a method of an object with an "instrumentation" attribute so that each call
+    is timed (and profiled, if enabled) as the operation name.
+
+    Args:
+        name (str): Operation name, e.g. "split".
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.operation(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,256 @@
+"""
+    This module records the progress of long batch jobs, so that a restarted job resumes where it stopped.
+    The journal is a JSON Lines file, each record written with a single append and synced to disk:
+    completed documents with their result, completed parts of a document (page ranges of a split,
+    images of an extraction) with their output file, and quarantined inputs. Worker processes append
+    to the same journal. Inputs are identified by their path, size and modification time, and a
+    recorded output is trusted only while it exists with its recorded size.
+    Outputs are written atomically, through a temporary file renamed over the final path, so an
+    interrupted job never leaves a truncated output behind.
+"""
+# Necessary modules
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Options not affecting the outputs of a command, left out of its options key
+runtime_options = {"workers", "split_workers", "image_workers", "metrics", "profile", "cache_dir", "journal",
+                   "quarantine_dir", "password"}
+
+
+# Identity of an input file
+def input_fingerprint(filename: str) -> list:
+    """
+    Identifies the content of a file without reading it.
+
+    Args:
+        filename (str): Path to the file.
+
+    Returns:
+        list: Its size and modification time in nanoseconds.
+    """
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# Key of the options of a command
+def options_key(options: dict) -> str:
+    """
+    Digests the options affecting the outputs of a command (passwords and runtime options excluded).
+
+    Args:
+        options (dict): Command options.
+
+    Returns:
+        str: A short hexadecimal digest.
+    """
+    kept = {key: value for key, value in options.items() if key not in runtime_options}
+    return hashlib.sha256(json.dumps(kept, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+# Temporary path renamed over the final path once written
+@contextmanager
+def atomic_path(path) -> Iterator[str]:
+    """
+    Yields a temporary path next to the final one; once the body completes, the temporary file
+    replaces the final path at once. On errors, the temporary file is removed.
+
+    Args:
+        path: The final path. Its directory must exist.
+
+    Yields:
+        str: The temporary path to write to.
+    """
+    directory, name = os.path.split(os.fspath(path))
+    # Created by the writer, with the usual permissions
+    temporary = os.path.join(directory, f".{name}.{os.getpid()}.{os.urandom(4).hex()}.tmp")
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+# File written atomically
+@contextmanager
+def atomic_output(path, mode: str = "wb", **kwargs):
+    """
+    Opens a file written atomically (see atomic_path()).
+
+    Args:
+        path: The final path.
+        mode (str): Writing mode of open(). Defaults to "wb".
+        **kwargs: Other arguments of open(), e.g. encoding.
+
+    Yields:
+        The open file.
+    """
+    with atomic_path(path) as temporary, open(temporary, mode, **kwargs) as file:
+        yield file
+
+
+# class to journal the progress of batch jobs
+class Job_journal:
+    def __init__(self, path: str):
+        """
+        Opens a job journal, created on the first record.
+
+        The journal can be passed to worker processes: each one opens its own descriptor and
+        reads the records again.
+
+        Args:
+            path (str): Path of the JSON Lines journal file.
+        """
+        self.path = os.path.abspath(path)
+        self._fd = None  # Append descriptor, per process
+        self._pid = None
+        self._records = None  # Indexes of the records read, per process
+
+    # Only the path crosses process boundaries
+    def __getstate__(self) -> dict:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["path"])
+
+    # Append a record, synced to disk before returning
+    def _append(self, record: dict) -> None:
+        if self._fd is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        record["time"] = time.time()
+        # A single write per line, so that lines appended by several processes do not interleave
+        os.write(self._fd, (json.dumps(record) + "\n").encode("utf-8"))
+        os.fsync(self._fd)
+        if self._records is not None:
+            self._index(record)
+
+    # Index a record read or written
+    def _index(self, record: dict) -> None:
+        key = (record.get("command"), record.get("input"))
+        match record.get("type"):
+            case "done" | "failed" | "quarantined":
+                self._records["documents"][key] = record
+            case "part":
+                parts = self._records["parts"].setdefault(key, {})
+                parts[record["part"]] = record
+
+    # Records of the journal, read on first use
+    def _load(self) -> dict:
+        if self._records is None:
+            self._records = {"documents": {}, "parts": {}}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as journal_file:
+                    for line in journal_file:
+                        try:
+                            self._index(json.loads(line))
+                        except ValueError:
+                            # The last line of a job killed while writing it
+                            continue
+        return self._records
+
+    # Completed document
+    def completed(self, command: str, filename: str, key: str = "") -> Optional[dict]:
+        """
+        Finds the result of a document done by an earlier run, with the same input and options.
+
+        Args:
+            command (str): The command.
+            filename (str): Path of the input document.
+            key (str): Options key of the command (see options_key()).
+
+        Returns:
+            Optional[dict]: The recorded result, or None when the document must be processed
+                (never done, changed since, done with other options, or an output is missing).
+        """
+        record = self._load()["documents"].get((command, os.path.abspath(filename)))
+        if record is None or record["type"] != "done" or record.get("options") != key:
+            return None
+        if not os.path.isfile(filename) or record["fingerprint"] != input_fingerprint(filename):
+            return None
+        if not all(os.path.exists(output) for output in record["result"].get("outputs") or []
+                   if isinstance(output, str)):
+            return None
+        return record["result"]
+
+    # Record a processed document
+    def record_document(self, command: str, filename: str, result: dict, key: str = "") -> None:
+        """
+        Records the result of a document: "done" when it succeeded, "failed" otherwise.
+
+        Args:
+            command (str): The command.
+            filename (str): Path of the input document.
+            result (dict): The result of the command (JSON serializable).
+            key (str): Options key of the command (see options_key()).
+        """
+        self._append({"type": "done" if result.get("ok") else "failed", "command": command,
+                      "input": os.path.abspath(filename),
+                      "fingerprint": input_fingerprint(filename) if os.path.isfile(filename) else None,
+                      "options": key, "result": result})
+
+    # Record a quarantined input
+    def record_quarantine(self, command: str, filename: str, destination: str, error: Optional[str]) -> None:
+        """
+        Records an input moved away because it could not be read.
+
+        Args:
+            command (str): The command that failed on it.
+            filename (str): Original path of the input.
+            destination (str): Path it was moved to.
+            error (Optional[str]): Why it could not be read.
+        """
+        self._append({"type": "quarantined", "command": command, "input": os.path.abspath(filename),
+                      "destination": destination, "error": error})
+
+    # Completed parts of a document
+    def completed_parts(self, command: str, filename: str, key: str = "") -> dict:
+        """
+        Lists the parts of a document written by earlier runs, with the same options, whose outputs are intact.
+
+        Args:
+            command (str): The command.
+            filename (str): Path of the input document.
+            key (str): Options key of the parts (see options_key()).
+
+        Returns:
+            dict: Part name to its record (with the keys "output" and "size").
+        """
+        if not os.path.isfile(filename):
+            return {}
+        fingerprint = input_fingerprint(filename)
+        parts = self._load()["parts"].get((command, os.path.abspath(filename)), {})
+        return {part: record for part, record in parts.items()
+                if record["fingerprint"] == fingerprint and record.get("options", "") == key
+                and os.path.isfile(record["output"])
+                and os.path.getsize(record["output"]) == record["size"]}
+
+    # Record a completed part of a document
+    def record_part(self, command: str, filename: str, part: str, output: str, size: int, key: str = "") -> None:
+        """
+        Records a part of a document whose output is written.
+
+        Args:
+            command (str): The command.
+            filename (str): Path of the input document.
+            part (str): Name of the part, e.g. "pages 1-10".
+            output (str): Path of its output file.
+            size (int): Size of the output file, in bytes.
+            key (str): Options key of the part (see options_key()).
+        """
+        self._append({"type": "part", "command": command, "input": os.path.abspath(filename),
+                      "fingerprint": input_fingerprint(filename), "options": key, "part": part,
+                      "output": os.path.abspath(output), "size": size})
+
+    # Close the descriptor of this process
+    def close(self) -> None:
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._fd = None
+    ## End of Job_journal class ##
@@ -0,0 +1,509 @@
+"""
+    This module serves the PDF manager operations over a local HTTP API.
+    A single long-lived asyncio process accepts the jobs, so the PDF libraries are imported once,
+    and runs them on a pool of warm worker processes. Uploads and results are streamed to and
+    from spool files; jobs wait in a bounded queue, and a full queue is answered with 503.
+
+    Endpoints:
+        POST   /uploads[?filename=name.pdf]   Upload a document (raw body), returns its upload id.
+        DELETE /uploads/<upload id>           Remove an upload.
+        POST   /jobs                          Queue a job: {"command": ..., "inputs": [upload ids], "options": {...}}.
+        GET    /jobs/<job id>                 Status and results of a job.
+        GET    /jobs/<job id>/result          Output of a job (a PDF or text file, or a zip of several outputs).
+        DELETE /jobs/<job id>                 Remove a finished job and its outputs.
+        GET    /status                        Queue and worker usage.
+
+    Usage: python job_server.py --port 8765 --workers 4
+"""
+# Necessary modules
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from typing import AsyncIterator, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import batch
+from instrumentation import Instrumentation
+from lazy_modules import preload_modules
+
+# Commands accepted by the server
+job_commands = batch.document_commands + ["merge"]
+
+# Options a job may set, per command (the others are set by the server).
+# Every job runs in a single worker process, so the worker counts of split and optimize are not among them.
+job_options = {
+    "split": ["pages", "chunk_size", "by_bookmarks", "max_chunk_bytes", "save_options"],
+    "merge": ["engine", "deduplicate", "max_open_readers", "save_options"],
+    "encrypt": ["password"],
+    "decrypt": ["password"],
+    "watermark": ["text", "image", "watermark_pdf", "save_options"],
+    "rotate": ["angle", "pages", "save_options"],
+    "crop": ["box", "margin", "pages", "save_options"],
+    "extract-images": ["raw_streams"],
+    "optimize": ["max_image_dpi", "jpeg_quality", "dry_run", "save_options"],
+}
+
+# Watermark options naming an upload instead of a value
+upload_options = ["image", "watermark_pdf"]
+
+# Content types of the results
+content_types = {
+    ".pdf": "application/pdf",
+    ".txt": "text/plain; charset=utf-8",
+    ".zip": "application/zip",
+}
+
+
+# Run a job (runs in a worker process)
+def run_job(command: str, filenames: List[str], options: dict) -> dict:
+    """
+    Runs a command over the input documents of a job.
+
+    Args:
+        command (str): One of job_commands.
+        filenames (List[str]): Paths of the input documents.
+        options (dict): Command options, see batch.run_operation() and batch.run_merge().
+            "output_dir" is the directory of the job.
+
+    Returns:
+        dict: The keys "ok", "results" (the result of each document, or of the merge) and
+            "result_path" (the single output file, a zip of several outputs, or None).
+    """
+    output_dir = options["output_dir"]
+    if command == "merge":
+        results = [batch.run_merge(filenames, os.path.join(output_dir, "merged.pdf"), options)]
+    else:
+        results = [batch.run_operation(command, filename, options) for filename in filenames]
+
+    # A single output file is served as-is, several outputs as a zip archive
+    outputs = [output for result in results for output in result["outputs"] if os.path.exists(output)]
+    result_path = None
+    if len(outputs) == 1 and os.path.isfile(outputs[0]):
+        result_path = outputs[0]
+    elif outputs:
+        result_path = os.path.join(output_dir, "result.zip")
+        with zipfile.ZipFile(result_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for output in outputs:
+                if os.path.isdir(output):
+                    for directory, _, names in os.walk(output):
+                        for name in sorted(names):
+                            path = os.path.join(directory, name)
+                            archive.write(path, os.path.relpath(path, output_dir))
+                else:
+                    archive.write(output, os.path.relpath(output, output_dir))
+
+    return {"ok": all(result["ok"] for result in results), "results": results, "result_path": result_path}
+    ## End run_job() function ##
+
+
+# Error answered to a request
+class HTTP_error(Exception):
+    def __init__(self, status: HTTPStatus, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# class to serve the PDF manager operations over HTTP
+class Job_server:
+    # Size of the blocks streamed to and from the spool files
+    chunk_size = 1024 * 1024
+    # Largest request head and JSON body accepted, in bytes
+    max_head_bytes = 64 * 1024
+    max_json_bytes = 1024 * 1024
+    # Seconds a client has to send the head of its request
+    head_timeout = 30
+
+    def __init__(self, work_dir: str = "./job_server_data", workers: Optional[int] = None, queue_size: int = 64,
+                 max_upload_bytes: int = 1024 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 retention_seconds: float = 3600, instrumentation: Optional[Instrumentation] = None):
+        """
+        Creates a job server.
+
+        Args:
+            work_dir (str): Directory of the uploads and job outputs. Defaults to "./job_server_data".
+            workers (Optional[int]): Number of worker processes, and of jobs run at once.
+                Defaults to the number of CPUs.
+            queue_size (int): Jobs waiting for a worker before new ones are refused with 503. Defaults to 64.
+            max_upload_bytes (int): Largest upload accepted, in bytes. Defaults to 1 GiB.
+            cache_dir (Optional[str]): Extraction cache directory shared by the workers. Defaults to None.
+            retention_seconds (float): Age after which finished jobs and unused uploads are removed.
+                Defaults to 3600.
+            instrumentation (Optional[Instrumentation]): Receives the events of the server.
+                Defaults to an Instrumentation printing the messages to the console.
+        """
+        self.work_dir = work_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.max_upload_bytes = max_upload_bytes
+        self.cache_dir = cache_dir
+        self.retention_seconds = retention_seconds
+        self.instrumentation = instrumentation or Instrumentation()
+        self.uploads = {}  # Upload id to "path", "filename", "size" and "created"
+        self.jobs = {}  # Job id to its status record
+        self._queue = None
+        self._executor = None
+        self._tasks = []
+        self._running = 0
+
+        self._uploads_dir = os.path.join(work_dir, "uploads")
+        self._jobs_dir = os.path.join(work_dir, "jobs")
+
+    # Start the workers and listen for requests
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """
+        Starts the worker processes and the HTTP listener.
+
+        Args:
+            host (str): Address to listen on. Defaults to "127.0.0.1" (local connections only).
+            port (int): Port to listen on. Defaults to 8765.
+
+        Returns:
+            asyncio.AbstractServer: The listening server.
+        """
+        os.makedirs(self._uploads_dir, exist_ok=True)
+        os.makedirs(self._jobs_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        # Start every worker process now and import the libraries, so the first jobs do not pay for the imports
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, preload_modules) for _ in range(self.workers)))
+
+        self._tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+        server = await asyncio.start_server(self._handle_connection, host, port, limit=self.max_head_bytes)
+        self.instrumentation.event("server.start", f"Job server listening on http://{host}:{port} "
+                                   f"with {self.workers} workers", host=host, port=port, workers=self.workers)
+        return server
+
+    # Stop the workers
+    async def stop(self) -> None:
+        """Cancels the queued jobs and stops the worker processes."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(cancel_futures=True)
+
+    # Serve until interrupted
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+    # Run the queued jobs, one at a time per dispatcher
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job["status"] = "running"
+            job["started"] = time.time()
+            self._running += 1
+            try:
+                with self.instrumentation.span("server.job", command=job["command"]):
+                    outcome = await loop.run_in_executor(self._executor, run_job, job["command"],
+                                                         job["_filenames"], job["_options"])
+                job["ok"] = outcome["ok"]
+                job["results"] = [self._public_result(result) for result in outcome["results"]]
+                job["_result_path"] = outcome["result_path"]
+                job["status"] = "done" if outcome["ok"] else "failed"
+            except Exception as e:
+                job["ok"] = False
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                self._running -= 1
+                job["finished"] = time.time()
+                self._queue.task_done()
+
+            self.instrumentation.count("jobs" if job["ok"] else "failed_jobs", command=job["command"])
+            self.instrumentation.event("server.job_done", f"Job {job['job_id']} ({job['command']}) {job['status']}",
+                                       "info" if job["ok"] else "error", job_id=job["job_id"], status=job["status"])
+
+    # Remove the old finished jobs and unused uploads
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(min(60, self.retention_seconds))
+            expiry = time.time() - self.retention_seconds
+            for job_id, job in list(self.jobs.items()):
+                if job["finished"] is not None and job["finished"] < expiry:
+                    self._remove_job(job_id)
+            in_use = self._uploads_in_use()
+            for upload_id, upload in list(self.uploads.items()):
+                if upload["created"] < expiry and upload_id not in in_use:
+                    self._remove_upload(upload_id)
+
+    # Uploads read by the queued and running jobs
+    def _uploads_in_use(self) -> set:
+        return {upload_id for job in self.jobs.values() if job["finished"] is None for upload_id in job["_uploads"]}
+
+    # Remove a job and its outputs
+    def _remove_job(self, job_id: str) -> None:
+        self.jobs.pop(job_id, None)
+        shutil.rmtree(os.path.join(self._jobs_dir, job_id), ignore_errors=True)
+
+    # Remove an upload and its spool file
+    def _remove_upload(self, upload_id: str) -> None:
+        if self.uploads.pop(upload_id, None) is not None:
+            shutil.rmtree(os.path.join(self._uploads_dir, upload_id), ignore_errors=True)
+
+    # Result of a document as shown to clients, without the server paths
+    def _public_result(self, result: dict) -> dict:
+        public = {key: value for key, value in result.items() if key not in ("input", "inputs", "outputs")}
+        public["outputs"] = [os.path.basename(output) for output in result["outputs"]]
+        if public.get("report"):
+            # A dry run reports on the document without writing an output
+            public["report"] = dict(public["report"],
+                                    output_filename=public["outputs"][0] if public["outputs"] else None)
+        return public
+
+    # Status of a job as shown to clients
+    def _public_job(self, job: dict) -> dict:
+        return {key: value for key, value in job.items() if not key.startswith("_")}
+
+    # Read one request and answer it
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, path, query, headers = await self._read_head(reader)
+                await self._route(method, path, query, headers, reader, writer)
+            except HTTP_error as e:
+                await self._send_json(writer, e.status, {"error": str(e)}, e.headers)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+                await self._send_json(writer, HTTPStatus.BAD_REQUEST, {"error": f"Malformed request: {e}"})
+        except ConnectionError:
+            pass  # The client went away
+        except Exception as e:
+            self.instrumentation.event("server.error", f"Request failed: {e}", "error", error=repr(e))
+        finally:
+            writer.close()
+
+    # Parse the request line and headers
+    async def _read_head(self, reader: asyncio.StreamReader) -> tuple:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.head_timeout)
+        except asyncio.TimeoutError:
+            raise HTTP_error(HTTPStatus.REQUEST_TIMEOUT, f"The request head was not received within "
+                                                         f"{self.head_timeout} seconds.")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers
+
+    # Stream the body of a request, in Content-Length or chunked transfer encoding
+    async def _iter_body(self, reader: asyncio.StreamReader, headers: dict, max_bytes: int) -> AsyncIterator[bytes]:
+        too_large = HTTP_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"The body exceeds {max_bytes} bytes.")
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            received = 0
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # Skip the trailers
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return
+                received += size
+                if received > max_bytes:
+                    raise too_large
+                while size:
+                    block = await reader.readexactly(min(size, self.chunk_size))
+                    size -= len(block)
+                    yield block
+                await reader.readexactly(2)
+        else:
+            remaining = int(headers.get("content-length", 0))
+            if remaining > max_bytes:
+                raise too_large
+            while remaining:
+                block = await reader.readexactly(min(remaining, self.chunk_size))
+                remaining -= len(block)
+                yield block
+
+    # Dispatch a request to its handler
+    async def _route(self, method: str, path: str, query: dict, headers: dict,
+                     reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        parts = path.strip("/").split("/")
+        match (method, parts):
+            case ("POST", ["uploads"]):
+                await self._upload(query, headers, reader, writer)
+            case ("DELETE", ["uploads", upload_id]) if upload_id in self.uploads:
+                if upload_id in self._uploads_in_use():
+                    raise HTTP_error(HTTPStatus.CONFLICT, "The upload is used by a queued or running job.")
+                self._remove_upload(upload_id)
+                await self._send_json(writer, HTTPStatus.OK, {"upload_id": upload_id, "deleted": True})
+            case ("POST", ["jobs"]):
+                await self._create_job(headers, reader, writer)
+            case ("GET", ["jobs", job_id]) if job_id in self.jobs:
+                await self._send_json(writer, HTTPStatus.OK, self._public_job(self.jobs[job_id]))
+            case ("GET", ["jobs", job_id, "result"]) if job_id in self.jobs:
+                await self._job_result(self.jobs[job_id], writer)
+            case ("DELETE", ["jobs", job_id]) if job_id in self.jobs:
+                if self.jobs[job_id]["finished"] is None:
+                    raise HTTP_error(HTTPStatus.CONFLICT, "The job is not finished.")
+                self._remove_job(job_id)
+                await self._send_json(writer, HTTPStatus.OK, {"job_id": job_id, "deleted": True})
+            case ("GET", ["status"]):
+                await self._send_json(writer, HTTPStatus.OK, {
+                    "workers": self.workers, "running": self._running, "queued": self._queue.qsize(),
+                    "queue_size": self.queue_size, "jobs": len(self.jobs), "uploads": len(self.uploads),
+                })
+            case _:
+                raise HTTP_error(HTTPStatus.NOT_FOUND, f"No resource {method} {path}.")
+
+    # Spool an uploaded document to disk
+    async def _upload(self, query: dict, headers: dict, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        upload_id = uuid.uuid4().hex
+        filename = os.path.basename(query.get("filename", [""])[0]) or "document.pdf"
+        # Each upload keeps its name in its own directory, so that the outputs are named after it
+        os.makedirs(os.path.join(self._uploads_dir, upload_id))
+        path = os.path.join(self._uploads_dir, upload_id, filename)
+
+        size = 0
+        spool_file = open(path, "wb")
+        try:
+            with spool_file:
+                async for block in self._iter_body(reader, headers, self.max_upload_bytes):
+                    await asyncio.to_thread(spool_file.write, block)
+                    size += len(block)
+        except BaseException:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+            raise
+
+        self.uploads[upload_id] = {"path": path, "filename": filename, "size": size, "created": time.time()}
+        self.instrumentation.count("bytes_uploaded", size)
+        await self._send_json(writer, HTTPStatus.CREATED, {"upload_id": upload_id, "filename": filename, "size": size})
+
+    # Validate and queue a job
+    async def _create_job(self, headers: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        body = b"".join([block async for block in self._iter_body(reader, headers, self.max_json_bytes)])
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise HTTP_error(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+
+        command = request.get("command")
+        inputs = request.get("inputs") or []
+        options = request.get("options") or {}
+        if command not in job_commands:
+            raise HTTP_error(HTTPStatus.BAD_REQUEST, f"Unknown command: {command}. Use one of {job_commands}.")
+        unknown = [upload_id for upload_id in inputs if upload_id not in self.uploads]
+        if not inputs or unknown:
+            raise HTTP_error(HTTPStatus.BAD_REQUEST, f"Unknown or missing inputs: {unknown or inputs}.")
+        unknown = sorted(set(options) - set(job_options.get(command, [])))
+        if unknown:
+            raise HTTP_error(HTTPStatus.BAD_REQUEST, f"Unsupported options for {command}: {unknown}.")
+        if command in ("encrypt", "decrypt") and not options.get("password"):
+            raise HTTP_error(HTTPStatus.BAD_REQUEST, f"The {command} command needs a password.")
+
+        # Watermark images and documents are uploads too
+        used_uploads = list(inputs)
+        for name in upload_options:
+            if options.get(name) is not None:
+                if options[name] not in self.uploads:
+                    raise HTTP_error(HTTPStatus.BAD_REQUEST, f"Unknown upload for {name}: {options[name]}.")
+                used_uploads.append(options[name])
+                options[name] = self.uploads[options[name]]["path"]
+        if command == "watermark" and not any(options.get(name) for name in ["text", *upload_options]):
+            raise HTTP_error(HTTPStatus.BAD_REQUEST, "The watermark command needs a text, image or watermark_pdf.")
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self._jobs_dir, job_id)
+        options.update(output_dir=job_dir, cache_dir=self.cache_dir)
+        job = {
+            "job_id": job_id, "command": command, "inputs": inputs, "status": "queued", "ok": None,
+            "error": None, "results": None, "created": time.time(), "started": None, "finished": None,
+            "_filenames": [self.uploads[upload_id]["path"] for upload_id in inputs],
+            "_options": options, "_uploads": used_uploads, "_result_path": None,
+        }
+
+        # Backpressure: refuse the job rather than queue it without bound
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.instrumentation.count("rejected_jobs", command=command)
+            raise HTTP_error(HTTPStatus.SERVICE_UNAVAILABLE, "The job queue is full, retry later.", {"Retry-After": "5"})
+
+        os.makedirs(job_dir, exist_ok=True)
+        self.jobs[job_id] = job
+        await self._send_json(writer, HTTPStatus.ACCEPTED, self._public_job(job), {"Location": f"/jobs/{job_id}"})
+
+    # Stream the output of a finished job
+    async def _job_result(self, job: dict, writer: asyncio.StreamWriter) -> None:
+        if job["finished"] is None:
+            raise HTTP_error(HTTPStatus.CONFLICT, f"The job is {job['status']}.", {"Retry-After": "1"})
+        result_path = job["_result_path"]
+        if result_path is None or not os.path.isfile(result_path):
+            raise HTTP_error(HTTPStatus.NOT_FOUND, "The job has no output.")
+
+        size = os.path.getsize(result_path)
+        extension = os.path.splitext(result_path)[1].lower()
+        self._write_head(writer, HTTPStatus.OK, {
+            "Content-Type": content_types.get(extension, "application/octet-stream"),
+            "Content-Length": str(size),
+            "Content-Disposition": f'attachment; filename="{os.path.basename(result_path)}"',
+        })
+        with open(result_path, "rb") as result_file:
+            while block := await asyncio.to_thread(result_file.read, self.chunk_size):
+                writer.write(block)
+                await writer.drain()  # Wait for slow clients instead of buffering the file
+        self.instrumentation.count("bytes_downloaded", size)
+
+    # Write the status line and headers of a response
+    def _write_head(self, writer: asyncio.StreamWriter, status: HTTPStatus, headers: dict) -> None:
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", "Connection: close"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    # Answer with a JSON document
+    async def _send_json(self, writer: asyncio.StreamWriter, status: HTTPStatus, body: dict,
+                         headers: Optional[dict] = None) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self._write_head(writer, status, {"Content-Type": "application/json", "Content-Length": str(len(content)),
+                                          **(headers or {})})
+        writer.write(content)
+        await writer.drain()
+    ## End of Job_server class
+
+
+# Entry point of the job server
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the PDF manager operations over a local HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (local connections only by default)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--queue-size", type=int, default=64, help="jobs waiting before new ones are refused")
+    parser.add_argument("--work-dir", default="./job_server_data", help="directory of the uploads and outputs")
+    parser.add_argument("--max-upload-bytes", type=int, default=1024 * 1024 * 1024, help="largest upload accepted")
+    parser.add_argument("--retention", type=float, default=3600, help="seconds finished jobs and uploads are kept")
+    parser.add_argument("--cache-dir", help="extraction cache directory (no cache by default)")
+    args = parser.parse_args(argv)
+
+    server = Job_server(args.work_dir, args.workers, args.queue_size, args.max_upload_bytes, args.cache_dir,
+                        args.retention)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# Running the job server
+if __name__ == "__main__":
+    sys.exit(main())
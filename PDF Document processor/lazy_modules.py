@@ -0,0 +1,66 @@
+"""
+    This module defers the import of the heavy libraries (PyPDF2, pikepdf, reportlab, NumPy)
+    until an operation first uses them, so a command only pays for the libraries it needs.
+    A lazy module is a stand-in bound at module level in place of the import statement; its first
+    attribute access imports the real module, and the attributes read are then cached on it.
+    Long-lived processes (the job server, the warm worker) preload every lazy module at start.
+"""
+# Necessary modules
+import importlib
+from typing import List
+
+# Names of the modules declared lazy, in declaration order
+lazy_module_names = []
+
+
+# Stand-in for a module imported on first use
+class _Lazy_module:
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    # Import the module, once
+    def _load(self):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    # Attributes not cached yet come from the module (they are looked up here only once)
+    def __getattr__(self, attribute: str):
+        value = getattr(self._load(), attribute)
+        self.__dict__[attribute] = value
+        return value
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+# Declare a lazy module
+def lazy_import(name: str) -> _Lazy_module:
+    """
+    Returns a stand-in importing a module when one of its attributes is first read.
+
+    Args:
+        name (str): Full name of the module, e.g. "reportlab.pdfgen.canvas".
+
+    Returns:
+        _Lazy_module: The stand-in, to bind where the module would be imported
+            (e.g. pikepdf = lazy_import("pikepdf")).
+    """
+    if name not in lazy_module_names:
+        lazy_module_names.append(name)
+    return _Lazy_module(name)
+
+
+# Import every lazy module now
+def preload_modules() -> List[str]:
+    """
+    Imports every module declared lazy, e.g. before forking workers that would each import them.
+
+    Returns:
+        List[str]: The names of the modules imported.
+    """
+    for name in lazy_module_names:
+        importlib.import_module(name)
+    return list(lazy_module_names)
@@ -1,9 +1,13 @@
 
 # Necessary modules
-from pdf_manager import PDF_manager
+import os
+import sys
+import warm_worker
 
 # Driver function
 def main():
+    # Imported here, so that the commands handed to the warm worker do not load the PDF manager
+    from pdf_manager import PDF_manager
     
     # instantiate PDF manager
     myPDF_manager = PDF_manager()
@@ -35,13 +39,17 @@ def main():
                 filename = input("Enter the pdf filename: ")
                 print()
                 print("*" * 80)      
-                # retrieve total number of pages and pages text
-                pages_count, pages_content = myPDF_manager.read_pdf_document(filename)
+                # retrieve total number of pages, then stream pages text as it is extracted
+                pages_count = myPDF_manager.count_pdf_pages(filename)
                 print(f"Document total pages: {pages_count}")
-                for page_number, text in pages_content:
-                    print(f"Page {page_number}:")
-                    print(text)
-                    print("-" * 70)
+                try:
+                    for page_number, text in myPDF_manager.iter_pdf_pages(filename):
+                        print(f"Page {page_number}:")
+                        print(text)
+                        print("-" * 70)
+                except Exception:
+                    # The PDF manager already printed the error
+                    pass
                 print("*" * 80)
                 print()
             
@@ -81,7 +89,14 @@ def main():
             # Rotate pdf
             case 5:            
                 # Rotate pdf document
-                myPDF_manager.rotate_pdf("twopage.pdf", "./treated_documents/rotated_twopage.pdf", 90)
+                filename = input("Enter the pdf filename: ")
+                output_pdf = input("Enter the output PDF document path: ")
+                rotation_angle = int(input("Enter the clockwise rotation (90, 180 or 270): "))
+                pages = input('Enter the pages to rotate, e.g. "1-3,7" (empty for every page): ').strip() or None
+                try:
+                    myPDF_manager.rotate_pdf(filename, output_pdf, rotation_angle, pages)
+                except (ValueError, FileNotFoundError) as e:
+                    print(f"An error occurred while rotating the PDF: {e}")
                 print("*" * 80)
                 print()
             
@@ -115,7 +130,14 @@ def main():
             case 9:     
                 # Cropping a pdf document
                 filename_three = input("Enter the PDF document path: ")
-                myPDF_manager.cropping_pdf_document(filename_three)
+                output_pdf = input("Enter the output PDF document path: ")
+                crop_box = input("Enter the crop box as left bottom right top in points (empty to crop to the content): ").split()
+                pages = input('Enter the pages to crop, e.g. "1-3,7" (empty for every page): ').strip() or None
+                try:
+                    myPDF_manager.cropping_pdf_document(filename_three, output_pdf,
+                                                        [float(value) for value in crop_box] or None, pages)
+                except (ValueError, FileNotFoundError) as e:
+                    print(f"An error occurred while cropping the PDF: {e}")
                 print("*" * 80)
                 print()
 
@@ -132,6 +154,14 @@ def main():
                 print("this choice is unavailable, retry from 1 to 10.") 
                 ## End function main() 
             
-# Running the driver function
+# Running the driver function, or the batch mode when a command is given
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # A running warm worker takes the command, otherwise it runs here
+        if os.environ.get(warm_worker.worker_variable):
+            status = warm_worker.run_remote(sys.argv[1:], os.environ[warm_worker.worker_variable])
+            if status is not None:
+                sys.exit(status)
+        import batch
+        sys.exit(batch.main(sys.argv[1:]))
     main()   
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""
+    This module scans the metadata of pdf documents without loading their pages.
+    Only the trailer, the cross-reference sections, the document information dictionary, the XMP
+    metadata stream and the root of the page tree are read: the page count comes from the /Count
+    of the page tree root, so scanning a document costs about the same whatever its number of pages.
+    Directories are walked as they are scanned, and the records are streamed as JSON Lines or CSV
+    by a pool of worker processes, to audit large archives.
+"""
+# Necessary modules
+from __future__ import annotations
+
+import concurrent.futures
+import csv
+import json
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, TextIO
+
+from lazy_modules import lazy_import
+
+# Imported on first use
+pikepdf = lazy_import("pikepdf")
+
+# Document information entries, by metadata key
+metadata_entries = {
+    "creator": "/Creator",
+    "producer": "/Producer",
+    "subject": "/Subject",
+    "author": "/Author",
+    "title": "/Title",
+    "creation_date": "/CreationDate",
+}
+
+# XMP properties read when the document information lacks an entry
+xmp_properties = {
+    "creator": "xmp:CreatorTool",
+    "producer": "pdf:Producer",
+    "subject": "dc:description",
+    "author": "dc:creator",
+    "title": "dc:title",
+    "creation_date": "xmp:CreateDate",
+}
+
+# Fields of a scan record, in the order of the CSV columns
+scan_fields = ["path", "size", "version", "pages", "encrypted", *metadata_entries, "xmp", "error"]
+
+# Bytes at the start of a document searched for its version
+header_size = 1024
+
+# Output formats of the scan records
+scan_formats = ["jsonl", "csv"]
+
+
+# Version given by the header of a document
+def _header_version(stream) -> Optional[str]:
+    stream.seek(0)
+    match = re.search(rb"%PDF-(\d\.\d)", stream.read(header_size))
+    return match.group(1).decode("ascii") if match else None
+
+
+# Text of a metadata value
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (list, set)):
+        return "; ".join(str(item) for item in value) or None
+    return str(value) or None
+
+
+# Scan a single document
+def scan_metadata(source, password: str = "") -> dict:
+    """
+    Reads the metadata, page count, version and encryption of a document, without its pages.
+
+    Args:
+        source: Path of the document, or a seekable binary stream over it.
+        password (str): Password of encrypted documents. Defaults to the empty user password,
+            which opens the documents encrypted only against editing.
+
+    Returns:
+        dict: A record with the keys of scan_fields: "path" (None for streams), "size" in bytes,
+            "version" (e.g. "1.7"), "pages", "encrypted", the metadata_entries keys (from the
+            document information, or from the XMP metadata when missing there), "xmp" (whether
+            the document has XMP metadata) and "error" (None when the document was read). Documents
+            needing a password have their size, version and encryption only.
+    """
+    record = dict.fromkeys(scan_fields)
+    is_path = isinstance(source, (str, os.PathLike))
+    record["path"] = os.fspath(source) if is_path else None
+    try:
+        if is_path:
+            with open(source, "rb") as stream:
+                record["size"] = os.fstat(stream.fileno()).st_size
+                record["version"] = _header_version(stream)
+        else:
+            source.seek(0, os.SEEK_END)
+            record["size"] = source.tell()
+            record["version"] = _header_version(source)
+            source.seek(0)
+
+        # qpdf reads files by path several times faster than through Python streams
+        try:
+            pdf = pikepdf.open(source, password=password)
+        except pikepdf.PasswordError:
+            record["encrypted"] = True
+            return record
+        with pdf:
+            _read_document(pdf, record)
+    except Exception as e:
+        record["error"] = repr(e)
+    return record
+    ## End scan_metadata() function ##
+
+
+# Fill a scan record from an open document
+def _read_document(pdf: pikepdf.Pdf, record: dict) -> None:
+    record["encrypted"] = pdf.is_encrypted
+    # The catalog may declare a later version than the header
+    version = pdf.Root.get("/Version")
+    record["version"] = max(filter(None, [record["version"], pdf.pdf_version, str(version)[1:] if version else None]))
+
+    # The root of the page tree counts the pages; the tree is walked only when it does not
+    count = pdf.Root.get("/Pages", {}).get("/Count")
+    record["pages"] = int(count) if isinstance(count, int) and count >= 0 else len(pdf.pages)
+
+    info = pdf.trailer.get("/Info")
+    if info is not None:
+        for key, entry in metadata_entries.items():
+            record[key] = _text(info.get(entry))
+
+    record["xmp"] = "/Metadata" in pdf.Root
+    if record["xmp"] and any(record[key] is None for key in metadata_entries):
+        try:
+            xmp = pdf.open_metadata(set_pikepdf_as_editor=False, update_docinfo=False)
+            for key, name in xmp_properties.items():
+                if record[key] is None:
+                    record[key] = _text(xmp.get(name))
+        except Exception:
+            # Unreadable XMP does not hide the document information
+            pass
+
+
+# Walk directories for pdf documents
+def walk_pdf_files(inputs: Iterable[str], extensions: Iterable[str] = (".pdf",)) -> Iterator[str]:
+    """
+    Yields the documents of directories as they are found, and the other inputs as given.
+
+    Args:
+        inputs (Iterable[str]): Directories, searched recursively (without following links), or files.
+        extensions (Iterable[str]): File extensions of documents, compared without case. Defaults to ".pdf".
+
+    Yields:
+        str: Paths of the documents, in the order of the inputs and by name within directories.
+    """
+    extensions = tuple(extension.lower() for extension in extensions)
+    for path in inputs:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        directories = [path]
+        while directories:
+            directory = directories.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError:
+                # Unreadable directories are skipped, as find does
+                continue
+            subdirectories = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    yield entry.path
+            # Depth first, in name order
+            directories.extend(reversed(subdirectories))
+    ## End walk_pdf_files() function ##
+
+
+# Scan a chunk of documents (runs in a worker process)
+def scan_chunk(paths: List[str]) -> List[dict]:
+    """
+    Scans documents one after the other.
+
+    Args:
+        paths (List[str]): Paths of the documents.
+
+    Returns:
+        List[dict]: Their records, see scan_metadata().
+    """
+    return [scan_metadata(path) for path in paths]
+
+
+# Scan many documents with a pool of workers
+def scan_documents(paths: Iterable[str], workers: int = 1, chunk_size: int = 64) -> Iterator[dict]:
+    """
+    Scans documents, yielding their records as they complete.
+
+    The paths are consumed as the scan goes, with a bounded number of chunks in flight, so an
+    archive walk is scanned while it is still being listed and never held in memory.
+
+    Args:
+        paths (Iterable[str]): Paths of the documents, e.g. from walk_pdf_files().
+        workers (int): Number of worker processes. With 1, documents are scanned in this process.
+        chunk_size (int): Documents sent to a worker at once. Defaults to 64.
+
+    Yields:
+        dict: The record of each document, see scan_metadata().
+    """
+    if workers <= 1:
+        for path in paths:
+            yield scan_metadata(path)
+        return
+
+    # Chunks of paths, read lazily
+    def chunks():
+        chunk = []
+        for path in paths:
+            chunk.append(path)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    pending_chunks = chunks()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        while True:
+            # Keep every worker busy, with a few chunks queued behind
+            for chunk in pending_chunks:
+                running.add(executor.submit(scan_chunk, chunk))
+                if len(running) >= workers * 4:
+                    break
+            if not running:
+                return
+            done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    ## End scan_documents() function ##
+
+
+# Write scan records as they come
+def write_scan(records: Iterable[dict], output: TextIO, output_format: str = "jsonl") -> dict:
+    """
+    Writes scan records as JSON Lines or CSV (with a header row).
+
+    Args:
+        records (Iterable[dict]): Records, see scan_metadata().
+        output (TextIO): Text stream receiving them (open CSV files with newline="").
+        output_format (str): One of scan_formats. Defaults to "jsonl".
+
+    Returns:
+        dict: Totals with the keys "documents", "pages", "bytes", "encrypted" and "errors".
+    """
+    if output_format not in scan_formats:
+        raise ValueError(f"Unknown scan format: {output_format}")
+    writer = csv.DictWriter(output, fieldnames=scan_fields) if output_format == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+
+    totals = {"documents": 0, "pages": 0, "bytes": 0, "encrypted": 0, "errors": 0}
+    for record in records:
+        if writer is not None:
+            writer.writerow(record)
+        else:
+            output.write(json.dumps(record) + "\n")
+        totals["documents"] += 1
+        totals["pages"] += record["pages"] or 0
+        totals["bytes"] += record["size"] or 0
+        totals["encrypted"] += bool(record["encrypted"])
+        totals["errors"] += record["error"] is not None
+    output.flush()
+    return totals
+    ## End write_scan() function ##
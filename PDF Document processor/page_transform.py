@@ -0,0 +1,239 @@
+"""
+    This module holds the geometry of the page transforms of the PDF manager.
+    Page boxes are handled as NumPy arrays of shape (pages, 4) holding (left, bottom, right, top),
+    so rotations and crop boxes are computed for every page of a document at once.
+    Content bounding boxes are measured from the page content streams (paths, images, forms and
+    text), following the transformation matrices, without rewriting the content.
+"""
+# Necessary modules
+from __future__ import annotations
+
+from typing import Optional
+
+from lazy_modules import lazy_import
+
+# Heavy libraries, imported on first use
+np = lazy_import("numpy")
+pikepdf = lazy_import("pikepdf")
+
+# Operators adding points to the current path
+path_operators = {"m", "l", "c", "v", "y"}
+# Operators painting the current path
+painting_operators = {"S", "s", "f", "F", "f*", "B", "B*", "b", "b*"}
+# Average glyph width of text, in text space units per unit of font size (the fonts are not measured)
+average_glyph_width = 0.5
+
+
+# Order the corners of boxes as (left, bottom, right, top)
+def normalize_boxes(boxes) -> np.ndarray:
+    """
+    Orders the corners of boxes.
+
+    Args:
+        boxes: Boxes of shape (4,) or (pages, 4), given by any two opposite corners.
+
+    Returns:
+        np.ndarray: The boxes as float (left, bottom, right, top), of shape (pages, 4).
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    return np.concatenate([np.minimum(boxes[:, :2], boxes[:, 2:]), np.maximum(boxes[:, :2], boxes[:, 2:])], axis=1)
+
+
+# Clockwise rotations of pages after a transform
+def combine_rotations(current, angles, relative: bool = True) -> np.ndarray:
+    """
+    Computes the /Rotate values of pages.
+
+    Args:
+        current: Current /Rotate values, one per page.
+        angles: Clockwise rotations, one per page, multiples of 90.
+        relative (bool): Add the angles to the current rotations instead of replacing them. Defaults to True.
+
+    Returns:
+        np.ndarray: The rotations, in [0, 360).
+    """
+    current = np.asarray(current, dtype=int)
+    angles = np.asarray(angles, dtype=int)
+    if np.any(angles % 90 != 0):
+        raise ValueError(f"Rotations must be multiples of 90 degrees, not {sorted(set(angles[angles % 90 != 0].tolist()))}.")
+    return np.mod(current + angles if relative else angles, 360)
+
+
+# Crop boxes of pages, within their media boxes
+def resolve_crop_boxes(mediaboxes, boxes, margin: float = 0.0) -> np.ndarray:
+    """
+    Computes crop boxes: each box is grown by the margin and clipped to its media box.
+
+    Args:
+        mediaboxes: Media boxes of the pages, of shape (pages, 4).
+        boxes: Requested crop boxes, of shape (pages, 4).
+        margin (float): Space added around each box, in points. Defaults to 0.
+
+    Returns:
+        np.ndarray: The crop boxes, of shape (pages, 4).
+    """
+    mediaboxes = normalize_boxes(mediaboxes)
+    boxes = normalize_boxes(boxes) + np.array([-margin, -margin, margin, margin])
+    cropped = np.concatenate([np.maximum(boxes[:, :2], mediaboxes[:, :2]),
+                              np.minimum(boxes[:, 2:], mediaboxes[:, 2:])], axis=1)
+
+    # A box outside of its page would hide the whole page
+    empty = (cropped[:, 2] <= cropped[:, 0]) | (cropped[:, 3] <= cropped[:, 1])
+    if np.any(empty):
+        raise ValueError(f"The crop boxes of {int(empty.sum())} pages are outside of their pages.")
+    return cropped
+
+
+# Identity transformation matrix, as the six numbers (a, b, c, d, e, f) of cm
+identity_matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+# Matrix of the six operands of cm, Tm or /Matrix
+def _matrix(operands) -> tuple:
+    return tuple(float(value) for value in operands)
+
+
+# Matrix applying first, then second (the matrices of a content stream are tiny, plain floats beat arrays)
+def _multiply(first: tuple, second: tuple) -> tuple:
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (a1 * a2 + b1 * c2, a1 * b2 + b1 * d2, c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2)
+
+
+# Points transformed by a matrix
+def _transform(points, matrix: tuple) -> list:
+    a, b, c, d, e, f = matrix
+    return [(x * a + y * c + e, x * b + y * d + f) for x, y in points]
+
+
+# Pairs of coordinates of path operands
+def _pairs(operands) -> list:
+    values = [float(value) for value in operands]
+    return list(zip(values[::2], values[1::2]))
+
+
+# Corners of a rectangle
+def _corners(left: float, bottom: float, right: float, top: float) -> list:
+    return [(left, bottom), (right, bottom), (right, top), (left, top)]
+
+
+# Width of shown text, in text space units
+def _text_width(operand, font_size: float, character_spacing: float, word_spacing: float) -> float:
+    if isinstance(operand, pikepdf.Array):
+        # Numbers of TJ arrays move the next glyphs back by thousandths of the font size
+        return sum(_text_width(item, font_size, character_spacing, word_spacing) if isinstance(item, pikepdf.String)
+                   else -float(item) / 1000 * font_size for item in operand)
+    data = bytes(operand)
+    return len(data) * (average_glyph_width * font_size + character_spacing) + data.count(b" ") * word_spacing
+
+
+# Bounding box of what a content stream draws
+def _content_points(instructions, resources, ctm: tuple, visited_forms: set) -> list:
+    points = []  # Device space points
+    path = []  # Points of the current path, in device space
+    stack = []  # Saved graphics states
+    text_matrix = line_matrix = identity_matrix
+    font_size = leading = character_spacing = word_spacing = rise = 0.0
+    horizontal_scaling = 1.0
+
+    # Add the extent of shown text and move the text matrix after it
+    def show_text(operand):
+        nonlocal text_matrix
+        width = _text_width(operand, font_size, character_spacing, word_spacing) * horizontal_scaling
+        # Descenders go below the baseline by about a fifth of the font size
+        box = _corners(0.0, rise - 0.2 * font_size, width, rise + font_size)
+        points.extend(_transform(box, _multiply(text_matrix, ctm)))
+        text_matrix = _multiply((1.0, 0.0, 0.0, 1.0, width, 0.0), text_matrix)
+
+    for instruction in instructions:
+        operator = str(instruction.operator)
+        operands = list(instruction.operands) if hasattr(instruction, "operands") else []
+        match operator:
+            case "q":
+                stack.append(ctm)
+            case "Q":
+                ctm = stack.pop() if stack else ctm
+            case "cm":
+                ctm = _multiply(_matrix(operands), ctm)
+            case _ if operator in path_operators:
+                path.extend(_transform(_pairs(operands), ctm))
+            case "re":
+                x, y, width, height = (float(value) for value in operands)
+                path.extend(_transform(_corners(x, y, x + width, y + height), ctm))
+            case _ if operator in painting_operators:
+                points.extend(path)
+                path = []
+            case "n":
+                path = []
+            case "BI" | "INLINE IMAGE":
+                points.extend(_transform(_corners(0, 0, 1, 1), ctm))
+            case "Do":
+                xobject = resources.get("/XObject", {}).get(operands[0]) if resources is not None else None
+                if xobject is None:
+                    continue
+                if xobject.get("/Subtype") == "/Image":
+                    points.extend(_transform(_corners(0, 0, 1, 1), ctm))
+                elif xobject.get("/Subtype") == "/Form" and xobject.objgen not in visited_forms:
+                    # The form is measured inside its own box, with its own resources
+                    form_ctm = _multiply(_matrix(xobject.get("/Matrix", identity_matrix)), ctm)
+                    form_points = _content_points(pikepdf.parse_content_stream(xobject),
+                                                  xobject.get("/Resources", resources), form_ctm,
+                                                  visited_forms | {xobject.objgen})
+                    if form_points:
+                        form_bbox = normalize_boxes([float(value) for value in xobject.BBox])[0]
+                        form_box = np.array(_transform(_corners(*form_bbox), form_ctm))
+                        points.extend(np.clip(form_points, form_box.min(axis=0), form_box.max(axis=0)).tolist())
+            case "BT":
+                text_matrix = line_matrix = identity_matrix
+            case "Tf":
+                font_size = float(operands[1])
+            case "TL":
+                leading = float(operands[0])
+            case "Tc":
+                character_spacing = float(operands[0])
+            case "Tw":
+                word_spacing = float(operands[0])
+            case "Tz":
+                horizontal_scaling = float(operands[0]) / 100
+            case "Ts":
+                rise = float(operands[0])
+            case "Td" | "TD":
+                if operator == "TD":
+                    leading = -float(operands[1])
+                text_matrix = line_matrix = _multiply((1.0, 0.0, 0.0, 1.0, float(operands[0]), float(operands[1])),
+                                                      line_matrix)
+            case "Tm":
+                text_matrix = line_matrix = _matrix(operands)
+            case "T*":
+                text_matrix = line_matrix = _multiply((1.0, 0.0, 0.0, 1.0, 0.0, -leading), line_matrix)
+            case "Tj" | "TJ":
+                show_text(operands[0])
+            case "'" | '"':
+                if operator == '"':
+                    word_spacing, character_spacing = float(operands[0]), float(operands[1])
+                text_matrix = line_matrix = _multiply((1.0, 0.0, 0.0, 1.0, 0.0, -leading), line_matrix)
+                show_text(operands[-1])
+    return points
+    ## End _content_points() function ##
+
+
+# Bounding box of the content of a page
+def content_bounding_box(page: pikepdf.Page) -> Optional[tuple]:
+    """
+    Measures the area where a page draws something.
+
+    Paths are measured from their points, images and forms from their boxes, and text from its
+    position and font size, its width being estimated from the number of characters.
+
+    Args:
+        page (pikepdf.Page): The page.
+
+    Returns:
+        Optional[tuple]: (left, bottom, right, top) in the coordinates of the page, or None for a blank page.
+    """
+    points = _content_points(pikepdf.parse_content_stream(page), page.obj.get("/Resources"), identity_matrix, set())
+    if not points:
+        return None
+    points = np.array(points)
+    return (*points.min(axis=0).tolist(), *points.max(axis=0).tolist())
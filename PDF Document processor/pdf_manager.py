@@ -7,17 +7,612 @@
     It is used for merging, splitting, and rotating pages.
     It is used for encrypting and decrypting PDF files.
     It is also used for making and adding watermarks and modifying PDF content.           
+    Documents are given as paths or held in memory (bytes, bytearray, memoryview, mmap, BytesIO),
+    and outputs are written to paths or to in-memory buffers; large files are memory-mapped.
+    The PDF, drawing and array libraries are imported by the first operation using them.
 """
 # Necessary modules
-from PyPDF2 import PdfReader, PdfWriter
-from typing import Dict, Optional
+from __future__ import annotations
+from typing import Callable, Dict, Iterator, Optional, Tuple
 import os
 from pathlib import Path
-import pikepdf
-from pikepdf import PasswordError, Pdf
-from reportlab.lib.pagesizes import letter
 from io import BytesIO
-from reportlab.pdfgen import canvas
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from contextlib import ExitStack
+import math
+from extraction_cache import Extraction_cache
+from instrumentation import Instrumentation, instrumented
+from lazy_modules import lazy_import
+from page_transform import combine_rotations, content_bounding_box, resolve_crop_boxes
+from incremental_update import build_update, find_startxref, object_fingerprints, tail_size
+from metadata_scanner import metadata_entries, scan_metadata
+from job_journal import Job_journal, atomic_output, atomic_path, options_key
+from pdf_optimizer import deduplicate_pdf_objects, optimize_document, optimized_save_arguments
+import re
+import time
+import json
+import threading
+import sys
+import hashlib
+import tempfile
+import io
+import mmap
+import shutil
+try:
+    import resource  # Peak memory measurement, Unix only
+except ImportError:
+    resource = None
+
+# Heavy libraries, imported on first use
+PyPDF2 = lazy_import("PyPDF2")
+pikepdf = lazy_import("pikepdf")
+canvas = lazy_import("reportlab.pdfgen.canvas")
+np = lazy_import("numpy")
+
+# Letter page size in points (reportlab.lib.pagesizes.letter), the default size of the watermarks
+letter = (612.0, 792.0)
+
+# Peak resident memory of the current process, in bytes (None where unavailable).
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+# Input files of at least this size are memory-mapped instead of read through Python file buffers
+mmap_threshold = 8 * 1024 * 1024
+
+# Bytes-like objects accepted as sources
+buffer_types = (bytes, bytearray, memoryview, mmap.mmap)
+
+# Object stream modes of the full saves
+object_stream_modes = ["preserve", "generate", "disable"]
+
+
+# Read-only binary stream over a bytes-like object, without copying it.
+class _Memory_reader(io.RawIOBase):
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        if end <= self._position:
+            return b""
+        data = self._view[self._position:end].tobytes()
+        self._position = end
+        return data
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, buffer) -> int:
+        size = max(0, min(len(buffer), len(self._view) - self._position))
+        memoryview(buffer).cast("B")[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self) -> None:
+        # Release the view so that the owner can resize or close the buffer
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+# Writable binary stream over a bytearray (grown as needed) or a fixed-size memoryview or mmap.
+class _Memory_writer(io.RawIOBase):
+    def __init__(self, buffer):
+        if isinstance(buffer, bytearray):
+            del buffer[:]  # The output replaces the previous content
+        self._buffer = buffer.cast("B") if isinstance(buffer, memoryview) else buffer
+        self._position = 0
+        self.size = 0  # Bytes written, up to the furthest position
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def write(self, data) -> int:
+        data = memoryview(data).cast("B")
+        end = self._position + len(data)
+        if end > len(self._buffer):
+            if not isinstance(self._buffer, bytearray):
+                raise ValueError(f"The output buffer is too small: {end} bytes needed, {len(self._buffer)} available.")
+            self._buffer.extend(bytes(end - len(self._buffer)))
+        self._buffer[self._position:end] = data
+        self._position = end
+        self.size = max(self.size, end)
+        return len(data)
+
+# Writable binary stream discarding what is written, to measure the size of a document.
+class _Byte_counter(io.RawIOBase):
+    def __init__(self):
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.size
+
+    def write(self, data) -> int:
+        length = memoryview(data).nbytes
+        self.size += length
+        return length
+
+# Name of a source in the messages: its path, or its type and size.
+def _source_name(source) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    size = _source_size(source)
+    return f"<{type(source).__name__}{'' if size is None else f' of {size} bytes'}>"
+
+# Name of a source without directory and extension, used to name its outputs.
+def _source_stem(source) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.splitext(os.path.basename(source))[0]
+    return "document"
+
+# Size of a source in bytes, or None when it cannot be known without reading it.
+def _source_size(source) -> Optional[int]:
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source) if os.path.isfile(source) else None
+    if isinstance(source, buffer_types):
+        return memoryview(source).nbytes
+    if isinstance(source, BytesIO):
+        return source.getbuffer().nbytes
+    return None
+
+# Open a pdf source for reading with PyPDF2, closing it with the stack.
+def _open_source(source, stack: ExitStack):
+    """
+    Returns a seekable binary stream over a PDF source without copying it into a Python buffer.
+
+    Args:
+        source: A file path, a bytes-like object (bytes, bytearray, memoryview, mmap) or a
+            seekable binary stream (e.g. BytesIO), read from its start.
+        stack (ExitStack): Stack closing the stream. A stream given as source is left open.
+
+    Returns:
+        A binary stream. Files of mmap_threshold bytes or more are memory-mapped.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        pdf_file = stack.enter_context(open(source, "rb"))
+        if os.fstat(pdf_file.fileno()).st_size >= mmap_threshold:
+            return stack.enter_context(mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ))
+        return pdf_file
+    if isinstance(source, buffer_types):
+        return stack.enter_context(_Memory_reader(source))
+    if hasattr(source, "read") and hasattr(source, "seek"):
+        source.seek(0)
+        return source
+    raise TypeError(f"Unsupported PDF source: {type(source).__name__}")
+
+# Open a pdf source with pikepdf, closing it with the stack.
+def _open_pdf(source, stack: ExitStack, **kwargs) -> pikepdf.Pdf:
+    # pikepdf memory-maps the files it opens by path itself
+    if isinstance(source, (str, os.PathLike)):
+        return stack.enter_context(pikepdf.Pdf.open(source, **kwargs))
+    return stack.enter_context(pikepdf.Pdf.open(_open_source(source, stack), **kwargs))
+
+# Source that can be sent to a worker process: paths as they are, in-memory documents as bytes.
+def _worker_source(source):
+    if isinstance(source, (str, os.PathLike, bytes)):
+        return source
+    if isinstance(source, BytesIO):
+        return source.getvalue()
+    if isinstance(source, buffer_types):
+        return bytes(source)
+    source.seek(0)
+    return source.read()
+
+# Size and modification time of a file, telling its versions apart, or None without a file.
+def _file_state(path) -> Optional[tuple]:
+    if not path:
+        return None
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+# Save a document to an output, given the function writing it to a path or a stream.
+def _save_output(save: Callable, output) -> tuple:
+    """
+    Saves a document to a path, a bytearray, a writable memoryview or mmap, or a binary stream.
+
+    Args:
+        save (Callable): Called with a path or a writable binary stream, writes the document to it.
+        output: A file path (parent directories are created; the file is written under a temporary
+            name and renamed once complete, so it is never left truncated), a bytearray (replaced by the document),
+            a writable memoryview or mmap (written from its start; too small a buffer raises
+            ValueError), or a writable binary stream (e.g. BytesIO, written at its position).
+
+    Returns:
+        tuple: The output to hand back (the path, the stream, the bytearray, the mmap, or the
+            written part of the memoryview) and the number of bytes written.
+    """
+    if isinstance(output, (str, os.PathLike)):
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with atomic_path(output) as temporary:
+            save(temporary)
+        return (output, os.path.getsize(output))
+    if isinstance(output, (bytearray, memoryview, mmap.mmap)):
+        with _Memory_writer(output) as writer:
+            save(writer)
+            size = writer.size
+        return (output[:size] if isinstance(output, memoryview) else output, size)
+    if hasattr(output, "write"):
+        start = output.tell()
+        save(output)
+        return (output, output.tell() - start)
+    raise TypeError(f"Unsupported PDF output: {type(output).__name__}")
+
+# Incremental update of a document edited since it was opened from source, or None when nothing changed.
+def _incremental_update(pdf: pikepdf.Pdf, source, fingerprints: dict) -> Optional[bytes]:
+    with ExitStack() as stack:
+        stream = _open_source(source, stack)
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(max(size - tail_size, 0))
+        tail = stream.read()
+        previous_xref = find_startxref(tail)
+        stream.seek(previous_xref)
+        xref_stream = not stream.read(4).startswith(b"xref")
+    separator = b"" if tail.endswith((b"\n", b"\r")) else b"\n"
+    return build_update(pdf, fingerprints, size, previous_xref, xref_stream, separator)
+
+# Write the source of a document followed by its incremental update.
+def _write_updated(target, source, update: bytes) -> None:
+    if isinstance(target, (str, os.PathLike)):
+        if isinstance(source, (str, os.PathLike)):
+            # The operating system copies the original bytes
+            shutil.copyfile(source, target)
+            with open(target, "ab") as file:
+                file.write(update)
+            return
+        with open(target, "wb") as file:
+            _write_updated(file, source, update)
+        return
+    with ExitStack() as stack:
+        shutil.copyfileobj(_open_source(source, stack), target, 1024 * 1024)
+    target.write(update)
+
+# Save a document opened with pikepdf, rewriting it or appending an incremental update to its source.
+def _save_pdf(pdf: pikepdf.Pdf, source, output, fingerprints: Optional[dict] = None, save_options: Optional[dict] = None,
+              encryption: Optional[pikepdf.Encryption] = None) -> tuple:
+    """
+    Saves a document opened from a source with _open_pdf().
+
+    Args:
+        pdf (Pdf): The document.
+        source: The source it was opened from.
+        output: A path, bytearray, writable memoryview or mmap, or binary stream (see _save_output()).
+        fingerprints (Optional[dict]): Object fingerprints taken when the document was opened
+            (see incremental_update.object_fingerprints()), needed by incremental saves.
+        save_options (Optional[dict]): How the document is written:
+            - "incremental" (bool): append the changed objects and a cross-reference section to the
+              source instead of rewriting it; when the output is the source file itself, only the
+              update is written. Encrypted documents and outputs are rewritten. Defaults to False.
+            - "object_streams" (str): on full saves, "preserve" the object streams of the source,
+              "generate" them to pack the small objects together, or "disable" them. Defaults to "preserve".
+            - "linearize" (bool): on full saves, linearize the document for fast web view. Defaults to False.
+            - "optimize" (bool or dict): on full saves, optimize the document (see pdf_optimizer.optimize_document(),
+              a dict giving its arguments) and compress its streams; object streams are then generated
+              unless "object_streams" says otherwise. Cannot be combined with "incremental". Defaults to False.
+        encryption (Optional[pikepdf.Encryption]): Encryption of the output. Defaults to none.
+
+    Returns:
+        tuple: The output to hand back and the number of bytes written, as _save_output().
+    """
+    save_options = save_options or {}
+    if save_options.get("incremental") and save_options.get("linearize"):
+        raise ValueError("An incremental update cannot be linearized.")
+    if save_options.get("incremental") and save_options.get("optimize"):
+        raise ValueError("An incremental update cannot be optimized.")
+    if save_options.get("object_streams", "preserve") not in object_stream_modes:
+        raise ValueError(f"Unknown object streams mode: {save_options['object_streams']}")
+
+    if save_options.get("incremental") and fingerprints is not None and not pdf.is_encrypted and encryption is None:
+        update = _incremental_update(pdf, source, fingerprints) or b""
+        # Appending to the source file itself writes the update only
+        if isinstance(output, (str, os.PathLike)) and isinstance(source, (str, os.PathLike)) \
+                and os.path.exists(output) and os.path.samefile(source, output):
+            with open(output, "ab") as file:
+                file.write(update)
+            return (output, len(update))
+        return _save_output(lambda target: _write_updated(target, source, update), output)
+
+    # A rewrite of the source file replaces it once complete (see _save_output()), while it is still read
+    optimize = save_options.get("optimize")
+    if optimize:
+        optimize_document(pdf, **(optimize if isinstance(optimize, dict) else {}))
+        save_arguments = optimized_save_arguments(save_options.get("object_streams", "generate"))
+    else:
+        save_arguments = {"object_stream_mode": getattr(pikepdf.ObjectStreamMode,
+                                                        save_options.get("object_streams", "preserve"))}
+    return _save_output(lambda target: pdf.save(target, linearize=save_options.get("linearize", False),
+                                                encryption=encryption or False, **save_arguments), output)
+
+# Parse page ranges such as "1-3,7,10-" into (first_page, last_page) tuples.
+def parse_page_ranges(page_ranges: str, pages_count: int) -> list:
+    """
+    Parses a page range selector.
+
+    Args:
+        page_ranges (str): Comma separated pages or ranges, e.g. "1-3,7,10-" or "-5".
+            Open ranges extend to the first or last page.
+        pages_count (int): Total number of pages of the document.
+
+    Returns:
+        list: A list of (first_page, last_page) tuples, pages starting from 1.
+
+    Raises:
+        ValueError: When the selector is malformed or out of the document.
+    """
+    ranges = []
+    for part in page_ranges.replace(" ", "").split(","):
+        match = re.fullmatch(r"(\d*)(-?)(\d*)", part)
+        if not part or not match or (not match.group(2) and not match.group(1)):
+            raise ValueError(f"Invalid page range: {part!r}")
+        first_page = int(match.group(1)) if match.group(1) else 1
+        if match.group(2):
+            last_page = int(match.group(3)) if match.group(3) else pages_count
+        else:
+            last_page = first_page
+        if not 1 <= first_page <= last_page <= pages_count:
+            raise ValueError(f"Page range {part!r} is outside pages 1-{pages_count}")
+        ranges.append((first_page, last_page))
+    return ranges
+
+# Page numbers selected by a page argument, or None for every page.
+def _page_selection(pages, pages_count: int) -> Optional[set]:
+    """
+    Resolves a page selector into page numbers.
+
+    Args:
+        pages: None (every page), a page number, page ranges as accepted by parse_page_ranges()
+            (e.g. "1-3,7,10-"), or an iterable of page numbers, starting from 1.
+        pages_count (int): Number of pages of the document.
+
+    Returns:
+        Optional[set]: The selected page numbers, or None for every page.
+    """
+    if pages is None:
+        return None
+    if isinstance(pages, str):
+        return {page_number for first_page, last_page in parse_page_ranges(pages, pages_count)
+                for page_number in range(first_page, last_page + 1)}
+    selection = {pages} if isinstance(pages, int) else set(pages)
+    out_of_range = sorted(page_number for page_number in selection if not 1 <= page_number <= pages_count)
+    if out_of_range:
+        raise ValueError(f"Pages {out_of_range} are out of the document (1-{pages_count}).")
+    return selection
+
+# Values given per page, as an array with a row per page, and the mask of the pages given a value.
+def _page_values(values, pages_count: int, pages, width: int) -> tuple:
+    """
+    Spreads values over the pages of a document.
+
+    Args:
+        values: None, a value for every page selected by pages, or a dictionary mapping page
+            selectors (see _page_selection()) to their value, e.g. {"1-3": 90, 7: 180}.
+        pages_count (int): Number of pages of the document.
+        pages: Pages given a single value (see _page_selection()). Defaults to every page.
+        width (int): Number of numbers in a value (1 for an angle, 4 for a box).
+
+    Returns:
+        tuple: The values, an array of shape (pages_count, width), and the boolean mask of the pages given one.
+    """
+    page_values = np.zeros((pages_count, width))
+    given = np.zeros(pages_count, dtype=bool)
+    if values is None:
+        return page_values, given
+    for selector, value in (values.items() if isinstance(values, dict) else [(pages, values)]):
+        selection = _page_selection(selector, pages_count)
+        indices = np.arange(pages_count) if selection is None else np.array(sorted(selection), dtype=int) - 1
+        page_values[indices] = value
+        given[indices] = True
+    return page_values, given
+
+# Name of the journal part of a chunk of pages
+def _pages_part(first_page: int, last_page: int) -> str:
+    return f"pages {first_page}-{last_page}"
+
+# Write chunks of pages of a pdf document to their files (runs in a worker process).
+def _write_split_chunks(source, chunks: list, journal: Optional[Job_journal] = None,
+                        journal_source: Optional[str] = None, save_options: Optional[dict] = None,
+                        journal_key: str = "") -> list:
+    """
+    Writes chunks of pages of a PDF document, parsing the source once.
+
+    Args:
+        source: Path of the PDF file, its content as bytes, or an already opened pikepdf.Pdf.
+        chunks (list): (first_page, last_page, new_filename) tuples, pages starting from 1.
+            A new_filename of None keeps the chunk in memory.
+        journal (Optional[Job_journal]): Journal recording each chunk written to a file, as a part
+            of journal_source (the path of the document).
+        journal_source (Optional[str]): Path of the document in the journal.
+        save_options (Optional[dict]): "object_streams", "linearize" and "optimize" (see _save_pdf()).
+        journal_key (str): Options key of the chunks in the journal.
+
+    Returns:
+        list: A list of (first_page, new_filename or the chunk content as bytes, bytes_written) tuples.
+    """
+    written = []
+    with ExitStack() as stack:
+        pdf = source if isinstance(source, pikepdf.Pdf) else _open_pdf(source, stack)
+        for first_page, last_page, new_filename in chunks:
+            # Pages copied into the same chunk share their resources
+            with pikepdf.Pdf.new() as chunk_pdf:
+                chunk_pdf.pages.extend(pdf.pages[first_page - 1:last_page])
+                output, size = _save_pdf(chunk_pdf, None, new_filename or BytesIO(), save_options=save_options)
+            if journal is not None and new_filename is not None:
+                journal.record_part("split", journal_source, _pages_part(first_page, last_page), new_filename, size,
+                                    journal_key)
+            written.append((first_page, new_filename or output.getvalue(), size))
+    return written
+
+# Outcome of an encryption or decryption task, a failure of its own when the worker could not run it.
+def _crypt_outcome(future: concurrent.futures.Future) -> dict:
+    try:
+        return future.result()
+    except Exception as e:
+        # A task that could not be pickled, or a worker process that died
+        return {"ok": False, "attempts": 0, "error": f"The job could not be run: {e!r}", "data": None}
+
+# Encrypt or decrypt one document, retrying failed attempts (runs in a worker process).
+def _crypt_document(operation: str, source, password: str, output_pdf_path: Optional[str], retries: int) -> dict:
+    """
+    Encrypts a document with AES-256, or decrypts it.
+
+    Args:
+        operation (str): "encrypt" or "decrypt".
+        source: Path of the PDF file, or its content as a bytes-like object.
+        password (str): Password to encrypt with, or to open the encrypted document.
+        output_pdf_path (Optional[str]): Path of the output file, or None to return its content.
+        retries (int): Number of further attempts after a failure other than a wrong password.
+
+    Returns:
+        dict: The keys "ok", "attempts", "error" and "data" (output content when output_pdf_path is None).
+    """
+    result = {"ok": False, "attempts": 0, "error": None, "data": None}
+    for _ in range(retries + 1):
+        result["attempts"] += 1
+        try:
+            with ExitStack() as stack:
+                if operation == "encrypt":
+                    pdf = _open_pdf(source, stack)
+                    encryption = pikepdf.Encryption(owner=password, user=password, R=6)
+                else:
+                    pdf = _open_pdf(source, stack, password=password)
+                    encryption = None
+                # The output directory is created, and a failed attempt leaves no truncated file
+                output, _ = _save_output(lambda output: pdf.save(output, encryption=encryption),
+                                         output_pdf_path if output_pdf_path else BytesIO())
+
+            if not output_pdf_path:
+                result["data"] = output.getvalue()
+            result["ok"] = True
+            result["error"] = None
+            return result
+
+        except pikepdf.PasswordError:
+            # Retrying cannot fix a wrong password
+            result["error"] = "Incorrect password."
+            return result
+        except FileNotFoundError:
+            result["error"] = f"The file '{source}' does not exist."
+            return result
+        except Exception as e:
+            result["error"] = str(e)
+    return result
+
+# Image XObjects of a resources dictionary, including those of nested forms.
+def _iter_image_xobjects(resources, visited_forms: Optional[set] = None) -> Iterator:
+    if visited_forms is None:
+        visited_forms = set()
+    if not isinstance(resources, pikepdf.Dictionary) or "/XObject" not in resources:
+        return
+    for xobject in resources.XObject.values():
+        if not isinstance(xobject, pikepdf.Stream):
+            continue
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            yield xobject
+        elif subtype == "/Form" and xobject.objgen not in visited_forms:
+            # Direct forms have no object number and cannot loop back
+            if xobject.is_indirect:
+                visited_forms.add(xobject.objgen)
+            yield from _iter_image_xobjects(xobject.get("/Resources"), visited_forms)
+
+# File extension and content of an extracted image.
+def _image_file_content(image, raw_bytes: bytes, raw_streams: bool) -> tuple:
+    image_filter = image.get("/Filter")
+    if isinstance(image_filter, pikepdf.Array):
+        image_filter = image_filter[-1] if len(image_filter) == 1 else None
+    passthrough_extensions = {"/DCTDecode": ".jpg", "/JPXDecode": ".jp2", "/JBIG2Decode": ".jb2"}
+
+    # JPEG and JPEG 2000 streams are complete image files
+    if image_filter in ("/DCTDecode", "/JPXDecode"):
+        return (passthrough_extensions[image_filter], raw_bytes)
+    if raw_streams:
+        return (passthrough_extensions.get(image_filter, ".bin"), raw_bytes)
+
+    # Decode the other images to PNG
+    png = BytesIO()
+    pikepdf.PdfImage(image).as_pil_image().save(png, format="PNG")
+    return (".png", png.getvalue())
+
+# Write an extracted image (runs in a writer thread).
+def _write_image_file(image_path: Path, data: bytes) -> int:
+    with atomic_output(image_path) as fp:
+        fp.write(data)
+    return len(data)
+
+# Extract the text of a range of pages with a reader of its own (runs in a worker process).
+def _extract_page_range(source, first_page: int, last_page: int) -> list:
+    """
+    Extracts the text of pages first_page..last_page (inclusive) of a PDF document.
+
+    Args:
+        source: Path to the PDF file, or its content as bytes.
+        first_page (int): First page to extract (starting from 1).
+        last_page (int): Last page to extract (inclusive).
+
+    Returns:
+        list: A list of (page_number, text, error) tuples, where error is None on success
+            and text is None when the page could not be extracted.
+    """
+    results = []
+    try:
+        with ExitStack() as stack:
+            reader = PyPDF2.PdfReader(_open_source(source, stack))
+            for page_number in range(first_page, last_page + 1):
+                # A broken page is reported on its own without giving up the range
+                try:
+                    results.append((page_number, reader.pages[page_number - 1].extract_text(), None))
+                except Exception as e:
+                    results.append((page_number, None, str(e)))
+    except Exception as e:
+        # The document itself could not be opened: every remaining page of the range failed
+        done = {page_number for page_number, _, _ in results}
+        results.extend((page_number, None, str(e))
+                       for page_number in range(first_page, last_page + 1) if page_number not in done)
+    return results
  
 # class to manage pdf files   
 class PDF_manager:   
@@ -34,52 +629,322 @@ class PDF_manager:
         "crop pdf document",
         "watermark pdf document"        
     ]
+
+    # Rendered watermark documents kept by a manager
+    watermark_renders_kept = 8
+
+    def __init__(self, cache: Optional[Extraction_cache] = None, instrumentation: Optional[Instrumentation] = None):
+        """
+        Creates a PDF manager.
+
+        Args:
+            cache (Optional[Extraction_cache]): Extraction cache checked before parsing a document.
+                Defaults to None (no caching).
+            instrumentation (Optional[Instrumentation]): Receives the events, timing spans and counters
+                of the operations. Defaults to an Instrumentation printing the messages to the console.
+        """
+        self.cache = cache
+        self.instrumentation = instrumentation or Instrumentation()
+        self._watermark_renders = OrderedDict()  # Latest rendered watermark documents, reused across documents
+
+    # Content hash of a pdf document for cache lookups, or None when caching is off.
+    def _cache_hash(self, source) -> Optional[str]:
+        if self.cache is None:
+            return None
+        try:
+            with self.instrumentation.span("cache.hash"):
+                if isinstance(source, (str, os.PathLike)):
+                    return self.cache.file_hash(source)
+                if isinstance(source, BytesIO):
+                    with source.getbuffer() as view:
+                        return self.cache.buffer_hash(view)
+                if isinstance(source, buffer_types):
+                    return self.cache.buffer_hash(source)
+                # Other streams are not read ahead of the operation
+                return None
+        except OSError:
+            # Unreadable files are reported by the operation itself
+            return None
+
+    # Look a value up in the cache, counting hits and misses.
+    def _cache_get(self, file_hash: Optional[str], operation: str, page_index: Optional[int] = None):
+        if not file_hash:
+            return None
+        value = self.cache.get(file_hash, operation, page_index)
+        self.instrumentation.count("cache_hits" if value is not None else "cache_misses", operation=operation)
+        return value
+
+    # Count the bytes of an input document about to be parsed.
+    def _count_read(self, source) -> None:
+        size = _source_size(source)
+        if size is not None:
+            self.instrumentation.count("bytes_read", size)
         
     # Open the pdf file for reading, page count, and text extraction.
-    def read_pdf_document(self, filename: str) -> tuple:
+    @instrumented("read")
+    def read_pdf_document(self, filename, first_page: int = 1, last_page: Optional[int] = None) -> tuple:
         """
         Reads a PDF document, counts the number of pages, and extracts text from each page.
 
         Args:
-            filename (str): Path to the PDF file.
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+            first_page (int): First page to extract (starting from 1). Defaults to 1.
+            last_page (Optional[int]): Last page to extract (inclusive). Defaults to the last page.
 
         Returns:
             tuple: A tuple containing:
-                - pages_count (int): Total number of pages in the PDF.
+                - pages_count (int): Total number of pages in the PDF, 0 if the document could not be read.
                 - pages_content (list): A list of tuples where each tuple contains:
                     - page_number (int): The page number (starting from 1).
                     - text (str): The extracted text from the page.
+                A document failing on any page gives (0, []), never a part of its pages.
         """
-        # Variables to return
-        pages_content = []  # List of tuples for page number and text
-        pages_count = 0  # Total number of pages
-
+        # The document is hashed and parsed once for the count and the pages
         try:
-            with open(filename, "rb") as pdf_file:
-                reader = PdfReader(pdf_file)
-                
-                # Get the total number of pages
-                pages_count = len(reader.pages)
-                
-                # Read the content of all pages
-                for i, page in enumerate(reader.pages):
-                    text = page.extract_text()
-                    pages_content.append((i + 1, text))  # Page numbers start from 1
-
+            with ExitStack() as stack:
+                file_hash, pages_count, reader = self._open_pages(filename, stack)
+                pages_content = list(self._extract_pages(filename, stack, file_hash, pages_count, reader,
+                                                         first_page, last_page))
         except Exception as e:
-            print(f"An error occurred while reading the PDF: {e}")
+            self.instrumentation.event("read.error", f"An error occurred while reading the PDF: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
             return (0, [])
-       
+
         return (pages_count, pages_content)
 
-                   
+    # Count the pages of a pdf document without extracting any text.
+    def count_pdf_pages(self, filename) -> int:
+        """
+        Counts the number of pages in a PDF document.
+
+        Args:
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+
+        Returns:
+            int: Total number of pages in the PDF, or 0 if the file cannot be read.
+        """
+        try:
+            with ExitStack() as stack:
+                return self._open_pages(filename, stack)[1]
+
+        except Exception as e:
+            self.instrumentation.event("read.error", f"An error occurred while reading the PDF: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+            return 0
+
+    # Stream the text of a pdf document page by page.
+    def iter_pdf_pages(self, filename, first_page: int = 1,
+                       last_page: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Lazily extracts text from a PDF document, one page at a time.
+
+        Only the page being extracted is held in memory, so peak memory stays flat
+        whatever the length of the document. Callers may stop iterating at any time;
+        the file is closed as soon as the generator is closed or garbage collected.
+        Pages found in the cache are returned without opening the document.
+
+        Args:
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+            first_page (int): First page to extract (starting from 1). Defaults to 1.
+            last_page (Optional[int]): Last page to extract (inclusive). Defaults to the last page.
+
+        Yields:
+            Tuple[int, str]: The page number (starting from 1) and the extracted text of the page.
+
+        Raises:
+            Exception: The error of a document that cannot be read, or of a page that cannot be
+                extracted, after the pages before it were yielded. It is also reported as a "read.error" event.
+        """
+        try:
+            with ExitStack() as stack:
+                file_hash, pages_count, reader = self._open_pages(filename, stack)
+                yield from self._extract_pages(filename, stack, file_hash, pages_count, reader, first_page, last_page)
+
+        except Exception as e:
+            self.instrumentation.event("read.error", f"An error occurred while reading the PDF: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+            raise
+        ## End iter_pdf_pages() function ##
+
+    # Hash of a pdf document, its page count and its reader (None while the count comes from the cache).
+    def _open_pages(self, filename, stack: ExitStack) -> tuple:
+        # Check the cache before parsing anything
+        file_hash = self._cache_hash(filename)
+        pages_count = self._cache_get(file_hash, "page_count")
+        reader = None
+        if pages_count is None:
+            with self.instrumentation.span("read.parse"):
+                self._count_read(filename)
+                reader = PyPDF2.PdfReader(_open_source(filename, stack))
+                pages_count = len(reader.pages)
+            if file_hash:
+                self.cache.put(file_hash, "page_count", pages_count)
+        return file_hash, pages_count, reader
+
+    # Extract the text of pages first_page..last_page, opening the document once a page is missing from the cache.
+    def _extract_pages(self, filename, stack: ExitStack, file_hash: Optional[str], pages_count: int, reader,
+                       first_page: int, last_page: Optional[int]) -> Iterator[Tuple[int, str]]:
+        # Clamp the requested range to the document
+        start = max(first_page, 1)
+        stop = pages_count if last_page is None else min(last_page, pages_count)
+
+        # Extract one page at a time, handing the text to the caller instead of accumulating it
+        for page_number in range(start, stop + 1):
+            with self.instrumentation.span("read.page", page=page_number):
+                text = self._cache_get(file_hash, "text", page_number - 1)
+                if text is None:
+                    if reader is None:
+                        self._count_read(filename)
+                        reader = PyPDF2.PdfReader(_open_source(filename, stack))
+                    text = reader.pages[page_number - 1].extract_text()
+                    if file_hash:
+                        self.cache.put(file_hash, "text", text, page_number - 1)
+            self.instrumentation.count("pages")
+            yield (page_number, text)
+
+    # Extract the text of one pdf document over a pool of worker processes.
+    def parallel_read_pdf_document(self, filename, workers: Optional[int] = None,
+                                   pages_per_task: Optional[int] = None) -> tuple:
+        """
+        Extracts text from a PDF document, spreading page ranges over worker processes.
+
+        Args:
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream),
+                which is sent to the workers as bytes.
+            workers (Optional[int]): Number of worker processes. Defaults to the number of CPUs.
+            pages_per_task (Optional[int]): Pages handed to a worker at a time.
+                Defaults to a size giving each worker about four tasks.
+
+        Returns:
+            tuple: A tuple containing:
+                - pages_count (int): Total number of pages in the PDF.
+                - pages_content (list): (page_number, text) tuples in page order, for the pages extracted.
+                - failures (list): (page_number, error message) tuples for the pages that failed,
+                    or a single (None, error message) tuple when the document could not be opened.
+        """
+        return self._parallel_read([filename], workers, pages_per_task)[0]
+
+    # Extract the text of many pdf documents over a pool of worker processes.
+    def parallel_read_pdf_documents(self, file_list: list, workers: Optional[int] = None,
+                                    pages_per_task: Optional[int] = None) -> Dict[str, tuple]:
+        """
+        Extracts text from a batch of PDF documents with a ProcessPoolExecutor.
+
+        Each document is cut into page ranges, and every worker opens its own PdfReader
+        for the range it is given. A page that fails is reported in the failures of its
+        document; it does not abort the other pages or documents.
+
+        Args:
+            file_list (list): List of file paths of the PDFs to read. A path given twice is read once.
+            workers (Optional[int]): Number of worker processes. Defaults to the number of CPUs.
+            pages_per_task (Optional[int]): Pages handed to a worker at a time.
+                Defaults to a size giving each worker about four tasks.
+
+        Returns:
+            Dict[str, tuple]: For each file path, a (pages_count, pages_content, failures) tuple
+                as returned by parallel_read_pdf_document().
+        """
+        file_list = list(dict.fromkeys(file_list))
+        return dict(zip(file_list, self._parallel_read(file_list, workers, pages_per_task)))
+
+    # Extract the text of the documents, returning a (pages_count, pages_content, failures) tuple per document.
+    @instrumented("parallel_read")
+    def _parallel_read(self, sources: list, workers: Optional[int], pages_per_task: Optional[int]) -> list:
+        workers = workers or os.cpu_count() or 1
+        pages_counts = [0] * len(sources)
+        file_hashes = [None] * len(sources)
+        extracted = [[] for _ in sources]
+
+        # A document that cannot be opened is a failure of its own
+        for index, source in enumerate(sources):
+            try:
+                with ExitStack() as stack:
+                    file_hashes[index], pages_counts[index], _ = self._open_pages(source, stack)
+            except Exception as e:
+                extracted[index].append((None, None, str(e)))
+
+        # Pages already in the cache are not handed to the workers
+        missing_pages = []
+        for index, pages_count in enumerate(pages_counts):
+            missing_pages.append([])
+            for page_number in range(1, pages_count + 1):
+                text = self._cache_get(file_hashes[index], "text", page_number - 1)
+                if text is None:
+                    missing_pages[index].append(page_number)
+                else:
+                    extracted[index].append((page_number, text, None))
+
+        # Size the tasks so that the pool stays busy until the end of the batch
+        total_pages = sum(len(pages) for pages in missing_pages)
+        if not pages_per_task:
+            pages_per_task = max(1, math.ceil(total_pages / (workers * 4)))
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor, \
+                self.instrumentation.span("parallel_read.extract", workers=workers, pages=total_pages):
+            futures = {}
+            for index, pages in enumerate(missing_pages):
+                if not pages:
+                    continue
+                self._count_read(sources[index])
+                worker_source = _worker_source(sources[index])
+                # Cut the missing pages into runs of consecutive pages of at most pages_per_task
+                ranges = []
+                for page_number in pages:
+                    if ranges and ranges[-1][1] == page_number - 1 and page_number - ranges[-1][0] < pages_per_task:
+                        ranges[-1][1] = page_number
+                    else:
+                        ranges.append([page_number, page_number])
+                for first_page, last_page in ranges:
+                    future = executor.submit(_extract_page_range, worker_source, first_page, last_page)
+                    futures[future] = (index, first_page, last_page)
+
+            # Collect the ranges as they complete
+            for future in as_completed(futures):
+                index, first_page, last_page = futures[future]
+                try:
+                    pages = future.result()
+                    extracted[index].extend(pages)
+                    if file_hashes[index]:
+                        for page_number, text, error in pages:
+                            if error is None:
+                                self.cache.put(file_hashes[index], "text", text, page_number - 1)
+                except Exception as e:
+                    # The worker itself died: report every page of its range
+                    extracted[index].extend((page_number, None, str(e))
+                                            for page_number in range(first_page, last_page + 1))
+
+        # Restore page order and separate the failures
+        results = []
+        for index, pages in enumerate(extracted):
+            pages.sort(key=lambda page: page[0] or 0)
+            pages_content = [(page_number, text) for page_number, text, error in pages if error is None]
+            failures = [(page_number, error) for page_number, _, error in pages if error is not None]
+            results.append((pages_counts[index], pages_content, failures))
+            self.instrumentation.count("pages", len(pages_content))
+            for page_number, error in failures:
+                if page_number is None:
+                    self.instrumentation.event("parallel_read.error",
+                                               f"{_source_name(sources[index])} could not be read: {error}", "error",
+                                               filename=_source_name(sources[index]), error=error)
+                    continue
+                self.instrumentation.event("parallel_read.page_error",
+                                           f"Page {page_number} of {_source_name(sources[index])} failed: {error}",
+                                           "error", filename=_source_name(sources[index]), page=page_number,
+                                           error=error)
+
+        return results
+        ## End _parallel_read() function ##
+
     # open pdf file for metadata extraction   
-    def display_pdf_metadata(self, filename: str) -> Dict[str, Optional[str]]:
+    @instrumented("metadata")
+    def display_pdf_metadata(self, filename) -> Dict[str, Optional[str]]:
         """
         Extracts and displays metadata from a PDF file.
 
+        Only the trailer, cross-reference and metadata objects are read (see metadata_scanner).
+
         Args:
-            filename (str): Path to the PDF file.
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
 
         Returns:
             Dict[str, Optional[str]]: A dictionary containing the PDF metadata.
@@ -96,281 +961,972 @@ class PDF_manager:
             "creation_date": None,
         }
 
-        try:
-            with open(filename, "rb") as pdf_file:
-                reader = PdfReader(pdf_file)
-                
-                # Extract metadata
-                metadata = reader.metadata
-                
-                # Populate the metadata dictionary
-                if metadata:
-                    metadatas["creator"] = metadata.get("/Creator")
-                    metadatas["producer"] = metadata.get("/Producer")
-                    metadatas["subject"] = metadata.get("/Subject")
-                    metadatas["author"] = metadata.get("/Author")
-                    metadatas["title"] = metadata.get("/Title")
-                    metadatas["creation_date"] = metadata.get("/CreationDate")
+        # Check the cache before parsing anything
+        file_hash = self._cache_hash(filename)
+        cached_metadatas = self._cache_get(file_hash, "metadata")
+        if cached_metadatas is not None:
+            return cached_metadatas
 
-        except Exception as e:
-            print(f"An error occurred while reading the PDF: {e}")
+        with self.instrumentation.span("metadata.parse"), ExitStack() as stack:
+            try:
+                record = scan_metadata(filename if isinstance(filename, (str, os.PathLike))
+                                       else _open_source(filename, stack))
+            except TypeError as e:
+                record = {"error": repr(e)}
+        if record["error"] is not None:
+            self.instrumentation.event("metadata.error", f"An error occurred while reading the PDF: {record['error']}",
+                                       "error", filename=_source_name(filename), error=record["error"])
             return metadatas
+
+        # Populate the metadata dictionary
+        for key in metadatas:
+            metadatas[key] = record[key]
+
+        if file_hash:
+            # Store the values as plain strings
+            self.cache.put(file_hash, "metadata",
+                           {key: None if value is None else str(value) for key, value in metadatas.items()})
         
         return metadatas
         ## End display_metadata() function ##
+
+    # Change the metadata of a pdf document
+    @instrumented("set_metadata")
+    def set_pdf_metadata(self, filename, output_pdf_path, metadata: Dict[str, Optional[str]],
+                         save_options: Optional[dict] = None):
+        """
+        Changes the document information of a PDF document.
+
+        Args:
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+            output_pdf_path: Path of the output PDF file (the input file itself for an in-place incremental
+                update), or a bytearray, writable memoryview, mmap or binary stream receiving it.
+            metadata (Dict[str, Optional[str]]): New values by key, among the keys of display_pdf_metadata();
+                None removes an entry.
+            save_options (Optional[dict]): "incremental", "object_streams" and "linearize" (see _save_pdf()).
+
+        Returns:
+            The output, as returned for output_pdf_path (the written part for a memoryview).
+        """
+        unknown = sorted(set(metadata) - set(metadata_entries))
+        if unknown:
+            raise ValueError(f"Unknown metadata keys: {unknown}")
+        self._count_read(filename)
+        with ExitStack() as stack:
+            pdf = _open_pdf(filename, stack)
+            fingerprints = object_fingerprints(pdf) if (save_options or {}).get("incremental") else None
+            for key, value in metadata.items():
+                if value is None:
+                    if metadata_entries[key] in pdf.docinfo:
+                        del pdf.docinfo[metadata_entries[key]]
+                else:
+                    pdf.docinfo[metadata_entries[key]] = value
+
+            with self.instrumentation.span("set_metadata.write"):
+                output, output_bytes = _save_pdf(pdf, filename, output_pdf_path, fingerprints, save_options)
+        self.instrumentation.count("bytes_written", output_bytes)
+        self.instrumentation.event("set_metadata.saved", f"Metadata saved as {_source_name(output_pdf_path)}",
+                                   output=_source_name(output_pdf_path), keys=sorted(metadata))
+        return output
+        ## End set_pdf_metadata() function ##
  
     # splitting pdf document and create a list of splitted files.
-    def splitting_pdf_document(self, filename: str) -> list:
+    @instrumented("split")
+    def splitting_pdf_document(self, filename, output_dir: Optional[str] = "./treated_documents",
+                               page_ranges: Optional[str] = None, chunk_size: Optional[int] = None,
+                               by_bookmarks: bool = False, max_chunk_bytes: Optional[int] = None,
+                               workers: int = 1, journal: Optional[Job_journal] = None,
+                               save_options: Optional[dict] = None) -> list:
         """
-        Splits a PDF document into individual pages and saves each page as a separate PDF file.
+        Splits a PDF document into chunks of pages and saves each chunk as a separate PDF file.
+
+        By default every page becomes a file. The source is parsed once per writer process and
+        each chunk is copied with its resources shared inside the chunk, so fonts and images used
+        by several pages of a chunk are written once. The achieved throughput is reported.
 
         Args:
-            filename (str): Path to the input PDF file.
+            filename: Path to the input PDF file, or the document in memory (bytes-like object or binary stream).
+            output_dir (Optional[str]): Directory of the split PDF files, or None to return the chunks
+                as bytes. Defaults to "./treated_documents".
+            page_ranges (Optional[str]): Chunks given as page ranges, e.g. "1-3,7,10-".
+            chunk_size (Optional[int]): Split into chunks of this many pages.
+            by_bookmarks (bool): Start a new chunk at each top-level bookmark. Defaults to False.
+            max_chunk_bytes (Optional[int]): Split into chunks of about this many bytes,
+                estimated from the average page size of the source.
+            workers (int): Number of processes writing chunks concurrently. Defaults to 1.
+            journal (Optional[Job_journal]): Journal of the job. Each chunk written is recorded in it,
+                and the chunks recorded by an earlier run of the same document are not written again.
+                Used when the document and the output are files.
+            save_options (Optional[dict]): "object_streams", "linearize" and "optimize" (see _save_pdf()),
+                applied to each chunk.
 
         Returns:
-            list: A list of file paths for the split PDF files.
+            list: A list of file paths for the split PDF files (their contents as bytes when output_dir
+                is None), in page order.
         """
         splitted_files = []  # List to store paths of the split PDF files
         
         # Create the output directory if it doesn't exist
-        os.makedirs("./treated_documents", exist_ok=True)
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
 
         try:
-            with open(filename, 'rb') as pdf_file:
-                reader = PdfReader(pdf_file)
-                
-                print(f"Splitting PDF file: {filename}")
-                print(f"Number of pages: {len(reader.pages)}")
-
-                for i, page in enumerate(reader.pages):
-                    writer = PdfWriter()
-                    writer.add_page(page)
-
-                    # Create a new filename for the split PDF
-                    base_name = os.path.basename(filename)  # Extract the file name (e.g., "document.pdf")
-                    name_without_ext = os.path.splitext(base_name)[0]  # Remove the extension (e.g., "document")
-                    new_filename = f'./treated_documents/{name_without_ext}_page_{i + 1}.pdf'
-
-                    # Save the new PDF file
-                    with open(new_filename, 'wb') as output_pdf:
-                        writer.write(output_pdf)
-                        
-                    # Add the new file path to the list
-                    splitted_files.append(new_filename)  
+            start_time = time.perf_counter()
+            self._count_read(filename)
+            with ExitStack() as stack:
+                pdf = _open_pdf(filename, stack)
+                pages_count = len(pdf.pages)
+
+                self.instrumentation.event("split.start", f"Splitting PDF file: {_source_name(filename)}",
+                                           filename=_source_name(filename))
+                self.instrumentation.event("split.pages", f"Number of pages: {pages_count}", pages=pages_count)
+
+                # Plan the chunks as (first_page, last_page) ranges
+                if page_ranges:
+                    ranges = parse_page_ranges(page_ranges, pages_count)
+                elif by_bookmarks:
+                    ranges = self._bookmark_page_ranges(filename, pages_count)
+                else:
+                    if max_chunk_bytes:
+                        average_page_bytes = max(_source_size(filename) or 0, 1) / max(pages_count, 1)
+                        chunk_size = max(1, int(max_chunk_bytes // average_page_bytes))
+                    chunk_size = chunk_size or 1
+                    ranges = [(first_page, min(first_page + chunk_size - 1, pages_count))
+                              for first_page in range(1, pages_count + 1, chunk_size)]
+
+                # Create a new filename for each chunk, none for chunks kept in memory
+                name_without_ext = _source_stem(filename)
+                chunks = []
+                for first_page, last_page in ranges:
+                    suffix = f"page_{first_page}" if first_page == last_page else f"pages_{first_page}-{last_page}"
+                    new_filename = None if output_dir is None else os.path.join(output_dir, f"{name_without_ext}_{suffix}.pdf")
+                    chunks.append((first_page, last_page, new_filename))
+
+                # The chunks written by an earlier run with the same save options are kept
+                written = []
+                pending_chunks = chunks
+                journal_key = options_key({"save_options": save_options or {}})
+                if journal is not None and output_dir is not None and isinstance(filename, (str, os.PathLike)):
+                    done_parts = journal.completed_parts("split", filename, journal_key)
+                    pending_chunks = []
+                    for first_page, last_page, new_filename in chunks:
+                        done = done_parts.get(_pages_part(first_page, last_page))
+                        if done is not None and done["output"] == os.path.abspath(new_filename):
+                            written.append((first_page, new_filename, done["size"]))
+                        else:
+                            pending_chunks.append((first_page, last_page, new_filename))
+                    if written:
+                        self.instrumentation.event("split.resume", f"Resuming: {len(written)} of {len(chunks)} "
+                                                   "chunks already written", chunks=len(written))
+                else:
+                    journal = None
+
+                # A single writer reuses the source already opened
+                with self.instrumentation.span("split.write", chunks=len(pending_chunks), workers=workers):
+                    if workers <= 1 or len(pending_chunks) <= 1:
+                        written.extend(_write_split_chunks(pdf, pending_chunks, journal, filename, save_options,
+                                                           journal_key))
+                    else:
+                        groups = [pending_chunks[i::workers] for i in range(workers)]
+                        worker_source = _worker_source(filename)
+                        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                            for group_written in executor.map(_write_split_chunks, [worker_source] * len(groups), groups,
+                                                              [journal] * len(groups), [filename] * len(groups),
+                                                              [save_options] * len(groups),
+                                                              [journal_key] * len(groups)):
+                                written.extend(group_written)
+                    written.sort(key=lambda chunk: chunk[0])
+
+            splitted_files = [new_filename for _, new_filename, _ in written]
+
+            # Report the throughput achieved
+            elapsed = max(time.perf_counter() - start_time, 1e-9)
+            pages_written = sum(last_page - first_page + 1 for first_page, last_page, _ in pending_chunks)
+            written_pages = {first_page for first_page, _, _ in pending_chunks}
+            bytes_written = sum(size for first_page, _, size in written if first_page in written_pages)
+            self.instrumentation.count("pages", pages_written)
+            self.instrumentation.count("bytes_written", bytes_written)
+            self.instrumentation.event(
+                "split.throughput",
+                f"Split {pages_written} pages into {len(splitted_files)} files in {elapsed:.2f} s "
+                f"({pages_written / elapsed:.1f} pages/s, {bytes_written / elapsed / 1e6:.2f} MB/s)",
+                pages=pages_written, files=len(splitted_files), bytes_written=bytes_written, elapsed_seconds=elapsed)
 
         except Exception as e:
-            print(f"An error occurred while splitting the PDF: {e}")
+            self.instrumentation.event("split.error", f"An error occurred while splitting the PDF: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
             return []
 
-        print(f"Split files list length: {len(splitted_files)}")
+        self.instrumentation.event("split.done", f"Split files list length: {len(splitted_files)}",
+                                   files=len(splitted_files))
         
         return splitted_files
     ## End function ##
+
+    # Page ranges starting at each top-level bookmark
+    def _bookmark_page_ranges(self, filename, pages_count: int) -> list:
+        with ExitStack() as stack:
+            reader = PyPDF2.PdfReader(_open_source(filename, stack))
+
+            # Nested lists hold the children of the previous bookmark and are skipped
+            starts = sorted({reader.get_destination_page_number(item) + 1
+                             for item in reader.outline if not isinstance(item, list)})
+        if not starts or starts[0] != 1:
+            starts.insert(0, 1)
+        return [(first_page, next_start - 1) for first_page, next_start in zip(starts, starts[1:] + [pages_count + 1])]
     
-    # Merging  pdf documents with PdfWriter    
-    def merge_pdf_documents(self, file_list: list, output_filename: str ) -> None:
+    # Merging  pdf documents with PdfWriter or pikepdf
+    @instrumented("merge")
+    def merge_pdf_documents(self, file_list: list, output_filename, max_open_readers: Optional[int] = None,
+                            deduplicate: bool = False, engine: str = "pypdf2",
+                            save_options: Optional[dict] = None) -> Optional[dict]:
         """
         Merges multiple PDF documents into a single PDF file.
 
         Args:
-            file_list (list): List of file paths for the PDFs to merge.
-            output_filename (str): Path to save the merged PDF file..
+            file_list (list): List of the PDFs to merge: file paths, or documents in memory
+                (bytes-like objects or binary streams).
+            output_filename: Path to save the merged PDF file, or a bytearray, writable memoryview,
+                mmap or binary stream receiving it.
+            max_open_readers (Optional[int]): Maximum number of source documents open at once.
+                Larger batches are merged in groups into temporary files first. Defaults to no limit.
+            deduplicate (bool): Write identical embedded objects (fonts, images, ICC profiles)
+                only once, comparing their content. Implies the pikepdf engine. Defaults to False.
+            engine (str): "pypdf2" (PdfWriter) or "pikepdf" (qpdf page copying). Defaults to "pypdf2".
+            save_options (Optional[dict]): "object_streams", "linearize" and "optimize" (see _save_pdf()),
+                applied to the merged document. Implies the pikepdf engine.
+
+        Returns:
+            Optional[dict]: The merge report with the keys "output_filename" (None for an in-memory output),
+                "documents", "pages",
+                "output_bytes", "deduplicated_objects", "elapsed_seconds" and "peak_rss_bytes"
+                (None where the platform cannot measure it), or None if the merge failed.
         """
-        # Create a PDF writer
-        pdf_writer = PdfWriter()
+        if deduplicate or save_options:
+            engine = "pikepdf"
+        if engine not in ("pypdf2", "pikepdf"):
+            raise ValueError(f"Unknown merge engine: {engine}")
+
+        start_time = time.perf_counter()
+        output_is_path = isinstance(output_filename, (str, os.PathLike))
         try:
-            # Add PDFs to merge
-            for pdf_file in file_list:
-                print(f"Adding {pdf_file} to the merge list...")
-                # create a reader for each page to merge
-                reader = PdfReader(pdf_file)
-                for page in reader.pages:
-                    pdf_writer.add_page(page) # each page read is added to the writer object.
+            output_dir = (os.path.dirname(output_filename) or ".") if output_is_path else None
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)  # Create output directory if it doesn't exist
 
-            # Save the merged PDF
-            os.makedirs(os.path.dirname(output_filename), exist_ok=True)  # Create output directory if it doesn't exist
-            with open(output_filename, 'wb') as output_file:
-                pdf_writer.write(output_file)
+            # Merge groups of at most max_open_readers documents until one group remains
+            with tempfile.TemporaryDirectory(dir=output_dir) as temporary_dir:
+                sources = list(file_list)
+                level = 0
+                while max_open_readers and len(sources) > max_open_readers:
+                    batches = [sources[i:i + max_open_readers] for i in range(0, len(sources), max_open_readers)]
+                    sources = []
+                    for batch_number, batch in enumerate(batches):
+                        partial_filename = os.path.join(temporary_dir, f"merge_{level}_{batch_number}.pdf")
+                        self._merge_batch(batch, partial_filename, engine, deduplicate=False)
+                        sources.append(partial_filename)
+                    level += 1
+                pages_count, deduplicated_objects, output_bytes = self._merge_batch(sources, output_filename,
+                                                                                    engine, deduplicate, save_options)
 
-            print(f"Merged PDF saved as {output_filename}")
+            # Report the output size and memory used
+            report = {
+                "output_filename": os.fspath(output_filename) if output_is_path else None,
+                "documents": len(file_list),
+                "pages": pages_count,
+                "output_bytes": output_bytes,
+                "deduplicated_objects": deduplicated_objects,
+                "elapsed_seconds": time.perf_counter() - start_time,
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+            for pdf_file in file_list:
+                self._count_read(pdf_file)
+            self.instrumentation.count("pages", pages_count)
+            self.instrumentation.count("bytes_written", report["output_bytes"])
+            self.instrumentation.event("merge.saved", f"Merged PDF saved as {_source_name(output_filename)}",
+                                       filename=report["output_filename"])
+            self.instrumentation.event(
+                "merge.report",
+                f"Merged {report['documents']} documents ({report['pages']} pages) into "
+                f"{report['output_bytes']} bytes in {report['elapsed_seconds']:.2f} s, "
+                f"{deduplicated_objects} duplicate objects removed, peak RSS: {report['peak_rss_bytes']} bytes",
+                **report)
+            return report
 
         except Exception as e:
-            print(f"An error occurred while merging PDFs: {e}")                    
+            self.instrumentation.event("merge.error", f"An error occurred while merging PDFs: {e}", "error",
+                                       error=repr(e))
+            return None
     ## End merge function
+
+    # Merge one group of documents, all open at the same time
+    def _merge_batch(self, file_list: list, output_filename, engine: str, deduplicate: bool,
+                     save_options: Optional[dict] = None) -> tuple:
+        if engine == "pikepdf":
+            with ExitStack() as stack:
+                merged_pdf = stack.enter_context(pikepdf.Pdf.new())
+                with self.instrumentation.span("merge.copy", documents=len(file_list)):
+                    for pdf_file in file_list:
+                        self.instrumentation.event("merge.add", f"Adding {_source_name(pdf_file)} to the merge list...",
+                                                   filename=_source_name(pdf_file))
+                        # The source stays open until the merged document is saved
+                        merged_pdf.pages.extend(_open_pdf(pdf_file, stack).pages)
+
+                with self.instrumentation.span("merge.deduplicate"):
+                    deduplicated_objects = deduplicate_pdf_objects(merged_pdf) if deduplicate else 0
+                with self.instrumentation.span("merge.write"):
+                    _, output_bytes = _save_pdf(merged_pdf, None, output_filename, save_options=save_options)
+                return (len(merged_pdf.pages), deduplicated_objects, output_bytes)
+
+        # The sources are read lazily, so they stay open until the merged document is saved
+        with ExitStack() as stack:
+            # Create a PDF writer
+            pdf_writer = PyPDF2.PdfWriter()
+            # Add PDFs to merge
+            with self.instrumentation.span("merge.copy", documents=len(file_list)):
+                for pdf_file in file_list:
+                    self.instrumentation.event("merge.add", f"Adding {_source_name(pdf_file)} to the merge list...",
+                                               filename=_source_name(pdf_file))
+                    # create a reader for each page to merge
+                    reader = PyPDF2.PdfReader(_open_source(pdf_file, stack))
+                    for page in reader.pages:
+                        pdf_writer.add_page(page) # each page read is added to the writer object.
+
+            # Save the merged PDF
+            with self.instrumentation.span("merge.write"):
+                _, output_bytes = _save_output(pdf_writer.write, output_filename)
+            return (len(pdf_writer.pages), 0, output_bytes)
         
+    # Making a pdf document smaller
+    @instrumented("optimize")
+    def optimize_pdf(self, filename, output_pdf_path=None, max_image_dpi: Optional[float] = None,
+                     jpeg_quality: Optional[int] = None, workers: int = 1, dry_run: bool = False,
+                     save_options: Optional[dict] = None) -> Optional[dict]:
+        """
+        Optimizes the size of a PDF document: removes the unused resources, shares the duplicate
+        objects, downsamples or recompresses the images (see pdf_optimizer.optimize_document()),
+        compresses the streams and packs the small objects into object streams.
+
+        Args:
+            filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+            output_pdf_path: Path of the optimized PDF file (the input file itself to replace it), or a
+                bytearray, writable memoryview, mmap or binary stream receiving it. Unused by dry runs.
+            max_image_dpi (Optional[float]): Downsample the images drawn above this resolution to it.
+                Defaults to None, keeping the resolution of the images.
+            jpeg_quality (Optional[int]): Recompress the 8-bit gray and RGB images as JPEG with this
+                quality, from 1 to 95. Defaults to None, keeping the images lossless.
+            workers (int): Number of processes resampling the images. Defaults to 1.
+            dry_run (bool): Only measure the size of the optimized document; nothing is written. Defaults to False.
+            save_options (Optional[dict]): "object_streams" (defaults to "generate") and "linearize" (see _save_pdf()).
+
+        Returns:
+            Optional[dict]: The report with the keys "output_filename" (None for an in-memory output and dry runs),
+                "input_bytes", "output_bytes" (the size the output would have, on dry runs), "bytes_saved",
+                "saved_ratio", "dry_run" and "elapsed_seconds", plus those of optimize_document(),
+                or None if the optimization failed.
+        """
+        save_options = save_options or {}
+        if save_options.get("object_streams", "generate") not in object_stream_modes:
+            raise ValueError(f"Unknown object streams mode: {save_options['object_streams']}")
+        if jpeg_quality is not None and not 1 <= jpeg_quality <= 95:
+            raise ValueError(f"The JPEG quality must be between 1 and 95: {jpeg_quality}")
+
+        start_time = time.perf_counter()
+        try:
+            input_bytes = _source_size(filename)
+            self._count_read(filename)
+            with ExitStack() as stack:
+                pdf = _open_pdf(filename, stack)
+                with self.instrumentation.span("optimize.document", dry_run=dry_run):
+                    report = optimize_document(pdf, max_image_dpi, jpeg_quality, workers)
+
+                # A dry run writes the document to a counter only
+                save_arguments = optimized_save_arguments(save_options.get("object_streams", "generate"))
+                with self.instrumentation.span("optimize.write", dry_run=dry_run):
+                    _, output_bytes = _save_output(
+                        lambda target: pdf.save(target, linearize=save_options.get("linearize", False), **save_arguments),
+                        _Byte_counter() if dry_run else output_pdf_path)
+
+            output_is_path = isinstance(output_pdf_path, (str, os.PathLike))
+            report = {
+                "output_filename": os.fspath(output_pdf_path) if output_is_path and not dry_run else None,
+                "input_bytes": input_bytes,
+                "output_bytes": output_bytes,
+                "bytes_saved": input_bytes - output_bytes if input_bytes is not None else None,
+                "saved_ratio": (input_bytes - output_bytes) / input_bytes if input_bytes else None,
+                "dry_run": dry_run,
+                **report,
+                "elapsed_seconds": time.perf_counter() - start_time,
+            }
+        except Exception as e:
+            self.instrumentation.event("optimize.error", f"An error occurred while optimizing the PDF: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+            return None
+
+        if not dry_run:
+            self.instrumentation.count("bytes_written", output_bytes)
+        saved = f"{report['bytes_saved']} bytes saved" if report["bytes_saved"] is not None else "size of the input unknown"
+        self.instrumentation.event(
+            "optimize.report",
+            f"{'Estimated size of' if dry_run else 'Optimized'} {_source_name(filename)}: {output_bytes} bytes ({saved}), "
+            f"{report['images_downsampled']} images downsampled, {report['images_recompressed']} recompressed, "
+            f"{report['deduplicated_objects']} duplicate objects and {report['resources_removed']} unused resources removed",
+            filename=_source_name(filename), **report)
+        return report
+        ## End optimize_pdf() function ##
+
+    # Rotating and cropping pages, editing the page dictionaries only
+    @instrumented("transform")
+    def transform_pages(self, source, output, rotation=None, crop_box=None, auto_crop: bool = False,
+                        margin: float = 0.0, pages=None, relative: bool = True, save_options: Optional[dict] = None):
+        """
+        Rotates and crops pages of a PDF document.
+
+        The rotations and boxes of all the pages are computed at once; only the /Rotate and
+        /CropBox entries of the pages change, and the content streams are copied as they are.
+
+        Args:
+            source: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+            output: Path of the output PDF file, or a bytearray, writable memoryview, mmap or binary
+                stream receiving it.
+            rotation: Clockwise rotation (a multiple of 90) of the selected pages, or a dictionary
+                mapping page selectors to their rotation, e.g. {"1-3": 90, 7: 180}.
+            crop_box: Crop box (left, bottom, right, top) of the selected pages, in the coordinates
+                of the page, or a dictionary mapping page selectors to their crop box.
+            auto_crop (bool): Crop the selected pages without a crop box to the bounding box of their
+                content. Blank pages are left as they are. Defaults to False.
+            margin (float): Space kept around the crop boxes, in points. Defaults to 0.
+            pages: Pages given the rotation, crop box or automatic crop (see _page_selection()).
+                Defaults to every page.
+            relative (bool): Add the rotations to the current ones instead of replacing them. Defaults to True.
+            save_options (Optional[dict]): "incremental", "object_streams" and "linearize" (see _save_pdf()).
+                An incremental update only appends the changed page dictionaries.
+
+        Returns:
+            The output, as returned for output (the written part for a memoryview).
+        """
+        if rotation is None and crop_box is None and not auto_crop:
+            raise ValueError("A rotation, a crop box or the automatic crop is required.")
+        self._count_read(source)
+        with ExitStack() as stack:
+            with self.instrumentation.span("transform.parse"):
+                pdf = _open_pdf(source, stack)
+                fingerprints = object_fingerprints(pdf) if (save_options or {}).get("incremental") else None
+            pages_count = len(pdf.pages)
+            angles, rotated = _page_values(rotation, pages_count, pages, 1)
+            boxes, cropped = _page_values(crop_box, pages_count, pages, 4)
+
+            # Read the rotation and media box of every page, and measure the content to crop to
+            with self.instrumentation.span("transform.measure", pages=pages_count, auto_crop=auto_crop):
+                current_rotations = np.zeros(pages_count, dtype=int)
+                mediaboxes = np.zeros((pages_count, 4))
+                selection = _page_selection(pages, pages_count) if auto_crop else None
+                for index, page in enumerate(pdf.pages):
+                    current_rotations[index] = int(page.obj.get("/Rotate", 0))
+                    mediaboxes[index] = [float(value) for value in page.mediabox]
+                    if auto_crop and not cropped[index] and (selection is None or index + 1 in selection):
+                        content_box = content_bounding_box(page)
+                        if content_box is not None:
+                            boxes[index], cropped[index] = content_box, True
+
+            # Rotations and crop boxes of all the pages at once
+            rotations = np.where(rotated, combine_rotations(current_rotations, angles[:, 0], relative),
+                                 current_rotations)
+            boxes[cropped] = resolve_crop_boxes(mediaboxes[cropped], boxes[cropped], margin)
+
+            # Only the page dictionaries change
+            with self.instrumentation.span("transform.apply"):
+                for index, page in enumerate(pdf.pages):
+                    if rotated[index]:
+                        page.obj.Rotate = int(rotations[index])
+                    if cropped[index]:
+                        page.cropbox = pikepdf.Array(boxes[index].tolist())
+
+            # The pages are written as the unchanged objects are copied from the source
+            with self.instrumentation.span("transform.write"):
+                result, output_bytes = _save_pdf(pdf, source, output, fingerprints, save_options)
+
+        self.instrumentation.count("pages", pages_count)
+        self.instrumentation.count("bytes_written", output_bytes)
+        self.instrumentation.event("transform.saved", f"Rotated {int(rotated.sum())} and cropped {int(cropped.sum())} "
+                                   f"pages, saved as {_source_name(output)}", rotated=int(rotated.sum()),
+                                   cropped=int(cropped.sum()), output=_source_name(output))
+        return result
+        ## End transform_pages function
+
     # Rotating pdf documents
-    def rotate_pdf(self, input_pdf_path: str, output_pdf_path: str, rotation_angle: float) -> None:
-        # Open the PDF file
-        with open(input_pdf_path, 'rb') as file:
-            reader = PdfReader(file)
-            writer = PdfWriter()
-
-            # Iterate through each page and rotate it
-            for page in reader.pages:
-                page.rotate(rotation_angle)
-                writer.add_page(page)
-
-            # Write the rotated pages to a new PDF
-            with open(output_pdf_path, 'wb') as output_file:
-                writer.write(output_file)
-            ## End rotate_pdf function
+    @instrumented("rotate")
+    def rotate_pdf(self, input_pdf_path, output_pdf_path, rotation_angle: int, pages=None,
+                   save_options: Optional[dict] = None):
+        """
+        Rotates pages of a PDF document.
+
+        Args:
+            input_pdf_path: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+            output_pdf_path: Path of the rotated PDF file, or a bytearray, writable memoryview, mmap
+                or binary stream receiving it.
+            rotation_angle (int): Clockwise rotation, a multiple of 90, or a dictionary mapping page
+                selectors to their rotation (see transform_pages()).
+            pages: Pages to rotate (see _page_selection()). Defaults to every page.
+            save_options (Optional[dict]): "incremental", "object_streams" and "linearize" (see _save_pdf()).
+
+        Returns:
+            The output, as returned for output_pdf_path (the written part for a memoryview).
+        """
+        return self.transform_pages(input_pdf_path, output_pdf_path, rotation=rotation_angle, pages=pages,
+                                    save_options=save_options)
+        ## End rotate_pdf function
                      
     # Encrypts a PDF file using AES-256 encryption more secure for sensitive data than PyPDF2 AES-128
     # Require the installation of pikepdf module 
-    def encrypt_pdf_aes256(self, filename: str) -> None:
+    @instrumented("encrypt")
+    def encrypt_pdf_aes256(self, filename, password: Optional[str] = None, output_pdf_path=None) -> bool:
         """
         Encrypts a PDF file using AES-256 encryption.
 
         Args:
-            filename (str): Path to the input PDF file.
+            filename: Path to the input PDF file, or the document in memory (bytes-like object or binary stream).
+            password (Optional[str]): Password protecting the output. Prompted for when None.
+            output_pdf_path: Path of the encrypted PDF file, or a bytearray, writable memoryview, mmap
+                or binary stream receiving it. Prompted for when None.
+
+        Returns:
+            bool: True when the encrypted PDF was saved.
         """
         # Prompt user for password
-        password = input("Enter your password: ")
+        if password is None:
+            password = input("Enter your password: ")
 
         try:
             # Open the PDF
-            with Pdf.open(filename) as pdf:
+            with ExitStack() as stack:
+                with self.instrumentation.span("encrypt.parse"):
+                    pdf = _open_pdf(filename, stack)
+
                 # Prompt user for output file path
-                output_pdf_path = input("Enter the output PDF document path: ")
+                if output_pdf_path is None:
+                    output_pdf_path = input("Enter the output PDF document path: ")
 
                 # Encrypt the PDF with AES-256
-                pdf.save(
-                    output_pdf_path,
-                    encryption=pikepdf.Encryption(
-                        owner=password,  # Owner password (for permissions)
-                        user=password,   # User password (to open the file)
-                        R=6,             # Use AES-256 encryption (R=6)
-                    ),
+                encryption = pikepdf.Encryption(
+                    owner=password,  # Owner password (for permissions)
+                    user=password,   # User password (to open the file)
+                    R=6,             # Use AES-256 encryption (R=6)
                 )
-                print(f"PDF encrypted with AES-256 and saved as {output_pdf_path}")
+                with self.instrumentation.span("encrypt.write"):
+                    _, output_bytes = _save_output(lambda output: pdf.save(output, encryption=encryption),
+                                                   output_pdf_path)
+                self.instrumentation.count("pages", len(pdf.pages))
+                self._count_read(filename)
+                self.instrumentation.count("bytes_written", output_bytes)
+                self.instrumentation.event("encrypt.saved",
+                                           f"PDF encrypted with AES-256 and saved as {_source_name(output_pdf_path)}",
+                                           filename=_source_name(filename), output=_source_name(output_pdf_path))
+                return True
 
-        except PasswordError as e:
-            print(f"Password error: {e}")
-        except FileNotFoundError:
-            print(f"Error: The file '{filename}' does not exist.")
+        except pikepdf.PasswordError as e:
+            self.instrumentation.event("encrypt.error", f"Password error: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+        except FileNotFoundError as e:
+            self.instrumentation.event("encrypt.error", f"Error: The file '{filename}' does not exist.", "error",
+                                       filename=_source_name(filename), error=repr(e))
         except Exception as e:
-            print(f"An error occurred: {e}")
+            self.instrumentation.event("encrypt.error", f"An error occurred: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+        return False
         ## End function 
                         
    
     # decrypting pdf
-    def decrypt_pdf_aes256(self, filename: str) -> None:
+    @instrumented("decrypt")
+    def decrypt_pdf_aes256(self, filename, password: Optional[str] = None, output_pdf_path=None) -> bool:
         """
             Decrypts a PDF file encrypted with AES-256.
 
             Args:
-                filename (str): Path to the encrypted PDF file.
+                filename: Path to the encrypted PDF file, or the document in memory (bytes-like object
+                    or binary stream).
+                password (Optional[str]): Password of the PDF file. Prompted for when None.
+                output_pdf_path: Path of the decrypted PDF file, or a bytearray, writable memoryview, mmap
+                    or binary stream receiving it. Prompted for when None.
+
+            Returns:
+                bool: True when the decrypted PDF was saved.
         """
         # Prompt user for password
-        password = input("Enter the password to decrypt the PDF: ")
+        if password is None:
+            password = input("Enter the password to decrypt the PDF: ")
 
         try:
             # Open the encrypted PDF
-            with Pdf.open(filename, password=password) as pdf:
+            with ExitStack() as stack:
+                with self.instrumentation.span("decrypt.parse"):
+                    pdf = _open_pdf(filename, stack, password=password)
+
                 # Prompt user for output file path
-                output_pdf_path = input("Enter the output PDF document path: ")
+                if output_pdf_path is None:
+                    output_pdf_path = input("Enter the output PDF document path: ")
 
                 # Save the decrypted PDF
-                pdf.save(output_pdf_path)
-                print(f"PDF decrypted and saved as {output_pdf_path}")
+                with self.instrumentation.span("decrypt.write"):
+                    _, output_bytes = _save_output(pdf.save, output_pdf_path)
+                self.instrumentation.count("pages", len(pdf.pages))
+                self._count_read(filename)
+                self.instrumentation.count("bytes_written", output_bytes)
+                self.instrumentation.event("decrypt.saved", f"PDF decrypted and saved as {_source_name(output_pdf_path)}",
+                                           filename=_source_name(filename), output=_source_name(output_pdf_path))
+                return True
 
-        except PasswordError:
-            print("Error: Incorrect password. Decryption failed.")
-        except FileNotFoundError:
-            print(f"Error: The file '{filename}' does not exist.")
+        except pikepdf.PasswordError as e:
+            self.instrumentation.event("decrypt.error", "Error: Incorrect password. Decryption failed.", "error",
+                                       filename=_source_name(filename), error=repr(e))
+        except FileNotFoundError as e:
+            self.instrumentation.event("decrypt.error", f"Error: The file '{filename}' does not exist.", "error",
+                                       filename=_source_name(filename), error=repr(e))
         except Exception as e:
-            print(f"An error occurred: {e}")
+            self.instrumentation.event("decrypt.error", f"An error occurred: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+        return False
         ## End of function ##
             
+    # Encrypt many pdf documents with AES-256 over a pool of worker processes
+    @instrumented("bulk_encrypt")
+    def bulk_encrypt_pdfs(self, jobs: list, key_provider: Callable, workers: Optional[int] = None,
+                          retries: int = 2) -> list:
+        """
+        Encrypts a batch of PDF documents with AES-256.
+
+        Args:
+            jobs (list): (source, destination) pairs. A source is a file path, a bytes-like object or a
+                binary stream; a destination is a file path, a bytearray, writable memoryview, mmap or
+                binary stream (e.g. BytesIO), or None to get the output back in the result. Buffers
+                keep the documents off the disk.
+            key_provider (Callable): Called with the source of each job, returns its password.
+            workers (Optional[int]): Number of worker processes. Defaults to the number of CPUs.
+            retries (int): Further attempts for a document that failed. Defaults to 2.
+
+        Returns:
+            list: A result per job, in order, with the keys "destination", "ok", "attempts",
+                "error" and "data" (output content when the destination is None).
+        """
+        return self._bulk_crypt("encrypt", jobs, key_provider, workers, retries)
+
+    # Decrypt many pdf documents over a pool of worker processes
+    @instrumented("bulk_decrypt")
+    def bulk_decrypt_pdfs(self, jobs: list, key_provider: Callable, workers: Optional[int] = None,
+                          retries: int = 2) -> list:
+        """
+        Decrypts a batch of AES-256 encrypted PDF documents.
+
+        Args:
+            jobs (list): (source, destination) pairs, see bulk_encrypt_pdfs().
+            key_provider (Callable): Called with the source of each job, returns its password.
+            workers (Optional[int]): Number of worker processes. Defaults to the number of CPUs.
+            retries (int): Further attempts for a document that failed. A wrong password is not retried.
+                Defaults to 2.
+
+        Returns:
+            list: A result per job, in order, see bulk_encrypt_pdfs().
+        """
+        return self._bulk_crypt("decrypt", jobs, key_provider, workers, retries)
+
+    # Run the encryption or decryption jobs and deliver their outputs
+    def _bulk_crypt(self, operation: str, jobs: list, key_provider: Callable, workers: Optional[int],
+                    retries: int) -> list:
+        workers = workers or os.cpu_count() or 1
+        results = [None] * len(jobs)
+
+        # Credentials are resolved here, so the key provider does not have to be picklable
+        tasks = []
+        for index, (source, destination) in enumerate(jobs):
+            try:
+                password = key_provider(source)
+            except Exception as e:
+                results[index] = {"destination": destination, "ok": False, "attempts": 0,
+                                  "error": f"No password: {e}", "data": None}
+                continue
+            output_pdf_path = os.fspath(destination) if isinstance(destination, (str, os.PathLike)) else None
+            tasks.append((index, (operation, _worker_source(source), password, output_pdf_path, retries)))
+
+        # Run the tasks in this process when a single worker is asked for
+        if workers <= 1:
+            outcomes = ((index, _crypt_document(*arguments)) for index, arguments in tasks)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            futures = {executor.submit(_crypt_document, *arguments): index for index, arguments in tasks}
+            outcomes = ((futures[future], _crypt_outcome(future)) for future in as_completed(futures))
+
+        try:
+            for index, outcome in outcomes:
+                destination = jobs[index][1]
+                # Hand the output to the buffer of the job
+                if outcome["ok"] and destination is not None and outcome["data"] is not None:
+                    try:
+                        destination, _ = _save_output(lambda output: output.write(outcome["data"]), destination)
+                        outcome["data"] = None
+                    except Exception as e:
+                        outcome.update(ok=False, error=f"The output could not be written: {e}")
+                outcome["destination"] = destination
+                results[index] = outcome
+                self.instrumentation.count("documents" if outcome["ok"] else "failures", operation=operation)
+                self.instrumentation.event(
+                    f"bulk_{operation}.job",
+                    f"{operation.capitalize()}ion {'succeeded' if outcome['ok'] else 'failed'} "
+                    f"for job {index + 1}/{len(jobs)}" + (f": {outcome['error']}" if outcome["error"] else ""),
+                    "info" if outcome["ok"] else "error",
+                    job=index, ok=outcome["ok"], attempts=outcome["attempts"], error=outcome["error"])
+        finally:
+            if workers > 1:
+                executor.shutdown()
+
+        return results
+        ## End _bulk_crypt() function ##
+
     # extract images from pdf documents
-    def extract_images_from_pdf(self, filename: str, output_dir: str = "extracted_images") -> None:
+    @instrumented("extract_images")
+    def extract_images_from_pdf(self, filename, output_dir: Optional[str] = "extracted_images",
+                                raw_streams: bool = False, workers: int = 4,
+                                journal: Optional[Job_journal] = None) -> Optional[dict]:
         """
             Extracts images from a PDF document and saves them to a specified directory.
+
+            Image XObjects are enumerated once per document, including those of nested forms, and
+            deduplicated by object and by content hash: an image used on many pages is written once.
+            JPEG and JPEG 2000 streams are written as-is; other images are decoded to PNG (Pillow
+            required) unless raw_streams is set. A JSON manifest mapping the pages to their images
+            is written next to the images as "<name>_manifest.json".
+
             Args:
-                filename (str): Path to the PDF file.
-                output_dir (str): Directory to save the extracted images. Defaults to "extracted_images".
+                filename: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+                output_dir (Optional[str]): Directory to save the extracted images, or None to return their
+                    content in the manifest instead. Defaults to "extracted_images".
+                raw_streams (bool): Write the raw stream bytes of every image instead of decoding them.
+                    Defaults to False.
+                workers (int): Number of threads writing the images. Defaults to 4.
+                journal (Optional[Job_journal]): Journal of the job. Each image written is recorded in it,
+                    and the images recorded by an earlier run of the same document are neither decoded
+                    nor written again. Used when the document and the output are files.
+
+            Returns:
+                Optional[dict]: The manifest, with the keys "source", "pages" (page number to image
+                    identifiers) and "images" (identifier to "filename", "size", "width", "height",
+                    "filter" and "pages", plus "data" when output_dir is None), or None if the PDF
+                    could not be read.
         """
         # Create the output directory if it doesn't exist
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
+        output_path = Path(output_dir) if output_dir is not None else None
+        if output_path is not None:
+            output_path.mkdir(parents=True, exist_ok=True)
+            manifest_path = output_path / f"{_source_stem(filename)}_manifest.json"
+
+        # Skip the document when the images of its cached manifest are all in the output directory
+        file_hash = self._cache_hash(filename)
+        if file_hash and output_path is not None:
+            manifest = self._cache_get(file_hash, "images")
+            if manifest is not None and all(
+                (output_path / image["filename"]).is_file()
+                and (output_path / image["filename"]).stat().st_size == image["size"]
+                for image in manifest["images"].values()
+            ):
+                with atomic_output(manifest_path, "w", encoding="utf-8") as manifest_file:
+                    json.dump(manifest, manifest_file, indent=2)
+                self.instrumentation.event(
+                    "extract_images.done",
+                    f"Extraction complete. Total images extracted: {len(manifest['images'])} (already extracted)",
+                    images=len(manifest["images"]), cached=True)
+                return manifest
 
         # Generate PDF file reader
+        stack = ExitStack()
         try:
-            reader = PdfReader(filename)
+            self._count_read(filename)
+            pdf = _open_pdf(filename, stack)
         except Exception as e:
-            print(f"Failed to read the PDF file: {e}")
-            return
+            stack.close()
+            self.instrumentation.event("extract_images.error", f"Failed to read the PDF file: {e}", "error",
+                                       filename=_source_name(filename), error=repr(e))
+            return None
+
+        manifest = {"source": _source_name(filename), "pages": {}, "images": {}}
+        image_ids = {}  # Object number and generation to image identifier
+        # Images written by an earlier run of the job
+        if journal is not None and output_path is not None and isinstance(filename, (str, os.PathLike)):
+            done_parts = journal.completed_parts("extract-images", filename)
+        else:
+            journal, done_parts = None, {}
+        failed = False
+        pending_writes = threading.BoundedSemaphore(workers * 2)  # Images decoded but not yet written
+
+        with stack, ThreadPoolExecutor(max_workers=workers) as executor:
+            self.instrumentation.event("extract_images.pages",
+                                       f"PDF document contains {len(pdf.pages)} pages to search for images.",
+                                       pages=len(pdf.pages))
+            futures = {}
+
+            # Iterate through each page in the PDF
+            for page_num, page in enumerate(pdf.pages, start=1):
+                page_images = manifest["pages"].setdefault(str(page_num), [])
+
+                for image in _iter_image_xobjects(page.obj.get("/Resources")):
+                    # The same object seen on an earlier page
+                    image_id = image_ids.get(image.objgen) if image.is_indirect else None
+                    if image_id is None:
+                        raw_bytes = image.read_raw_bytes()
+                        image_id = hashlib.sha256(raw_bytes).hexdigest()[:16]
+                        if image.is_indirect:
+                            image_ids[image.objgen] = image_id
 
-        print(f"PDF document contains {len(reader.pages)} pages to search for images.")
+                        # An image written by an earlier run of the job
+                        part = f"image {image_id}{' raw' if raw_streams else ''}"
+                        if image_id not in manifest["images"] and part in done_parts:
+                            image_filter = image.get("/Filter")
+                            manifest["images"][image_id] = {
+                                "filename": os.path.basename(done_parts[part]["output"]),
+                                "size": done_parts[part]["size"],
+                                "width": int(image.get("/Width", 0)),
+                                "height": int(image.get("/Height", 0)),
+                                "filter": str(image_filter) if image_filter is not None else None,
+                                "pages": [],
+                            }
 
-        total_images_extracted = 0
+                        # A new image: decode it here and leave the writing to the pool
+                        if image_id not in manifest["images"]:
+                            try:
+                                with self.instrumentation.span("extract_images.decode", page=page_num):
+                                    extension, data = _image_file_content(image, raw_bytes, raw_streams)
+                            except Exception as e:
+                                self.instrumentation.event(
+                                    "extract_images.decode_error",
+                                    f"Failed to decode image {image_id} from page {page_num}: {e}", "error",
+                                    image=image_id, page=page_num, error=repr(e))
+                                failed = True
+                                continue
+                            image_filename = f"image_{image_id}{extension}"
+                            image_filter = image.get("/Filter")
+                            manifest["images"][image_id] = {
+                                "filename": image_filename,
+                                "size": None,
+                                "width": int(image.get("/Width", 0)),
+                                "height": int(image.get("/Height", 0)),
+                                "filter": str(image_filter) if image_filter is not None else None,
+                                "pages": [],
+                            }
+                            if output_path is None:
+                                # Kept in memory: the manifest carries the content
+                                manifest["images"][image_id].update(size=len(data), data=data)
+                                self.instrumentation.count("images")
+                            else:
+                                pending_writes.acquire()
+                                future = executor.submit(_write_image_file, output_path / image_filename, data)
+                                future.add_done_callback(lambda _: pending_writes.release())
+                                futures[future] = (image_id, part)
 
-        # Iterate through each page in the PDF
-        for page_num, page in enumerate(reader.pages, start=1):
-            print(f"Processing page {page_num}...")
-            image_count = 0  # Image count for the current page
+                    if image_id in manifest["images"] and image_id not in page_images:
+                        page_images.append(image_id)
+                        manifest["images"][image_id]["pages"].append(page_num)
 
-            # Iterate through each image in the page
-            for image_file_object in page.images:
+            # Wait for the writes and record the sizes
+            for future in as_completed(futures):
+                image_id, part = futures[future]
                 try:
-                    # Create a unique filename for the image
-                    image_filename = f"page{page_num}_image{image_count}_{image_file_object.name}"
-                    image_path = output_path / image_filename
-
-                    # Save the image to the output directory
-                    with open(image_path, "wb") as fp:
-                        fp.write(image_file_object.data)
-                        print(f"Image saved: {image_filename}")
-                        image_count += 1
-                        total_images_extracted += 1
+                    manifest["images"][image_id]["size"] = future.result()
+                    if journal is not None:
+                        journal.record_part("extract-images", filename, part,
+                                            str(output_path / manifest["images"][image_id]["filename"]),
+                                            manifest["images"][image_id]["size"])
+                    self.instrumentation.count("images")
+                    self.instrumentation.count("bytes_written", manifest["images"][image_id]["size"])
+                    self.instrumentation.event("extract_images.saved",
+                                               f"Image saved: {manifest['images'][image_id]['filename']}",
+                                               image=image_id)
                 except Exception as e:
-                    print(f"Failed to save image {image_file_object.name} from page {page_num}: {e}")
-        print(f"Extraction complete. Total images extracted: {total_images_extracted}")
+                    self.instrumentation.event("extract_images.write_error", f"Failed to save image {image_id}: {e}",
+                                               "error", image=image_id, error=repr(e))
+                    del manifest["images"][image_id]
+                    failed = True
+
+        # Drop the images that could not be saved from the pages
+        for page_images in manifest["pages"].values():
+            page_images[:] = [image_id for image_id in page_images if image_id in manifest["images"]]
+        if output_path is not None:
+            with atomic_output(manifest_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(manifest, manifest_file, indent=2)
+
+        # Only a complete extraction to files is recorded
+        if file_hash and not failed and output_path is not None:
+            self.cache.put(file_hash, "images", manifest)
+        total_references = sum(len(page_images) for page_images in manifest["pages"].values())
+        self.instrumentation.count("pages", len(manifest["pages"]))
+        self.instrumentation.event("extract_images.done",
+                                   f"Extraction complete. Total images extracted: {len(manifest['images'])} "
+                                   f"({total_references} uses across pages)",
+                                   images=len(manifest["images"]), references=total_references, cached=False)
+        return manifest
+        ## End extract_images_from_pdf() function ##
             
     # Cropping pdf document
-    def cropping_pdf_document(self, filename: str) -> None:
-        # filename access
-        filename = input("Enter the filename of the pdf document: ")
-        # Reading the pdf file
-        reader = PdfReader(filename)
-        writer = PdfWriter()
-
-        # add page 1 from reader to output document, unchanged:
-        writer.add_page(reader.pages[0])
-
-        # add page 2 from reader, but rotated clockwise 90 degrees:
-        writer.add_page(reader.pages[1].rotate(90))
-
-        # add page 3 from reader, but crop it to half size:
-        page3 = reader.pages[2]
-        page3.mediabox.upper_right = (
-            page3.mediabox.right / 2,
-            page3.mediabox.top / 2,
-        )
-        writer.add_page(page3)
-        writer.add_js("this.print({bUI:true,bSilent:false,bShrinkToFit:true});")
+    @instrumented("crop")
+    def cropping_pdf_document(self, filename, output_pdf_path=None, crop_box=None, pages=None, margin: float = 0.0,
+                              save_options: Optional[dict] = None):
+        """
+        Crops pages of a PDF document, to a box or to their content.
+
+        Args:
+            filename: Path to the input PDF file, or the document in memory (bytes-like object or binary stream).
+            output_pdf_path: Path of the output PDF file, or a bytearray, writable memoryview, mmap or
+                binary stream receiving it. Defaults to "./treated_documents/<name>_cropped.pdf".
+            crop_box: Crop box (left, bottom, right, top) in the coordinates of the page, or a dictionary
+                mapping page selectors to their crop box (see transform_pages()). Defaults to
+                cropping each page to the bounding box of its content.
+            pages: Pages to crop (see _page_selection()). Defaults to every page.
+            margin (float): Space kept around the crop boxes, in points. Defaults to 0.
+            save_options (Optional[dict]): "incremental", "object_streams" and "linearize" (see _save_pdf()).
+
+        Returns:
+            The output: the path of the output PDF file, or the buffer or stream given
+                (the written part for a memoryview).
+        """
+        if output_pdf_path is None:
+            output_pdf_path = f"./treated_documents/{_source_stem(filename)}_cropped.pdf"
+        output = self.transform_pages(filename, output_pdf_path, crop_box=crop_box, auto_crop=crop_box is None,
+                                      margin=margin, pages=pages, save_options=save_options)
+
+        self.instrumentation.event("crop.saved", f"Cropped PDF saved as {_source_name(output_pdf_path)}",
+                                   output=_source_name(output_pdf_path))
+        return output
         ## End of the function croppin_pdf_document() ##
         
     # Create a watermark pdf page   
-    def create_watermark_pdf(self, text: str) -> BytesIO:
-        "Create a PDF with the watermark text."
+    def create_watermark_pdf(self, text: str, pagesize: tuple = letter, rotation: int = 0) -> BytesIO:
+        """
+        Create a PDF with the watermark text.
+
+        Args:
+            text (str): Watermark text.
+            pagesize (tuple): Width and height of the page, in points. Defaults to letter.
+            rotation (int): /Rotate of the pages to stamp; the text is turned so that it reads
+                at 45 degrees once the page is displayed. Defaults to 0.
+
+        Returns:
+            BytesIO: The watermark PDF document.
+        """
         # Create a canvas
         packet = BytesIO()
-        can = canvas.Canvas(packet, pagesize=letter)
+        can = canvas.Canvas(packet, pagesize=pagesize)
         
         # Set font, size, and opacity of the watermark text
         can.setFont("Helvetica", 50)
         can.setFillColorRGB(0.5, 0, 0, alpha=0.3)  # Gray color with 30% opacity
         
         # Calculate the center of the page
-        page_width, page_height = letter
+        page_width, page_height = pagesize
         text_width = can.stringWidth(text, "Helvetica", 50)
         text_height = 50  # Approximate height of the text
         
         # Rotate the text and position it in the center of the canvas
         can.saveState()
         can.translate(page_width / 2, page_height / 2)  # Move to the center of the page
-        can.rotate(45)  # Rotate the text
+        can.rotate(45 + rotation)  # Rotate the text, compensating the rotation of the page
         can.drawString(-text_width / 2, -text_height / 2, text)  # Draw the watermark text centered
         can.restoreState()
         
@@ -378,31 +1934,197 @@ class PDF_manager:
         can.save()
         packet.seek(0)
         return packet
+
+    # Create a watermark pdf page from an image
+    def create_image_watermark_pdf(self, image_path: str, pagesize: tuple = letter, rotation: int = 0) -> BytesIO:
+        """
+        Create a PDF with the watermark image centered on the page.
+
+        Args:
+            image_path (str): Path to the image file (JPEG, or any format Pillow reads).
+            pagesize (tuple): Width and height of the page, in points. Defaults to letter.
+            rotation (int): /Rotate of the pages to stamp; the image is turned to be upright
+                once the page is displayed. Defaults to 0.
+
+        Returns:
+            BytesIO: The watermark PDF document.
+        """
+        packet = BytesIO()
+        can = canvas.Canvas(packet, pagesize=pagesize)
+        can.setFillAlpha(0.3)  # 30% opacity
+
+        # Fit the image in half of the displayed page, keeping its aspect ratio
+        page_width, page_height = pagesize
+        if rotation % 180:
+            page_width, page_height = page_height, page_width
+        can.saveState()
+        can.translate(pagesize[0] / 2, pagesize[1] / 2)
+        can.rotate(rotation)
+        can.drawImage(image_path, -page_width / 4, -page_height / 4, page_width / 2, page_height / 2,
+                      preserveAspectRatio=True, anchor="c", mask="auto")
+        can.restoreState()
+
+        can.save()
+        packet.seek(0)
+        return packet
+
+    # Form XObject of the watermark for one page size and rotation, rendered once per manager
+    def _watermark_template(self, pdf: pikepdf.Pdf, templates: dict, stack: ExitStack, page_key: tuple,
+                            watermark_text: Optional[str], watermark_image: Optional[str],
+                            watermark_pdf: Optional[str]):
+        # A PDF watermark is scaled to each page, so a single template serves every size
+        if watermark_pdf:
+            page_key = None
+        if page_key in templates:
+            return templates[page_key]
+
+        # Render the watermark document unless this manager recently did, from the same files
+        render_key = (watermark_text, watermark_image, _file_state(watermark_image),
+                      watermark_pdf, _file_state(watermark_pdf), page_key)
+        if render_key in self._watermark_renders:
+            self._watermark_renders.move_to_end(render_key)
+        else:
+            with self.instrumentation.span("watermark.render", page_size=page_key):
+                if watermark_pdf:
+                    with open(watermark_pdf, "rb") as watermark_file:
+                        packet = BytesIO(watermark_file.read())
+                elif watermark_image:
+                    packet = self.create_image_watermark_pdf(watermark_image, page_key[:2], page_key[2])
+                else:
+                    packet = self.create_watermark_pdf(watermark_text, page_key[:2], page_key[2])
+                self._watermark_renders[render_key] = packet.getvalue()
+                if len(self._watermark_renders) > self.watermark_renders_kept:
+                    self._watermark_renders.popitem(last=False)
+
+        # The watermark document must stay open until the stamped document is saved
+        watermark_document = stack.enter_context(pikepdf.Pdf.open(BytesIO(self._watermark_renders[render_key])))
+        templates[page_key] = pdf.copy_foreign(watermark_document.pages[0].as_form_xobject())
+        return templates[page_key]
     
+    # Stamp the shared watermark of the box size and page rotation over a box of a page
+    def _stamp_watermark(self, pdf: pikepdf.Pdf, page, templates: dict, stack: ExitStack, box,
+                         watermark_text: Optional[str], watermark_image: Optional[str],
+                         watermark_pdf: Optional[str]) -> None:
+        rotation = int(page.obj.get("/Rotate", 0)) % 360
+        page_key = (round(float(box[2]) - float(box[0]), 2), round(float(box[3]) - float(box[1]), 2), rotation)
+        template = self._watermark_template(pdf, templates, stack, page_key,
+                                            watermark_text, watermark_image, watermark_pdf)
+
+        # Reference the shared watermark from the page. Unlike page.add_overlay(), the existing
+        # content streams are wrapped by new ones instead of being decoded and merged into one.
+        # Text and image watermarks are rendered for the rotation of the page already; a PDF
+        # watermark is turned by the placement.
+        name = page.add_resource(template, pikepdf.Name.XObject)
+        placement = page.calc_form_xobject_placement(template, name, pikepdf.Rectangle(*[float(value) for value in box]),
+                                                     invert_transformations=bool(watermark_pdf))
+        page.contents_add(b"q\n", prepend=True)
+        page.contents_add(b"Q\n" + placement, prepend=False)
+
     # adding watermark to pdf pages
-    def add_watermark(self, input_pdf_path, output_pdf_path):
+    @instrumented("watermark")
+    def add_watermark(self, input_pdf_path, output_pdf_path, watermark_text: Optional[str] = None,
+                      watermark_image: Optional[str] = None, watermark_pdf: Optional[str] = None,
+                      save_options: Optional[dict] = None) -> int:
+        """
+        Stamps a watermark on every page of a PDF document.
+
+        The watermark covers the visible area of each page (its crop box). It is rendered once per
+        distinct size and rotation into a Form XObject, and every page of that size references
+        the same XObject; the existing content streams of the pages are left untouched.
+
+        Args:
+            input_pdf_path: Path to the PDF file to watermark, or the document in memory (bytes-like object
+                or binary stream).
+            output_pdf_path: Path of the watermarked PDF file, or a bytearray, writable memoryview, mmap
+                or binary stream receiving it.
+            watermark_text (Optional[str]): Watermark text. Prompted for when no watermark is given.
+            watermark_image (Optional[str]): Path to an image used as watermark instead of text.
+            watermark_pdf (Optional[str]): Path to a PDF whose first page is used as watermark,
+                scaled to each page.
+            save_options (Optional[dict]): "incremental", "object_streams" and "linearize" (see _save_pdf()).
+                An incremental update appends the watermark and the page dictionaries referencing it.
+
+        Returns:
+            int: Number of pages watermarked.
+        """
         # Create the watermark PDF
-        watermark_text = input("Type watermark text here: ")
-        watermark_pdf = self.create_watermark_pdf(watermark_text)
-        
-        # Add the watermark to each page of the input PDF.
-        # retrieve watermark page
-        watermark_reader = PdfReader(watermark_pdf)
-        watermark_page = watermark_reader.pages[0]
-
-        # retrieveing pdf document to watermark
-        reader = PdfReader(input_pdf_path)
-        writer = PdfWriter()
-
-        # Watermark each page of the original pdf document
-        for page in reader.pages:
-            # Merge the watermark with the page
-            page.merge_page(watermark_page)
-            writer.add_page(page)
-
-        # Save the watermarked PDF to a file
-        with open(output_pdf_path, 'wb') as output_file:
-            writer.write(output_file)
+        if watermark_text is None and watermark_image is None and watermark_pdf is None:
+            watermark_text = input("Type watermark text here: ")
+
+        with ExitStack() as stack:
+            # retrieveing pdf document to watermark
+            pdf = _open_pdf(input_pdf_path, stack)
+            fingerprints = object_fingerprints(pdf) if (save_options or {}).get("incremental") else None
+            templates = {}  # Form XObjects of this document, per page size and rotation
+
+            # Watermark each page of the original pdf document
+            with self.instrumentation.span("watermark.stamp", pages=len(pdf.pages)):
+                for page in pdf.pages:
+                    self._stamp_watermark(pdf, page, templates, stack, page.cropbox,
+                                          watermark_text, watermark_image, watermark_pdf)
+
+            # Save the watermarked PDF
+            with self.instrumentation.span("watermark.write"):
+                _, output_bytes = _save_pdf(pdf, input_pdf_path, output_pdf_path, fingerprints, save_options)
+            self.instrumentation.count("pages", len(pdf.pages))
+            self._count_read(input_pdf_path)
+            self.instrumentation.count("bytes_written", output_bytes)
+            return len(pdf.pages)
+
+    # adding watermark to every pdf document of a directory
+    @instrumented("watermark_directory")
+    def add_watermark_to_directory(self, input_dir: str, output_dir: str, watermark_text: Optional[str] = None,
+                                   watermark_image: Optional[str] = None, watermark_pdf: Optional[str] = None) -> list:
+        """
+        Watermarks every PDF document of a directory, reusing the rendered watermarks.
+
+        Args:
+            input_dir (str): Directory of the PDF files to watermark.
+            output_dir (str): Directory of the watermarked PDF files, saved under the same names.
+            watermark_text (Optional[str]): Watermark text.
+            watermark_image (Optional[str]): Path to an image used as watermark instead of text.
+            watermark_pdf (Optional[str]): Path to a PDF whose first page is used as watermark.
+
+        Returns:
+            list: A list of file paths for the watermarked PDF files.
+        """
+        if watermark_text is None and watermark_image is None and watermark_pdf is None:
+            raise ValueError("A watermark text, image or PDF is required.")
+
+        watermarked_files = []
+        for input_pdf_path in sorted(Path(input_dir).glob("*.pdf")):
+            output_pdf_path = os.path.join(output_dir, input_pdf_path.name)
+            try:
+                pages_count = self.add_watermark(str(input_pdf_path), output_pdf_path,
+                                                 watermark_text, watermark_image, watermark_pdf)
+                self.instrumentation.event("watermark.saved", f"Watermarked {pages_count} pages: {output_pdf_path}",
+                                           pages=pages_count, output=output_pdf_path)
+                watermarked_files.append(output_pdf_path)
+            except Exception as e:
+                self.instrumentation.event("watermark.error",
+                                           f"An error occurred while watermarking {input_pdf_path}: {e}", "error",
+                                           filename=str(input_pdf_path), error=repr(e))
+
+        return watermarked_files
+
+    # Chain operations on a document, applied when it is saved
+    def pipeline(self, source) -> "PDF_pipeline":
+        """
+        Starts a pipeline of operations on a document.
+
+        The steps are only recorded; save() parses the document once, applies every step
+        to each page in a single pass and serializes the result once, e.g.:
+
+            manager.pipeline("in.pdf").decrypt("old").rotate(90, pages="1-3") \\
+                .crop((0, 0, 306, 396)).watermark("DRAFT").encrypt("new").save("out.pdf")
+
+        Args:
+            source: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+
+        Returns:
+            PDF_pipeline: The pipeline, whose methods return it so that steps can be chained.
+        """
+        return PDF_pipeline(self, source)
             
     ## pdf manipulation choice
     def display_pdf_handling_choice(self):
@@ -411,4 +2133,139 @@ class PDF_manager:
             print(i+1, "_", choice)
         print()
         
-    ## End of PDF_file_manager class      
\ No newline at end of file
+    ## End of PDF_file_manager class
+
+
+# class to chain operations on a pdf document
+class PDF_pipeline:
+    def __init__(self, manager: PDF_manager, source):
+        """
+        Creates a pipeline over a document. Use PDF_manager.pipeline() rather than this constructor.
+
+        Args:
+            manager (PDF_manager): Manager providing the watermarks and the instrumentation.
+            source: Path to the PDF file, or the document in memory (bytes-like object or binary stream).
+        """
+        self.manager = manager
+        self.source = source
+        self.steps = []  # (name, arguments) of the page steps, in order
+        self._password = ""
+        self._encryption = None
+
+    # Open the document with a password
+    def decrypt(self, password: str) -> "PDF_pipeline":
+        """Opens the encrypted document with its password; the output is not encrypted unless encrypt() is called."""
+        self._password = password
+        return self
+
+    # Rotate pages
+    def rotate(self, angle: int, pages=None) -> "PDF_pipeline":
+        """
+        Rotates pages clockwise, adding to their current rotation.
+
+        Args:
+            angle (int): Clockwise rotation, a multiple of 90.
+            pages: Pages to rotate (see _page_selection()). Defaults to every page.
+        """
+        if angle % 90:
+            raise ValueError(f"The rotation must be a multiple of 90 degrees, not {angle}.")
+        self.steps.append(("rotate", {"angle": angle, "pages": pages}))
+        return self
+
+    # Crop pages
+    def crop(self, box: Optional[tuple] = None, pages=None, margin: float = 0.0) -> "PDF_pipeline":
+        """
+        Sets the visible area of pages, within their media box.
+
+        Args:
+            box (Optional[tuple]): (left, bottom, right, top) in points, in the coordinates of the page.
+                Defaults to the bounding box of the content of each page.
+            pages: Pages to crop (see _page_selection()). Defaults to every page.
+            margin (float): Space kept around the box, in points. Defaults to 0.
+        """
+        if box is not None:
+            left, bottom, right, top = (float(value) for value in box)
+            if right <= left or top <= bottom:
+                raise ValueError(f"The crop box {box} is empty.")
+            box = (left, bottom, right, top)
+        self.steps.append(("crop", {"box": box, "margin": margin, "pages": pages}))
+        return self
+
+    # Watermark pages
+    def watermark(self, text: Optional[str] = None, image: Optional[str] = None, pdf: Optional[str] = None,
+                  pages=None) -> "PDF_pipeline":
+        """
+        Stamps a watermark over the visible area of pages, as add_watermark() does.
+
+        Args:
+            text (Optional[str]): Watermark text.
+            image (Optional[str]): Path to an image used as watermark instead of text.
+            pdf (Optional[str]): Path to a PDF whose first page is used as watermark.
+            pages: Pages to watermark (see _page_selection()). Defaults to every page.
+        """
+        if text is None and image is None and pdf is None:
+            raise ValueError("A watermark text, image or PDF is required.")
+        self.steps.append(("watermark", {"text": text, "image": image, "pdf": pdf, "pages": pages}))
+        return self
+
+    # Encrypt the output
+    def encrypt(self, password: str, owner_password: Optional[str] = None) -> "PDF_pipeline":
+        """Encrypts the output with AES-256; the owner password defaults to the password."""
+        self._encryption = pikepdf.Encryption(owner=owner_password or password, user=password, R=6)
+        return self
+
+    # Apply the steps and write the document
+    def save(self, output, save_options: Optional[dict] = None):
+        """
+        Parses the document, applies the steps to each page in a single pass and writes it once.
+
+        Args:
+            output: Path of the output PDF file, or a bytearray, writable memoryview, mmap or binary
+                stream receiving it.
+            save_options (Optional[dict]): "incremental", "object_streams" and "linearize" (see _save_pdf()).
+                Encrypted inputs and outputs are always rewritten.
+
+        Returns:
+            The output, as returned for output (the written part for a memoryview).
+        """
+        instrumentation = self.manager.instrumentation
+        with instrumentation.operation("pipeline", steps=[name for name, _ in self.steps]), ExitStack() as stack:
+            with instrumentation.span("pipeline.parse"):
+                pdf = _open_pdf(self.source, stack, password=self._password)
+                fingerprints = object_fingerprints(pdf) if (save_options or {}).get("incremental") else None
+            pages_count = len(pdf.pages)
+            selections = [_page_selection(arguments["pages"], pages_count) for _, arguments in self.steps]
+            templates = {}  # Watermark Form XObjects of this document
+
+            # Every step is applied to a page before moving to the next page
+            with instrumentation.span("pipeline.pages", pages=pages_count):
+                for page_number, page in enumerate(pdf.pages, start=1):
+                    for (name, arguments), selection in zip(self.steps, selections):
+                        if selection is not None and page_number not in selection:
+                            continue
+                        match name:
+                            case "rotate":
+                                page.rotate(arguments["angle"], relative=True)
+                            case "crop":
+                                box = arguments["box"] or content_bounding_box(page)
+                                if box is not None:
+                                    mediabox = [float(value) for value in page.mediabox]
+                                    page.cropbox = pikepdf.Array(
+                                        resolve_crop_boxes(mediabox, box, arguments["margin"])[0].tolist())
+                            case "watermark":
+                                self.manager._stamp_watermark(pdf, page, templates, stack, page.cropbox,
+                                                              arguments["text"], arguments["image"], arguments["pdf"])
+
+            # A single serialization, encrypted or not
+            with instrumentation.span("pipeline.write"):
+                result, output_bytes = _save_pdf(pdf, self.source, output, fingerprints, save_options, self._encryption)
+
+        self.manager._count_read(self.source)
+        instrumentation.count("pages", pages_count)
+        instrumentation.count("bytes_written", output_bytes)
+        instrumentation.event("pipeline.saved", f"Applied {len(self.steps)} steps to {pages_count} pages "
+                              f"and saved as {_source_name(output)}", pages=pages_count, steps=len(self.steps),
+                              output=_source_name(output))
+        return result
+        ## End save() function ##
+    ## End of PDF_pipeline class
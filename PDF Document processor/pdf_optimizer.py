@@ -0,0 +1,376 @@
+"""
+    This module makes pdf documents smaller before they are saved.
+    Resources the page contents never use are removed, identical embedded objects (fonts, images,
+    ICC profiles) are shared, and the streams are compressed on save, with the small objects
+    packed into object streams. Objects no longer referenced are left out by the save itself.
+    Images drawn above a resolution are downsampled, and images can be recompressed as JPEG; the
+    resolution of an image is the smallest one it is drawn at, found by following the current
+    transformation matrix through the page contents and the forms they draw. The images are
+    resampled by a pool of worker processes, and an image is only replaced by a smaller one.
+"""
+# Necessary modules
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import math
+import zlib
+from io import BytesIO
+from typing import Optional
+
+from lazy_modules import lazy_import
+
+# Imported on first use
+pikepdf = lazy_import("pikepdf")
+Image = lazy_import("PIL.Image")
+
+# JPEG quality of the downsampled JPEG images, when no quality is given
+default_jpeg_quality = 85
+
+# Filters of the images that can be decoded and encoded again
+resampled_filters = {"/FlateDecode", "/DCTDecode", "/LZWDecode", "/RunLengthDecode", "/ASCII85Decode", "/ASCIIHexDecode"}
+
+# Nesting of forms followed when looking for the images drawn
+max_form_depth = 16
+
+
+# Replace the indirect references listed in replacements, inside a container and its direct children.
+def _replace_references(container, replacements: dict) -> int:
+    replaced = 0
+    if isinstance(container, pikepdf.Array):
+        items = list(enumerate(container))
+    elif isinstance(container, pikepdf.Stream):
+        container = container.stream_dict
+        items = list(container.items())
+    elif isinstance(container, pikepdf.Dictionary):
+        items = list(container.items())
+    else:
+        return 0
+
+    for key, value in items:
+        if not isinstance(value, pikepdf.Object):
+            continue
+        if value.is_indirect:
+            if value.objgen in replacements:
+                container[key] = replacements[value.objgen]
+                replaced += 1
+        else:
+            replaced += _replace_references(value, replacements)
+    return replaced
+
+
+# Make identical embedded objects of a pdf document share a single copy.
+def deduplicate_pdf_objects(pdf: pikepdf.Pdf) -> int:
+    """
+    Replaces the references to duplicate objects by references to a single copy.
+
+    Streams (fonts files, images, ICC profiles...) are compared by their raw data and
+    dictionary, then fonts, font descriptors, encodings and graphics states by their content.
+    The duplicates are no longer referenced and are left out when the document is saved.
+
+    Args:
+        pdf (Pdf): The pikepdf document to deduplicate in place.
+
+    Returns:
+        int: Number of duplicate objects removed.
+    """
+    shared_types = {"/Font", "/FontDescriptor", "/Encoding", "/ExtGState"}
+    removed_objgens = set()  # Duplicates stay in the object table until the document is saved
+
+    # Fonts become identical once the streams they reference are shared, hence the rounds
+    while True:
+        canonical_objects = {}
+        replacements = {}
+        for obj in pdf.objects:
+            if not isinstance(obj, pikepdf.Object) or obj.objgen in removed_objgens:
+                continue
+            if isinstance(obj, pikepdf.Stream):
+                if obj.get("/Type") in ("/XRef", "/ObjStm"):
+                    continue
+                # Length may be an indirect object: compare the dictionary without it
+                stream_dict = pikepdf.Dictionary(obj.stream_dict)
+                if "/Length" in stream_dict:
+                    del stream_dict["/Length"]
+                key = hashlib.sha256(stream_dict.unparse() + b"stream" + obj.read_raw_bytes()).digest()
+            elif isinstance(obj, pikepdf.Dictionary) and obj.get("/Type") in shared_types:
+                key = hashlib.sha256(obj.unparse(resolved=True)).digest()
+            else:
+                continue
+
+            if key in canonical_objects:
+                replacements[obj.objgen] = canonical_objects[key]
+            else:
+                canonical_objects[key] = obj
+
+        if not replacements:
+            return len(removed_objgens)
+
+        # Point every reference to the kept copy
+        for obj in pdf.objects:
+            _replace_references(obj, replacements)
+        _replace_references(pdf.trailer, replacements)
+        removed_objgens.update(replacements)
+
+
+# Number of named resources of the pages (fonts, images, graphics states...)
+def _count_resources(pdf: pikepdf.Pdf) -> int:
+    count = 0
+    for page in pdf.pages:
+        resources = page.obj.get("/Resources")
+        if not isinstance(resources, pikepdf.Dictionary):
+            continue
+        for category in resources.values():
+            if isinstance(category, pikepdf.Dictionary):
+                count += len(category)
+    return count
+
+
+# Follow the drawing operators of a content stream, recording the resolution of the images drawn
+def _scan_content(content, resources, ctm: pikepdf.Matrix, resolutions: dict, drawn_forms: set, depth: int) -> None:
+    xobjects = resources.get("/XObject") if isinstance(resources, pikepdf.Dictionary) else None
+    if not isinstance(xobjects, pikepdf.Dictionary):
+        return
+    saved_states = []
+    for operands, operator in pikepdf.parse_content_stream(content, "q Q cm Do"):
+        match str(operator):
+            case "q":
+                saved_states.append(ctm)
+            case "Q":
+                ctm = saved_states.pop() if saved_states else ctm
+            case "cm":
+                ctm = pikepdf.Matrix(*[float(value) for value in operands]) @ ctm
+            case "Do":
+                xobject = xobjects.get(operands[0])
+                if not isinstance(xobject, pikepdf.Stream) or not xobject.is_indirect:
+                    continue
+                if xobject.get("/Subtype") == "/Image":
+                    # The image fills the unit square, mapped to the page by the matrix
+                    width = math.hypot(ctm.a, ctm.b) / 72
+                    height = math.hypot(ctm.c, ctm.d) / 72
+                    if width == 0 or height == 0:
+                        continue
+                    resolution = min(int(xobject.get("/Width", 0)) / width, int(xobject.get("/Height", 0)) / height)
+                    resolutions[xobject.objgen] = min(resolutions.get(xobject.objgen, math.inf), resolution)
+                elif xobject.get("/Subtype") == "/Form" and depth < max_form_depth:
+                    matrix = xobject.get("/Matrix")
+                    form_ctm = pikepdf.Matrix(*[float(value) for value in matrix]) @ ctm if matrix else ctm
+                    # A form drawn again at the same place draws the same images (e.g. a watermark on every page)
+                    use = (xobject.objgen, tuple(round(value, 3) for value in form_ctm.shorthand))
+                    if use in drawn_forms:
+                        continue
+                    drawn_forms.add(use)
+                    _scan_content(xobject, xobject.get("/Resources", resources), form_ctm, resolutions,
+                                  drawn_forms, depth + 1)
+    ## End _scan_content() function ##
+
+
+# Resolution of the images drawn by the pages
+def image_resolutions(pdf: pikepdf.Pdf) -> dict:
+    """
+    Finds the resolution each image of a document is drawn at.
+
+    Images drawn only by annotations, patterns or inline are not found.
+
+    Args:
+        pdf (pikepdf.Pdf): The document.
+
+    Returns:
+        dict: Image (object number, generation) to the smallest resolution it is drawn at,
+            in pixels per inch (the smaller of its horizontal and vertical resolutions).
+    """
+    resolutions = {}
+    drawn_forms = set()
+    for page in pdf.pages:
+        _scan_content(page, page.obj.get("/Resources"), pikepdf.Matrix(), resolutions, drawn_forms, 0)
+    return resolutions
+
+
+# Names of the filters of a stream, in decoding order
+def _stream_filters(stream) -> list:
+    stream_filter = stream.get("/Filter")
+    if isinstance(stream_filter, pikepdf.Array):
+        return [str(name) for name in stream_filter]
+    return [str(stream_filter)] if stream_filter is not None else []
+
+
+# Number of color components of an image that can be resampled, or None
+def _image_components(image) -> Optional[int]:
+    if image.get("/ImageMask") or image.get("/BitsPerComponent") != 8 or "/Decode" in image:
+        return None
+    # A color key mask would no longer match the resampled colors
+    if isinstance(image.get("/Mask"), pikepdf.Array):
+        return None
+    if not all(name in resampled_filters for name in _stream_filters(image)):
+        return None
+
+    colorspace = image.get("/ColorSpace")
+    if colorspace == "/DeviceGray":
+        return 1
+    if colorspace == "/DeviceRGB":
+        return 3
+    if isinstance(colorspace, pikepdf.Array) and len(colorspace) == 2 and colorspace[0] == "/ICCBased":
+        components = colorspace[1].get("/N")
+        return int(components) if components in (1, 3) else None
+    return None
+
+
+# Resample and encode an image
+def _optimize_image(image, size: Optional[tuple], jpeg_quality: Optional[int]) -> Optional[tuple]:
+    """
+    Decodes an image, resamples it, and encodes it again.
+
+    Args:
+        image (pikepdf.Stream): The image, 8-bit gray or RGB (see _image_components()).
+        size (Optional[tuple]): New (width, height) in pixels, or None to keep its size.
+        jpeg_quality (Optional[int]): Encode as JPEG with this quality. Without it, JPEG images
+            stay JPEG (with default_jpeg_quality) and the others are compressed losslessly.
+
+    Returns:
+        Optional[tuple]: The (data, filter name, width, height) of the new image, or None when it
+            did not decode as expected.
+    """
+    mode = {1: "L", 3: "RGB"}.get(_image_components(image))
+    width, height = int(image.Width), int(image.Height)
+    is_jpeg = "/DCTDecode" in _stream_filters(image)
+    if is_jpeg:
+        pil_image = pikepdf.PdfImage(image).as_pil_image()
+        # JPEG images are decoded straight at a fraction of their size, down to twice the new size
+        if size is not None:
+            pil_image.draft(mode, (size[0] * 2, size[1] * 2))
+    else:
+        # The samples are decoded once, without the conversions of PdfImage
+        samples = image.read_bytes(pikepdf.StreamDecodeLevel.specialized)
+        if mode is None or len(samples) < width * height * len(mode):
+            return None
+        pil_image = Image.frombuffer(mode, (width, height), samples, "raw", mode, 0, 1)
+    if pil_image.mode != mode:
+        return None
+    if size is not None:
+        pil_image = pil_image.resize(size, Image.Resampling.LANCZOS)
+
+    if jpeg_quality or is_jpeg:
+        output = BytesIO()
+        pil_image.save(output, format="JPEG", quality=jpeg_quality or default_jpeg_quality, optimize=True)
+        return (output.getvalue(), "/DCTDecode", pil_image.width, pil_image.height)
+    return (zlib.compress(pil_image.tobytes(), 9), "/FlateDecode", pil_image.width, pil_image.height)
+
+
+# Copy of an image in a document of its own, to send it to a worker process
+def _image_document(image) -> bytes:
+    with pikepdf.Pdf.new() as document:
+        document.Root.Image = document.copy_foreign(image)
+        output = BytesIO()
+        # The stream data is copied as it is, the worker decodes it
+        document.save(output, compress_streams=False, stream_decode_level=pikepdf.StreamDecodeLevel.none)
+        return output.getvalue()
+
+
+# Resample and encode an image sent by _image_document() (runs in a worker process)
+def _optimize_image_copy(document: bytes, size: Optional[tuple], jpeg_quality: Optional[int]) -> Optional[tuple]:
+    with pikepdf.open(BytesIO(document)) as pdf:
+        return _optimize_image(pdf.Root.Image, size, jpeg_quality)
+
+
+# Downsample and recompress the images of a document
+def optimize_images(pdf: pikepdf.Pdf, max_image_dpi: Optional[float] = None, jpeg_quality: Optional[int] = None,
+                    workers: int = 1) -> dict:
+    """
+    Downsamples the images drawn above a resolution and recompresses images, in place.
+
+    Only 8-bit gray and RGB images are resampled; an image is replaced only when the new one is
+    smaller. Soft masks keep their size, which the PDF format allows.
+
+    Args:
+        pdf (pikepdf.Pdf): The document.
+        max_image_dpi (Optional[float]): Images drawn above this resolution (see image_resolutions())
+            are downsampled to it. Defaults to None, keeping the resolution of the images.
+        jpeg_quality (Optional[int]): Recompress the images as JPEG with this quality (1 to 95), also
+            those not downsampled. Defaults to None, keeping JPEG images JPEG and the others lossless.
+        workers (int): Number of processes resampling the images. Defaults to 1.
+
+    Returns:
+        dict: The keys "images_downsampled", "images_recompressed" and "image_bytes_saved".
+    """
+    report = {"images_downsampled": 0, "images_recompressed": 0, "image_bytes_saved": 0}
+    if not max_image_dpi and not jpeg_quality:
+        return report
+
+    # The images to resample, with their new size
+    tasks = []
+    for objgen, resolution in image_resolutions(pdf).items():
+        image = pdf.get_object(objgen)
+        if _image_components(image) is None:
+            continue
+        size = None
+        if max_image_dpi and resolution > max_image_dpi:
+            scale = max_image_dpi / resolution
+            size = (max(1, round(int(image.Width) * scale)), max(1, round(int(image.Height) * scale)))
+        if size is not None or jpeg_quality:
+            tasks.append((image, size))
+
+    sizes = [size for _, size in tasks]
+    if workers > 1 and len(tasks) > 1:
+        documents = [_image_document(image) for image, _ in tasks]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            results = list(executor.map(_optimize_image_copy, documents, sizes, [jpeg_quality] * len(tasks)))
+    else:
+        results = [_optimize_image(image, size, jpeg_quality) for image, size in tasks]
+
+    # Keep the images that got smaller
+    for (image, size), result in zip(tasks, results):
+        if result is None:
+            continue
+        data, image_filter, width, height = result
+        saved_bytes = len(image.read_raw_bytes()) - len(data)
+        if saved_bytes <= 0:
+            continue
+        image.write(data, filter=pikepdf.Name(image_filter))
+        if "/DecodeParms" in image:
+            del image["/DecodeParms"]
+        image.Width = width
+        image.Height = height
+        report["images_downsampled" if size is not None else "images_recompressed"] += 1
+        report["image_bytes_saved"] += saved_bytes
+    return report
+    ## End optimize_images() function ##
+
+
+# Optimize a document before saving it
+def optimize_document(pdf: pikepdf.Pdf, max_image_dpi: Optional[float] = None, jpeg_quality: Optional[int] = None,
+                      workers: int = 1) -> dict:
+    """
+    Removes the unused resources, shares the duplicate objects and optimizes the images, in place.
+    Save the document with optimized_save_arguments() to recompress its streams as well.
+
+    Args:
+        pdf (pikepdf.Pdf): The document.
+        max_image_dpi (Optional[float]): See optimize_images().
+        jpeg_quality (Optional[int]): See optimize_images().
+        workers (int): See optimize_images().
+
+    Returns:
+        dict: The keys "resources_removed", "deduplicated_objects", and those of optimize_images().
+    """
+    resources_count = _count_resources(pdf)
+    pdf.remove_unreferenced_resources()
+    report = {"resources_removed": max(resources_count - _count_resources(pdf), 0),
+              "deduplicated_objects": deduplicate_pdf_objects(pdf)}
+    report.update(optimize_images(pdf, max_image_dpi, jpeg_quality, workers))
+    return report
+
+
+# Arguments of pikepdf.Pdf.save() writing an optimized document
+def optimized_save_arguments(object_streams: str = "generate") -> dict:
+    """
+    Returns the save arguments compressing every stream: uncompressed streams and streams with
+    weaker filters (LZW, ASCII) are compressed. Streams already compressed are kept as they are,
+    compressing them again at the same level gains nothing and costs seconds on large images.
+
+    Args:
+        object_streams (str): "generate", "preserve" or "disable" the object streams. Defaults to "generate".
+
+    Returns:
+        dict: Keyword arguments of pikepdf.Pdf.save().
+    """
+    return {"compress_streams": True, "stream_decode_level": pikepdf.StreamDecodeLevel.generalized,
+            "object_stream_mode": getattr(pikepdf.ObjectStreamMode, object_streams)}
@@ -0,0 +1,308 @@
+"""
+    This module indexes the text of pdf documents for full-text search.
+    The text of each page is extracted once through the PDF manager and stored in a SQLite FTS5
+    inverted index, keyed by document and page, so queries never parse a pdf again.
+    Updates are incremental: a document is re-extracted only when its size or modification time
+    changed and its content hash differs from the indexed one.
+"""
+# Necessary modules
+import os
+import sqlite3
+import time
+import concurrent.futures
+from concurrent.futures import as_completed
+from typing import Iterable, List, Optional
+
+from extraction_cache import Extraction_cache, hash_file
+from instrumentation import Instrumentation
+from pdf_manager import PDF_manager
+
+
+# Hash and extract the text of a document unless its content is already indexed (runs in a worker process).
+def _extract_document(filename: str, indexed_hash: Optional[str], cache_dir: Optional[str]) -> dict:
+    """
+    Reads a document for the index.
+
+    Args:
+        filename (str): Path of the document.
+        indexed_hash (Optional[str]): Content hash of the document in the index, if any.
+        cache_dir (Optional[str]): Extraction cache directory, or None for no cache.
+
+    Returns:
+        dict: The keys "path", "size", "mtime_ns", "hash", "pages" (list of page texts, None when
+            the content is already indexed) and "error" (None on success).
+    """
+    document = {"path": filename, "size": None, "mtime_ns": None, "hash": None, "pages": None, "error": None}
+    cache = Extraction_cache(cache_dir) if cache_dir else None
+    try:
+        stat = os.stat(filename)
+        # The cache remembers the hash it computes, so the manager does not read the document again for it
+        file_hash = cache.file_hash(filename) if cache is not None else hash_file(filename)
+        document.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, hash=file_hash)
+        if document["hash"] == indexed_hash:
+            return document
+
+        # The extraction raises its failures, so its messages are not printed
+        manager = PDF_manager(cache, Instrumentation(hooks=[]))
+        document["pages"] = [text for _, text in manager.iter_pdf_pages(filename)]
+        if not document["pages"]:
+            document["error"] = "The document has no readable pages."
+    except Exception as e:
+        document.update(pages=None, error=f"An error occurred while reading the PDF: {e}")
+    finally:
+        if cache is not None:
+            cache.close()
+    return document
+    ## End _extract_document() function ##
+
+
+# class to search the text of pdf documents
+class PDF_search_index:
+    # Page numbers take the low bits of the row ids, the document id the others
+    page_bits = 20
+    # Documents written to the index per transaction
+    batch_size = 256
+
+    def __init__(self, index_dir: str = ".pdf_index", manager: Optional[PDF_manager] = None):
+        """
+        Opens (or creates) a search index.
+
+        Args:
+            index_dir (str): Directory holding the index database. Defaults to ".pdf_index".
+            manager (Optional[PDF_manager]): Manager whose extraction cache and instrumentation
+                are used. Defaults to a PDF_manager without cache.
+        """
+        self.index_dir = index_dir
+        self.manager = manager or PDF_manager()
+        self.instrumentation = self.manager.instrumentation
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._connection = sqlite3.connect(os.path.join(index_dir, "index.sqlite3"), isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " hash TEXT NOT NULL, page_count INTEGER NOT NULL, indexed_at REAL NOT NULL)"
+        )
+        # Row id of a page: document id << page_bits | page number
+        self._connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(text, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    # Row ids of the pages of a document
+    def _page_rows(self, document_id: int) -> tuple:
+        first_row = document_id << self.page_bits
+        return first_row, first_row + (1 << self.page_bits) - 1
+
+    # Bring the index up to date with documents
+    def update(self, filenames: Iterable[str], workers: Optional[int] = 1) -> dict:
+        """
+        Indexes new and changed documents.
+
+        Unchanged documents (same size and modification time) are skipped without being read;
+        touched documents whose content hash did not change are not extracted again.
+        Documents that can no longer be read are removed from the index.
+
+        Args:
+            filenames (Iterable[str]): Paths of the documents.
+            workers (Optional[int]): Worker processes hashing and extracting the documents.
+                With 1, documents are handled in this process. None uses every CPU.
+
+        Returns:
+            dict: The keys "indexed", "unchanged" and "pages" (counts), and "failed" (path to error).
+        """
+        report = {"indexed": 0, "unchanged": 0, "pages": 0, "failed": {}}
+        cache_dir = self.manager.cache.cache_dir if self.manager.cache is not None else None
+
+        # Compare the files with the index without reading them
+        pending = []
+        with self.instrumentation.span("index.scan"):
+            for filename in dict.fromkeys(os.path.abspath(filename) for filename in filenames):
+                row = self._connection.execute("SELECT size, mtime_ns, hash FROM documents WHERE path = ?",
+                                               (filename,)).fetchone()
+                try:
+                    stat = os.stat(filename)
+                except OSError as e:
+                    report["failed"][filename] = str(e)
+                    continue
+                if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                    report["unchanged"] += 1
+                else:
+                    pending.append((filename, row[2] if row else None))
+
+        # Write the documents as they are extracted, a batch per transaction
+        batch = []
+        for document in self._extract(pending, workers, cache_dir):
+            if document["error"]:
+                report["failed"][document["path"]] = document["error"]
+                # The text of its previous version would keep matching
+                self.remove([document["path"]])
+                continue
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                self._write(batch, report)
+                batch = []
+        self._write(batch, report)
+
+        self.instrumentation.count("documents_indexed", report["indexed"])
+        self.instrumentation.event("index.updated", f"Indexed {report['indexed']} documents ({report['pages']} pages), "
+                                   f"{report['unchanged']} unchanged, {len(report['failed'])} failed",
+                                   indexed=report["indexed"], unchanged=report["unchanged"],
+                                   failed=len(report["failed"]))
+        return report
+        ## End update() function ##
+
+    # Hash and extract documents, in this process or over a pool of workers
+    def _extract(self, pending: list, workers: Optional[int], cache_dir: Optional[str]):
+        if workers == 1 or len(pending) <= 1:
+            for filename, indexed_hash in pending:
+                with self.instrumentation.span("index.extract", filename=filename):
+                    yield _extract_document(filename, indexed_hash, cache_dir)
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_extract_document, filename, indexed_hash, cache_dir)
+                       for filename, indexed_hash in pending]
+            for future in as_completed(futures):
+                yield future.result()
+
+    # Store extracted documents in one transaction
+    def _write(self, documents: List[dict], report: dict) -> None:
+        if not documents:
+            return
+        with self.instrumentation.span("index.write", documents=len(documents)):
+            self._connection.execute("BEGIN")
+            try:
+                for document in documents:
+                    if document["pages"] is None:
+                        # Same content under a new modification time
+                        self._connection.execute("UPDATE documents SET size = ?, mtime_ns = ? WHERE path = ?",
+                                                 (document["size"], document["mtime_ns"], document["path"]))
+                        report["unchanged"] += 1
+                        continue
+                    if len(document["pages"]) >= 1 << self.page_bits:
+                        report["failed"][document["path"]] = f"More than {(1 << self.page_bits) - 1} pages."
+                        continue
+
+                    # Replace the pages of the previous version
+                    document_id = self._connection.execute(
+                        "INSERT INTO documents (path, size, mtime_ns, hash, page_count, indexed_at) VALUES (?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,"
+                        " hash = excluded.hash, page_count = excluded.page_count, indexed_at = excluded.indexed_at"
+                        " RETURNING id",
+                        (document["path"], document["size"], document["mtime_ns"], document["hash"],
+                         len(document["pages"]), time.time()),
+                    ).fetchone()[0]
+                    first_row, last_row = self._page_rows(document_id)
+                    self._connection.execute("DELETE FROM pages WHERE rowid BETWEEN ? AND ?", (first_row, last_row))
+                    self._connection.executemany(
+                        "INSERT INTO pages (rowid, text) VALUES (?, ?)",
+                        ((first_row + page_number, text or "")
+                         for page_number, text in enumerate(document["pages"], start=1)),
+                    )
+                    report["indexed"] += 1
+                    report["pages"] += len(document["pages"])
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    # Remove documents from the index
+    def remove(self, filenames: Iterable[str]) -> int:
+        """
+        Removes documents and their pages from the index.
+
+        Args:
+            filenames (Iterable[str]): Paths of the documents.
+
+        Returns:
+            int: Number of documents removed.
+        """
+        removed = 0
+        self._connection.execute("BEGIN")
+        try:
+            for filename in filenames:
+                row = self._connection.execute("SELECT id FROM documents WHERE path = ?",
+                                               (os.path.abspath(filename),)).fetchone()
+                if row is None:
+                    continue
+                self._connection.execute("DELETE FROM pages WHERE rowid BETWEEN ? AND ?", self._page_rows(row[0]))
+                self._connection.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+                removed += 1
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    # Forget the documents whose files are gone
+    def prune(self) -> int:
+        """
+        Removes the documents whose files no longer exist.
+
+        Returns:
+            int: Number of documents removed.
+        """
+        paths = [path for (path,) in self._connection.execute("SELECT path FROM documents")]
+        return self.remove(path for path in paths if not os.path.isfile(path))
+
+    # Find the pages containing terms
+    def search(self, query: str, limit: int = 20, offset: int = 0, raw: bool = False,
+               snippet_tokens: int = 12) -> List[dict]:
+        """
+        Searches the indexed pages, best matches first.
+
+        Args:
+            query (str): Terms that every page found must contain. With raw, an FTS5 query
+                (phrases in quotes, OR, NOT, prefix*, NEAR(...)).
+            limit (int): Maximum number of hits. Defaults to 20.
+            offset (int): Hits to skip, for paging. Defaults to 0.
+            raw (bool): Pass the query to FTS5 unchanged. Defaults to False.
+            snippet_tokens (int): Length of the snippets, in tokens. Defaults to 12.
+
+        Returns:
+            List[dict]: The hits, with the keys "path", "page" (starting from 1), "snippet" (the
+                matching terms within [ and ]) and "score" (BM25, lower is better).
+        """
+        if not raw:
+            # Each term is quoted so that punctuation is not read as query syntax
+            query = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+        if not query:
+            return []
+
+        page_mask = (1 << self.page_bits) - 1
+        with self.instrumentation.span("index.search", query=query):
+            try:
+                rows = self._connection.execute(
+                    "SELECT documents.path, pages.rowid & ?, snippet(pages, 0, '[', ']', '...', ?), bm25(pages)"
+                    " FROM pages JOIN documents ON documents.id = pages.rowid >> ?"
+                    " WHERE pages MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                    (page_mask, snippet_tokens, self.page_bits, query, limit, offset),
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"Invalid search query {query!r}: {e}") from e
+        return [{"path": path, "page": page, "snippet": snippet, "score": score}
+                for path, page, snippet, score in rows]
+        ## End search() function ##
+
+    # Merge the index segments
+    def optimize(self) -> None:
+        """Merges the segments of the full-text index into one, making queries faster after large updates."""
+        with self.instrumentation.span("index.optimize"):
+            self._connection.execute("INSERT INTO pages (pages) VALUES ('optimize')")
+
+    # Size of the index
+    def stats(self) -> dict:
+        """Returns the number of indexed "documents" and "pages", and the "bytes" of the index database."""
+        documents, pages = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(page_count), 0) FROM documents").fetchone()
+        index_bytes = sum(os.path.getsize(os.path.join(self.index_dir, name)) for name in os.listdir(self.index_dir)
+                          if name.startswith("index.sqlite3"))
+        return {"documents": documents, "pages": pages, "bytes": index_bytes}
+
+    # Close the index database
+    def close(self) -> None:
+        """Closes the index database."""
+        self._connection.close()
+    ## End of PDF_search_index class
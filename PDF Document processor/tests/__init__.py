@@ -0,0 +1,80 @@
+"""
+    Tests of the PDF manager and its modules, on the shipped original_pdf/dummy.pdf and on small
+    documents drawn with reportlab. Run them from the "PDF Document processor" directory:
+    python -m pytest tests  (or python -m unittest discover tests).
+"""
+# Necessary modules
+import os
+import re
+import sys
+from typing import Optional
+
+# The modules of the PDF manager are imported by name, from the directory above
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+from instrumentation import Instrumentation  # noqa: E402
+from pdf_manager import PDF_manager  # noqa: E402
+
+# The document shipped with the repository
+dummy_pdf = os.path.join(package_dir, "original_pdf", "dummy.pdf")
+
+
+# Draw a document with a line of text on each page
+def make_pdf(path: str, pages: int = 3, text: str = "Page", bookmarks: bool = False,
+             image_path: Optional[str] = None, page_size: tuple = (612, 792)) -> str:
+    """
+    Draws a small PDF document with reportlab.
+
+    Args:
+        path (str): Path of the PDF file to create.
+        pages (int): Number of pages. Defaults to 3.
+        text (str): Text drawn on each page, followed by the page number. Defaults to "Page".
+        bookmarks (bool): Add a top-level bookmark on each odd page. Defaults to False.
+        image_path (Optional[str]): Image drawn on each page. Defaults to none.
+        page_size (tuple): Width and height of the pages, in points. Defaults to letter.
+
+    Returns:
+        str: The path of the PDF file.
+    """
+    from reportlab.pdfgen import canvas
+
+    can = canvas.Canvas(path, pagesize=page_size)
+    for page_number in range(1, pages + 1):
+        can.drawString(72, 720, f"{text} {page_number}")
+        if image_path:
+            can.drawImage(image_path, 72, 72, width=144, height=144)
+        if bookmarks and page_number % 2:
+            can.bookmarkPage(f"page{page_number}")
+            can.addOutlineEntry(f"Part {page_number}", f"page{page_number}", level=0)
+        can.showPage()
+    can.save()
+    return path
+
+
+# Write a PNG image
+def make_image(path: str, size: tuple = (64, 48), color: tuple = (200, 30, 30)) -> str:
+    from PIL import Image
+
+    Image.new("RGB", size, color).save(path)
+    return path
+
+
+# Break the content stream of a page, leaving the rest of the file readable
+def corrupt_page(path: str, page_number: int) -> str:
+    import pikepdf
+
+    with pikepdf.open(path) as pdf:
+        object_number = pdf.pages[page_number - 1].obj.Contents.objgen[0]
+    with open(path, "r+b") as pdf_file:
+        data = pdf_file.read()
+        start = re.search(rb"\b%d 0 obj.*?stream\r?\n" % object_number, data, re.DOTALL).end()
+        pdf_file.seek(start)
+        pdf_file.write(b"\x00" * 8)
+    return path
+
+
+# PDF manager whose messages are not printed
+def quiet_manager(**kwargs) -> PDF_manager:
+    return PDF_manager(instrumentation=Instrumentation(hooks=[]), **kwargs)
@@ -0,0 +1,125 @@
+# Tests of the batch command line: inputs, commands, journals and exit statuses
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+
+import batch
+from tests import corrupt_page, make_pdf
+from batch import expand_inputs, run_batch, run_merge, run_operation
+from job_journal import Job_journal
+
+
+class Batch_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.output_dir = os.path.join(self.dir, "out")
+        self.journal_path = os.path.join(self.dir, "job.jsonl")
+        self.first = make_pdf(self.path("first.pdf"), pages=2, text="First")
+        self.second = make_pdf(self.path("second.pdf"), pages=3, text="Second")
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def path(self, *names: str) -> str:
+        return os.path.join(self.dir, *names)
+
+    def read_journal(self) -> list:
+        with open(self.journal_path, "r", encoding="utf-8") as journal_file:
+            return [json.loads(line) for line in journal_file]
+
+    # Run the command line, returning its exit status and the JSON lines it printed
+    def run_main(self, *arguments: str) -> tuple:
+        output = io.StringIO()
+        with redirect_stdout(output), redirect_stderr(io.StringIO()):
+            status = batch.main(list(arguments))
+        return status, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_expand_inputs(self):
+        manifest = self.path("inputs.txt")
+        with open(manifest, "w", encoding="utf-8") as manifest_file:
+            manifest_file.write(f"# Documents\n\n{self.second}\n{self.path('missing.pdf')}\n")
+        self.assertEqual(expand_inputs([self.path("*.pdf"), self.first], manifest),
+                         [self.first, self.second, self.path("missing.pdf")])
+
+    def test_extract_text(self):
+        result = run_operation("extract-text", self.second, {"output_dir": self.output_dir})
+        self.assertEqual((result["ok"], result["error"]), (True, None))
+        with open(result["outputs"][0], "r", encoding="utf-8") as text_file:
+            text = text_file.read()
+        self.assertEqual([line for line in text.splitlines() if line.startswith("---")],
+                         ["--- Page 1 ---", "--- Page 2 ---", "--- Page 3 ---"])
+        self.assertIn("Second 3", text)
+
+    def test_extract_text_failing_mid_document(self):
+        corrupt_page(self.second, 2)
+        options = {"output_dir": self.output_dir, "journal": self.journal_path}
+        result = run_operation("extract-text", self.second, options)
+        self.assertFalse(result["ok"])
+        self.assertIsNotNone(result["error"])
+        # No partial text file, and the document is retried by a resumed run
+        self.assertEqual(os.listdir(self.output_dir), [])
+        self.assertEqual(self.read_journal()[0]["type"], "failed")
+        again, = run_batch("extract-text", [self.second], options)
+        self.assertNotIn("resumed", again)
+        self.assertFalse(again["ok"])
+
+    def test_errors_are_results(self):
+        missing = run_operation("rotate", self.path("missing.pdf"), {"output_dir": self.output_dir, "angle": 90})
+        self.assertFalse(missing["ok"])
+        self.assertIn("does not exist", missing["error"])
+        invalid = run_operation("rotate", self.first, {"output_dir": self.output_dir, "angle": 45})
+        self.assertFalse(invalid["ok"])
+        self.assertIsNotNone(invalid["error"])
+
+    def test_batch_over_workers(self):
+        options = {"output_dir": self.output_dir, "angle": 90}
+        results = list(run_batch("rotate", [self.first, self.second, self.path("missing.pdf")], options, workers=2))
+        self.assertEqual(sorted((os.path.basename(result["input"]), result["ok"]) for result in results),
+                         [("first.pdf", True), ("missing.pdf", False), ("second.pdf", True)])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ["first_rotated.pdf", "second_rotated.pdf"])
+
+    def test_journals_are_closed(self):
+        options = {"output_dir": self.output_dir, "journal": self.journal_path, "angle": 90}
+        list(run_batch("rotate", [self.first], options))
+        with mock.patch.object(Job_journal, "close", autospec=True, side_effect=Job_journal.close) as closing:
+            resumed, = run_batch("rotate", [self.first], options)
+            self.assertTrue(resumed["resumed"])
+            self.assertEqual(closing.call_count, 1)
+
+            # A failed merge is not recorded, but its journal is closed all the same
+            failed = run_merge([self.first, self.path("missing.pdf")], self.path("merged.pdf"),
+                               {"journal": self.journal_path})
+            self.assertFalse(failed["ok"])
+            self.assertEqual(closing.call_count, 2)
+
+    def test_merge_resumes(self):
+        options = {"journal": self.journal_path}
+        merged = run_merge([self.first, self.second], self.path("merged.pdf"), options)
+        self.assertTrue(merged["ok"])
+        self.assertEqual(merged["report"]["pages"], 5)
+        self.assertTrue(run_merge([self.first, self.second], self.path("merged.pdf"), options)["resumed"])
+        # Other inputs make another merge
+        self.assertNotIn("resumed", run_merge([self.second, self.first], self.path("merged.pdf"), options))
+
+    def test_command_line(self):
+        status, results = self.run_main("extract-text", self.path("*.pdf"), "--output-dir", self.output_dir,
+                                        "--workers", "1")
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(os.path.basename(result["input"]) for result in results), ["first.pdf", "second.pdf"])
+
+        status, results = self.run_main("rotate", self.first, self.path("missing.pdf"), "--angle", "180",
+                                        "--output-dir", self.output_dir, "--workers", "1")
+        self.assertEqual(status, 1)
+        self.assertEqual([result["ok"] for result in results], [True, False])
+
+        with redirect_stderr(io.StringIO()):
+            self.assertEqual(batch.main(["metadata", self.path("nothing*.pdf")]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
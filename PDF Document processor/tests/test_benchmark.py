@@ -0,0 +1,77 @@
+# Tests of the benchmark: synthetic documents, measures and regressions
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+import pikepdf
+import PyPDF2
+
+from benchmark import compare_results, generate_synthetic_pdf, measure
+
+
+class Benchmark_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def test_synthetic_text_document(self):
+        path = generate_synthetic_pdf(os.path.join(self.dir, "text.pdf"), pages=3, lines_per_page=5)
+        reader = PyPDF2.PdfReader(path)
+        self.assertEqual(len(reader.pages), 3)
+        text = reader.pages[2].extract_text()
+        self.assertIn("3.0 ", text)
+        self.assertIn("3.4 ", text)
+        self.assertNotIn("3.5 ", text)
+
+        # The same seed gives the same document
+        again = generate_synthetic_pdf(os.path.join(self.dir, "again.pdf"), pages=3, lines_per_page=5)
+        self.assertEqual(PyPDF2.PdfReader(again).pages[2].extract_text(), text)
+
+    def test_synthetic_images_are_shared(self):
+        path = generate_synthetic_pdf(os.path.join(self.dir, "images.pdf"), pages=4, lines_per_page=1,
+                                      images_per_page=3, image_size=16, distinct_images=2)
+        with pikepdf.open(path) as pdf:
+            images = [image for page in pdf.pages for image in page.Resources.XObject.values()]
+            self.assertEqual(len(images), 12)
+            self.assertEqual(len({image.objgen for image in images}), 2)
+            self.assertEqual((int(images[0].Width), int(images[0].Height)), (16, 16))
+
+    def test_measure_traces_a_separate_run(self):
+        calls = []
+
+        # Record whether each call was traced
+        def function():
+            calls.append(tracemalloc.is_tracing())
+            return bytearray(1024 * 1024)
+
+        result = measure(function, repeat=3)
+        self.assertEqual(calls, [False, False, False, True])
+        self.assertEqual(len(result["runs"]), 3)
+        self.assertEqual(result["wall_seconds"], sorted(result["runs"])[1])
+        self.assertGreaterEqual(result["peak_python_bytes"], 1024 * 1024)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_compare_results(self):
+        previous = {"results": [
+            {"corpus": "10p", "operation": "read", "wall_seconds": 1.0},
+            {"corpus": "10p", "operation": "split", "wall_seconds": 2.0},
+            {"corpus": "10p", "operation": "merge", "wall_seconds": 0.0},
+        ]}
+        current = {"results": [
+            {"corpus": "10p", "operation": "read", "wall_seconds": 1.05},  # Within the threshold
+            {"corpus": "10p", "operation": "split", "wall_seconds": 2.5},
+            {"corpus": "10p", "operation": "merge", "wall_seconds": 1.0},  # No previous time to compare with
+            {"corpus": "100p", "operation": "read", "wall_seconds": 9.0},  # New corpus
+        ]}
+        self.assertEqual(compare_results(current, previous), [("10p", "split", 2.0, 2.5)])
+        self.assertEqual(compare_results(current, previous, threshold=0.01),
+                         [("10p", "read", 1.0, 1.05), ("10p", "split", 2.0, 2.5)])
+        self.assertEqual(compare_results(current, {"results": []}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
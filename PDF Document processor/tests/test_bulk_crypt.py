@@ -0,0 +1,122 @@
+# Tests of the bulk encryption and decryption
+import io
+import os
+import tempfile
+import unittest
+
+import pikepdf
+
+from tests import dummy_pdf, make_pdf, quiet_manager
+
+
+# A password whose unpickling kills the worker process receiving it
+class Worker_killer:
+    def __reduce__(self):
+        return (os._exit, (1,))
+
+
+class Bulk_crypt_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.passwords = {}
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    # Key provider looking up the password of each source
+    def key_provider(self, source) -> str:
+        return self.passwords[source]
+
+    def page_count(self, source, password: str = "") -> int:
+        with pikepdf.open(source, password=password) as pdf:
+            return len(pdf.pages)
+
+    def test_round_trip(self):
+        sources = [dummy_pdf, make_pdf(os.path.join(self.dir, "doc.pdf"), pages=4)]
+        encrypted = [os.path.join(self.dir, "encrypted", f"{number}.pdf") for number in range(2)]
+        decrypted = [os.path.join(self.dir, "decrypted", f"{number}.pdf") for number in range(2)]
+        self.passwords = {sources[0]: "first", sources[1]: "second", encrypted[0]: "first", encrypted[1]: "second"}
+
+        results = self.manager.bulk_encrypt_pdfs(list(zip(sources, encrypted)), self.key_provider, workers=2)
+        self.assertEqual([(result["ok"], result["attempts"], result["error"]) for result in results],
+                         [(True, 1, None)] * 2)
+        self.assertEqual([result["destination"] for result in results], encrypted)
+        for output, password in zip(encrypted, ["first", "second"]):
+            with self.assertRaises(pikepdf.PasswordError):
+                pikepdf.open(output)
+            with pikepdf.open(output, password=password) as pdf:
+                self.assertTrue(pdf.is_encrypted)
+                self.assertEqual(pdf.encryption.R, 6)  # AES-256
+
+        results = self.manager.bulk_decrypt_pdfs(list(zip(encrypted, decrypted)), self.key_provider, workers=2)
+        self.assertTrue(all(result["ok"] for result in results))
+        for source, output in zip(sources, decrypted):
+            with pikepdf.open(output) as pdf:
+                self.assertFalse(pdf.is_encrypted)
+            self.assertEqual(self.page_count(output), self.page_count(source))
+
+    def test_bad_password_is_not_retried(self):
+        encrypted = os.path.join(self.dir, "encrypted.pdf")
+        self.passwords = {dummy_pdf: "right", encrypted: "wrong"}
+        self.assertTrue(self.manager.bulk_encrypt_pdfs([(dummy_pdf, encrypted)], self.key_provider, workers=1)[0]["ok"])
+
+        output = os.path.join(self.dir, "decrypted.pdf")
+        result, = self.manager.bulk_decrypt_pdfs([(encrypted, output)], self.key_provider, workers=1, retries=3)
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["attempts"], 1)
+        self.assertEqual(result["error"], "Incorrect password.")
+        self.assertFalse(os.path.exists(output))
+
+    def test_missing_file_fails_alone(self):
+        missing = os.path.join(self.dir, "missing.pdf")
+        jobs = [(missing, os.path.join(self.dir, "missing_encrypted.pdf")),
+                (dummy_pdf, os.path.join(self.dir, "dummy_encrypted.pdf"))]
+        results = self.manager.bulk_encrypt_pdfs(jobs, lambda source: "secret", workers=2, retries=3)
+        self.assertFalse(results[0]["ok"])
+        self.assertEqual(results[0]["attempts"], 1)
+        self.assertIn("does not exist", results[0]["error"])
+        self.assertFalse(os.path.exists(jobs[0][1]))
+        self.assertTrue(results[1]["ok"])
+
+    def test_key_provider_failure(self):
+        result, = self.manager.bulk_encrypt_pdfs([(dummy_pdf, None)], self.key_provider, workers=1)
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["attempts"], 0)
+        self.assertTrue(result["error"].startswith("No password"))
+
+    def test_unpicklable_job_fails_alone(self):
+        jobs = [(dummy_pdf, os.path.join(self.dir, f"{number}.pdf")) for number in range(3)]
+        # The second password cannot be sent to a worker
+        passwords = iter(["secret", lambda: "secret", "secret"])
+        results = self.manager.bulk_encrypt_pdfs(jobs, lambda source: next(passwords), workers=2)
+        self.assertEqual([result["ok"] for result in results], [True, False, True])
+        self.assertIn("could not be run", results[1]["error"])
+        self.assertEqual([result["destination"] for result in results], [destination for _, destination in jobs])
+
+    def test_broken_pool_reports_every_job(self):
+        jobs = [(dummy_pdf, os.path.join(self.dir, f"{number}.pdf")) for number in range(4)]
+        results = self.manager.bulk_encrypt_pdfs(jobs, lambda source: Worker_killer(), workers=2)
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertFalse(result["ok"])
+            self.assertIn("could not be run", result["error"])
+
+    def test_in_memory(self):
+        with open(dummy_pdf, "rb") as source_file:
+            source = source_file.read()
+        encrypted, = self.manager.bulk_encrypt_pdfs([(source, None)], lambda source: "secret", workers=1)
+        self.assertTrue(encrypted["ok"])
+        self.assertEqual(self.page_count(io.BytesIO(encrypted["data"]), "secret"), self.page_count(dummy_pdf))
+
+        output = io.BytesIO()
+        decrypted, = self.manager.bulk_decrypt_pdfs([(io.BytesIO(encrypted["data"]), output)],
+                                                    lambda source: "secret", workers=2)
+        self.assertTrue(decrypted["ok"])
+        self.assertIsNone(decrypted["data"])
+        self.assertEqual(self.page_count(io.BytesIO(output.getvalue())), self.page_count(dummy_pdf))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# Tests of the image extraction: deduplication, manifest, failures and cache
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pikepdf
+
+import pdf_manager
+from tests import make_pdf
+from extraction_cache import Extraction_cache
+from instrumentation import Instrumentation
+from pdf_manager import PDF_manager
+
+
+class Extract_images_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.output_dir = os.path.join(self.dir, "images")
+        self.events = []
+        self.cache = Extraction_cache(os.path.join(self.dir, "cache"))
+        self.manager = PDF_manager(self.cache, Instrumentation(hooks=[self.events.append]))
+        self.source = self.document(os.path.join(self.dir, "doc.pdf"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.temporary_dir.cleanup()
+
+    # Uncompressed RGB image of a single color
+    @staticmethod
+    def image(pdf: pikepdf.Pdf, color: tuple, size: int = 8) -> pikepdf.Stream:
+        return pdf.make_indirect(pikepdf.Stream(pdf, bytes(color) * size * size, Type=pikepdf.Name.XObject,
+                                                Subtype=pikepdf.Name.Image, Width=size, Height=size,
+                                                ColorSpace=pikepdf.Name.DeviceRGB, BitsPerComponent=8))
+
+    # Red image on page 1, blue image and a copy of the red one on page 2, red image in a form on page 3
+    def document(self, path: str) -> str:
+        make_pdf(path, pages=3)
+        with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+            red = self.image(pdf, (200, 30, 30))
+            form = pdf.make_indirect(pikepdf.Stream(pdf, b"/Im0 Do", Type=pikepdf.Name.XObject,
+                                                    Subtype=pikepdf.Name.Form, BBox=[0, 0, 8, 8],
+                                                    Resources=pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=red))))
+            pdf.pages[0].obj.Resources.XObject = pikepdf.Dictionary(Im0=red)
+            pdf.pages[1].obj.Resources.XObject = pikepdf.Dictionary(Im0=self.image(pdf, (30, 30, 200), 9),
+                                                                    Im1=self.image(pdf, (200, 30, 30)))
+            pdf.pages[2].obj.Resources.XObject = pikepdf.Dictionary(Fm0=form)
+            pdf.save(path)
+        return path
+
+    # Identifiers of the red and blue images in a manifest
+    @staticmethod
+    def image_ids(manifest: dict) -> tuple:
+        by_width = {image["width"]: image_id for image_id, image in manifest["images"].items()}
+        return by_width.get(8), by_width.get(9)
+
+    def done_event(self) -> dict:
+        return [event for event in self.events if event["name"] == "extract_images.done"][-1]
+
+    def test_shared_image_is_written_once(self):
+        with mock.patch.object(pdf_manager, "_write_image_file", wraps=pdf_manager._write_image_file) as writing:
+            manifest = self.manager.extract_images_from_pdf(self.source, self.output_dir)
+        self.assertEqual(writing.call_count, 2)
+        red, blue = self.image_ids(manifest)
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         sorted([f"image_{red}.png", f"image_{blue}.png", "doc_manifest.json"]))
+
+    def test_manifest(self):
+        manifest = self.manager.extract_images_from_pdf(self.source, self.output_dir)
+        red, blue = self.image_ids(manifest)
+        self.assertEqual(manifest["source"], self.source)
+        self.assertEqual(manifest["pages"], {"1": [red], "2": [blue, red], "3": [red]})
+        self.assertEqual(manifest["images"][red]["pages"], [1, 2, 3])
+        self.assertEqual(manifest["images"][blue]["pages"], [2])
+        for image in manifest["images"].values():
+            self.assertEqual(image["size"], os.path.getsize(os.path.join(self.output_dir, image["filename"])))
+            self.assertEqual(image["filter"], "/FlateDecode")
+
+        # The manifest written next to the images is the one returned
+        with open(os.path.join(self.output_dir, "doc_manifest.json"), "r", encoding="utf-8") as manifest_file:
+            self.assertEqual(json.load(manifest_file), manifest)
+
+    def test_images_in_memory(self):
+        manifest = self.manager.extract_images_from_pdf(self.source, None)
+        red, _ = self.image_ids(manifest)
+        self.assertTrue(manifest["images"][red]["data"].startswith(b"\x89PNG"))
+        self.assertEqual(manifest["images"][red]["size"], len(manifest["images"][red]["data"]))
+        self.assertFalse(os.path.exists(self.output_dir))
+
+    def test_decode_failure_keeps_the_other_images(self):
+        # Decoding fails for the blue image only
+        def image_file_content(image, raw_bytes, raw_streams):
+            if int(image.Width) == 9:
+                raise ValueError("unsupported image")
+            return decode(image, raw_bytes, raw_streams)
+
+        decode = pdf_manager._image_file_content
+        with mock.patch.object(pdf_manager, "_image_file_content", side_effect=image_file_content):
+            manifest = self.manager.extract_images_from_pdf(self.source, self.output_dir)
+        red, blue = self.image_ids(manifest)
+        self.assertIsNone(blue)
+        self.assertEqual(manifest["pages"], {"1": [red], "2": [red], "3": [red]})
+        self.assertEqual(sorted(os.listdir(self.output_dir)), sorted([f"image_{red}.png", "doc_manifest.json"]))
+        error, = [event for event in self.events if event["name"] == "extract_images.decode_error"]
+        self.assertEqual((error["level"], error["fields"]["page"]), ("error", 2))
+
+        # The failed extraction is not cached, so the next run extracts the document again
+        manifest = self.manager.extract_images_from_pdf(self.source, self.output_dir)
+        self.assertFalse(self.done_event()["fields"]["cached"])
+        self.assertEqual(len(manifest["images"]), 2)
+        self.manager.extract_images_from_pdf(self.source, self.output_dir)
+        self.assertTrue(self.done_event()["fields"]["cached"])
+
+    def test_write_failure_keeps_the_other_images(self):
+        # Writing fails for the blue image only
+        def write_image_file(image_path, data):
+            if image_path.name == f"image_{blue}.png":
+                raise OSError("disk full")
+            return write(image_path, data)
+
+        write = pdf_manager._write_image_file
+        _, blue = self.image_ids(self.manager.extract_images_from_pdf(self.source, None))
+        with mock.patch.object(pdf_manager, "_write_image_file", side_effect=write_image_file):
+            manifest = self.manager.extract_images_from_pdf(self.source, self.output_dir)
+        red, missing = self.image_ids(manifest)
+        self.assertIsNone(missing)
+        self.assertEqual(manifest["pages"]["2"], [red])
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, f"image_{blue}.png")))
+        self.assertEqual(len([event for event in self.events if event["name"] == "extract_images.write_error"]), 1)
+
+    def test_unreadable_document(self):
+        broken = os.path.join(self.dir, "broken.pdf")
+        with open(broken, "wb") as broken_file:
+            broken_file.write(b"%PDF-1.7\nnot a document")
+        self.assertIsNone(self.manager.extract_images_from_pdf(broken, self.output_dir))
+        self.assertIn("extract_images.error", [event["name"] for event in self.events])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+# Tests of the extraction cache: lookups, file hashes, invalidation and eviction
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import extraction_cache
+import pdf_manager
+from tests import make_pdf, quiet_manager
+from extraction_cache import Extraction_cache, hash_file
+
+
+class Extraction_cache_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.cache_dir = os.path.join(self.dir, "cache")
+        self.cache = Extraction_cache(self.cache_dir)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temporary_dir.cleanup()
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("abc", "text", 0))
+        self.cache.put("abc", "text", "first page", 0)
+        self.cache.put("abc", "metadata", {"title": "Report", "pages": [1, 2]})
+        self.assertEqual(self.cache.get("abc", "text", 0), "first page")
+        self.assertEqual(self.cache.get("abc", "metadata"), {"title": "Report", "pages": [1, 2]})
+        # Other pages, operations and documents miss
+        self.assertIsNone(self.cache.get("abc", "text", 1))
+        self.assertIsNone(self.cache.get("abc", "text"))
+        self.assertIsNone(self.cache.get("def", "text", 0))
+
+        # Entries outlive the connection
+        self.cache.close()
+        self.cache = Extraction_cache(self.cache_dir)
+        self.assertEqual(self.cache.get("abc", "text", 0), "first page")
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("abc", "text", 0))
+
+    def test_file_hash_is_remembered(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"))
+        with open(source, "rb") as source_file:
+            expected = Extraction_cache.buffer_hash(source_file.read())
+        with mock.patch.object(extraction_cache, "hash_file", wraps=hash_file) as hashing:
+            self.assertEqual(self.cache.file_hash(source), expected)
+            self.assertEqual(self.cache.file_hash(source), expected)
+            self.assertEqual(hashing.call_count, 1)
+
+            # A new modification time means reading the file again
+            stat = os.stat(source)
+            os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual(self.cache.file_hash(source), expected)
+            self.assertEqual(hashing.call_count, 2)
+
+    def test_changed_file_is_extracted_again(self):
+        manager = quiet_manager(cache=self.cache)
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=2, text="First")
+        first = manager.read_pdf_document(source)
+        self.assertEqual([text.strip() for _, text in first[1]], ["First 1", "First 2"])
+
+        # Same content: served from the cache without parsing the document, whatever its path
+        copy = shutil.copyfile(source, os.path.join(self.dir, "copy.pdf"))
+        with mock.patch.object(pdf_manager, "_open_source", side_effect=AssertionError("parsed")):
+            self.assertEqual(manager.read_pdf_document(copy), first)
+
+        # New content: a new hash, so no stale entry is returned
+        make_pdf(source, pages=3, text="Second")
+        stat = os.stat(source)
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        pages_count, pages = manager.read_pdf_document(source)
+        self.assertEqual(pages_count, 3)
+        self.assertEqual([text.strip() for _, text in pages], ["Second 1", "Second 2", "Second 3"])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.max_bytes = 250
+        value = "x" * 98  # 100 bytes once serialized
+        # A clock moving forward at each call, so that the access order is unambiguous
+        with mock.patch.object(extraction_cache.time, "time", side_effect=itertools.count(1000.0)):
+            self.cache.put("a", "text", value)
+            self.cache.put("b", "text", value)
+            self.assertEqual(self.cache.get("a", "text"), value)
+            self.cache.put("c", "text", value)
+        self.assertIsNone(self.cache.get("b", "text"))
+        self.assertEqual(self.cache.get("a", "text"), value)
+        self.assertEqual(self.cache.get("c", "text"), value)
+
+    def test_running_total(self):
+        # The total kept by the puts and evictions matches the entries
+        def check_total():
+            connection = self.cache._connection
+            self.assertEqual(connection.execute("SELECT size FROM totals").fetchone()[0],
+                             connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+
+        self.cache.max_bytes = 1000
+        for number in range(30):
+            self.cache.put(f"document{number % 12}", "text", "x" * (number * 7))
+            check_total()
+        self.cache.clear()
+        check_total()
+
+        # A cache database without the total gets it computed when opened
+        self.cache.put("a", "text", "x" * 98)
+        self.cache._connection.execute("DROP TABLE totals")
+        self.cache.close()
+        self.cache = Extraction_cache(self.cache_dir, max_bytes=1000)
+        check_total()
+
+    def test_file_hashes_are_evicted_with_their_entries(self):
+        self.cache.max_bytes = 250
+        first = make_pdf(os.path.join(self.dir, "first.pdf"))
+        second = make_pdf(os.path.join(self.dir, "second.pdf"), text="Other")
+        with mock.patch.object(extraction_cache.time, "time", side_effect=itertools.count(1000.0)):
+            first_hash = self.cache.file_hash(first)
+            self.cache.put(first_hash, "text", "x" * 98, 0)
+            self.cache.put(first_hash, "text", "x" * 98, 1)
+            second_hash = self.cache.file_hash(second)
+            self.cache.put(second_hash, "text", "x" * 98, 0)
+        # One page of the first document is left, so its hash is kept
+        self.assertIsNone(self.cache.get(first_hash, "text", 0))
+        def hashes() -> set:
+            return {row[0] for row in self.cache._connection.execute("SELECT hash FROM file_hashes")}
+
+        self.assertEqual(hashes(), {first_hash, second_hash})
+
+        self.cache.put(second_hash, "text", "x" * 98, 1)
+        self.assertIsNone(self.cache.get(first_hash, "text", 1))
+        self.assertEqual(hashes(), {second_hash})
+
+    def test_threads(self):
+        errors = []
+
+        def work(number: int) -> None:
+            try:
+                for page_index in range(20):
+                    self.cache.put(f"document{number}", "text", f"page {page_index}", page_index)
+                    self.assertEqual(self.cache.get(f"document{number}", "text", page_index), f"page {page_index}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(number,)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.cache.get("document3", "text", 19), "page 19")
+
+    def test_oversized_entry_is_not_kept(self):
+        self.cache.max_bytes = 50
+        self.cache.put("a", "text", "x" * 100)
+        self.assertIsNone(self.cache.get("a", "text"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# Tests of the incremental saves
+import os
+import shutil
+import tempfile
+import unittest
+
+import pikepdf
+
+from tests import dummy_pdf, make_pdf, quiet_manager
+from incremental_update import changed_objects, find_startxref, object_fingerprints
+
+
+class Incremental_update_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    # The original bytes come first, followed by a cross-reference section pointing back to them
+    def assert_appended(self, source: str, output: str) -> None:
+        with open(source, "rb") as original_file, open(output, "rb") as output_file:
+            original, updated = original_file.read(), output_file.read()
+        self.assertGreater(len(updated), len(original))
+        self.assertEqual(updated[:len(original)], original)
+        update = updated[len(original):]
+        self.assertIn(b"startxref", update)
+        self.assertRegex(update, rb"/Prev %d\b" % find_startxref(original[-4096:]))
+        self.assertGreaterEqual(find_startxref(updated[-4096:]), len(original))
+
+    # dummy.pdf has an indirect /Length, read back by pikepdf as a Python int
+    def test_fingerprints_skip_indirect_scalars(self):
+        with pikepdf.open(dummy_pdf) as pdf:
+            self.assertTrue(any(not isinstance(obj, pikepdf.Object) for obj in pdf.objects))
+            fingerprints = object_fingerprints(pdf)
+            self.assertEqual(changed_objects(pdf, fingerprints), [])
+
+    def test_incremental_rotate_of_dummy(self):
+        output = os.path.join(self.dir, "rotated.pdf")
+        self.manager.rotate_pdf(dummy_pdf, output, 90, save_options={"incremental": True})
+        self.assert_appended(dummy_pdf, output)
+        with pikepdf.open(output) as pdf:
+            self.assertEqual(int(pdf.pages[0].Rotate), 90)
+
+    def test_incremental_watermark_and_metadata_of_dummy(self):
+        watermarked = os.path.join(self.dir, "watermarked.pdf")
+        self.manager.add_watermark(dummy_pdf, watermarked, "DRAFT", save_options={"incremental": True})
+        self.assert_appended(dummy_pdf, watermarked)
+
+        titled = os.path.join(self.dir, "titled.pdf")
+        self.manager.set_pdf_metadata(dummy_pdf, titled, {"title": "Updated"}, save_options={"incremental": True})
+        self.assert_appended(dummy_pdf, titled)
+        with pikepdf.open(titled) as pdf:
+            self.assertEqual(str(pdf.docinfo["/Title"]), "Updated")
+
+    def test_in_place_update_appends_only(self):
+        source = shutil.copyfile(dummy_pdf, os.path.join(self.dir, "dummy.pdf"))
+        size = os.path.getsize(source)
+        self.manager.cropping_pdf_document(source, source, (0, 0, 300, 300), save_options={"incremental": True})
+        self.assert_appended(dummy_pdf, source)
+        self.assertGreater(os.path.getsize(source), size)
+        with pikepdf.open(source) as pdf:
+            self.assertEqual([float(value) for value in pdf.pages[0].CropBox], [0, 0, 300, 300])
+
+    def test_unchanged_document_appends_nothing(self):
+        source = make_pdf(os.path.join(self.dir, "plain.pdf"))
+        with pikepdf.open(source) as pdf:
+            self.assertEqual(changed_objects(pdf, object_fingerprints(pdf)), [])
+
+    def test_incremental_and_linearize_are_exclusive(self):
+        with self.assertRaises(ValueError):
+            self.manager.rotate_pdf(dummy_pdf, os.path.join(self.dir, "x.pdf"), 90,
+                                    save_options={"incremental": True, "linearize": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+# Tests of the instrumentation: spans, counters, hooks and profiles
+import io
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from instrumentation import Instrumentation, console_hook, instrumented
+
+
+# Object whose methods are instrumented operations
+class Instrumented_object:
+    def __init__(self, instrumentation: Instrumentation):
+        self.instrumentation = instrumentation
+
+    @instrumented("outer")
+    def outer(self) -> int:
+        return self.inner() + 1
+
+    @instrumented("inner")
+    def inner(self) -> int:
+        self.buffer = bytearray(2 * 1024 * 1024)
+        return sum(range(1000))
+
+
+class Instrumentation_test(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.instrumentation = Instrumentation(hooks=[self.events.append])
+
+    def of_type(self, event_type: str) -> list:
+        return [event for event in self.events if event["type"] == event_type]
+
+    def test_spans_nest(self):
+        with self.instrumentation.span("split", filename="doc.pdf"):
+            with self.instrumentation.span("split.write") as fields:
+                fields["chunks"] = 2
+            with self.instrumentation.span("split.write"):
+                pass
+        spans = self.of_type("span")
+        self.assertEqual([(span["name"], span["parent"]) for span in spans],
+                         [("split.write", "split"), ("split.write", "split"), ("split", None)])
+        self.assertEqual(spans[0]["fields"], {"chunks": 2})
+        self.assertEqual(spans[2]["fields"], {"filename": "doc.pdf"})
+        self.assertGreaterEqual(spans[2]["duration_seconds"],
+                                spans[0]["duration_seconds"] + spans[1]["duration_seconds"])
+        self.assertEqual(self.instrumentation.summary()["spans"]["split.write"]["count"], 2)
+
+    def test_spans_nest_per_thread(self):
+        # A span opened by another thread is not nested in the spans of this one
+        def work():
+            with self.instrumentation.span("worker"):
+                pass
+
+        with self.instrumentation.span("main"):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        self.assertEqual([(span["name"], span["parent"]) for span in self.of_type("span")],
+                         [("worker", None), ("main", None)])
+
+    def test_a_failing_block_still_ends_its_span(self):
+        with self.assertRaises(ValueError):
+            with self.instrumentation.span("read"):
+                raise ValueError("broken")
+        with self.instrumentation.span("next"):
+            pass
+        self.assertEqual([(span["name"], span["parent"]) for span in self.of_type("span")],
+                         [("read", None), ("next", None)])
+
+    def test_counters(self):
+        self.instrumentation.count("pages")
+        self.instrumentation.count("pages", 4, filename="doc.pdf")
+        self.instrumentation.count("bytes_written", 1024)
+        counters = self.of_type("counter")
+        self.assertEqual([(counter["value"], counter["total"]) for counter in counters[:2]], [(1, 1), (4, 5)])
+        self.assertEqual(counters[1]["fields"], {"filename": "doc.pdf"})
+        self.assertEqual(self.instrumentation.counters, {"pages": 5, "bytes_written": 1024})
+        self.assertEqual(self.instrumentation.summary()["counters"], {"pages": 5, "bytes_written": 1024})
+
+    def test_hooks(self):
+        later = []
+        self.instrumentation.add_hook(later.append)
+        self.instrumentation.event("split.done", "Split done", chunks=3)
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(later, self.events)
+        event = self.events[0]
+        self.assertEqual((event["name"], event["level"], event["message"], event["fields"]),
+                         ("split.done", "info", "Split done", {"chunks": 3}))
+        self.assertIn("timestamp", event)
+
+        # The console hook prints the messages of the events only
+        output = io.StringIO()
+        with redirect_stdout(output):
+            console = Instrumentation()
+            console.event("read.error", "An error occurred", "error")
+            console.event("read.quiet")
+            console.count("pages")
+            with console.span("read"):
+                pass
+        self.assertEqual(output.getvalue(), "An error occurred\n")
+        self.assertEqual(console.hooks, [console_hook])
+
+    def test_no_event_is_built_without_hooks(self):
+        quiet = Instrumentation(hooks=[])
+        with mock.patch.object(quiet, "_emit") as emitting:
+            with quiet.span("read"):
+                with quiet.span("read.page", page=1):
+                    quiet.count("pages")
+            quiet.event("read.done", "Done")
+        emitting.assert_not_called()
+        # The totals are kept all the same
+        summary = quiet.summary()
+        self.assertEqual(summary["counters"], {"pages": 1})
+        self.assertEqual(summary["spans"]["read.page"]["count"], 1)
+
+    def test_profile(self):
+        self.instrumentation.profile = True
+        target = Instrumented_object(self.instrumentation)
+        self.assertEqual(target.outer(), sum(range(1000)) + 1)
+
+        # Only the outer operation is profiled, the inner one is part of its profile
+        self.assertEqual(list(self.instrumentation.profiles), ["outer"])
+        profile, = self.of_type("profile")
+        self.assertEqual(profile["name"], "outer")
+        self.assertIn("inner", profile["report"])
+        self.assertEqual([(span["name"], span["parent"]) for span in self.of_type("span")],
+                         [("inner", "outer"), ("outer", None)])
+
+    def test_trace_memory(self):
+        self.instrumentation.trace_memory = True
+        Instrumented_object(self.instrumentation).outer()
+        self.assertEqual(list(self.instrumentation.memory_peaks), ["outer"])
+        self.assertGreaterEqual(self.instrumentation.memory_peaks["outer"], 2 * 1024 * 1024)
+        outer, = [span for span in self.of_type("span") if span["name"] == "outer"]
+        self.assertEqual(outer["fields"]["peak_python_bytes"], self.instrumentation.memory_peaks["outer"])
+        self.assertEqual(self.instrumentation.summary()["peak_python_bytes"], self.instrumentation.memory_peaks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+# Tests of the job journal: resumed runs, options keys, quarantine and atomic outputs
+import json
+import os
+import tempfile
+import unittest
+
+from tests import make_image, make_pdf
+from batch import run_batch, run_operation
+from instrumentation import Instrumentation
+from job_journal import Job_journal, atomic_output, options_key
+from pdf_manager import PDF_manager
+
+
+class Job_journal_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.journal_path = os.path.join(self.dir, "job.jsonl")
+        self.events = []
+        self.manager = PDF_manager(instrumentation=Instrumentation(hooks=[self.events.append]))
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def read_journal(self) -> list:
+        with open(self.journal_path, "r", encoding="utf-8") as journal_file:
+            return [json.loads(line) for line in journal_file]
+
+    # Keep the first records of the journal, as if the job had been killed after writing them
+    def interrupt_journal(self, records: int) -> list:
+        kept = self.read_journal()[:records]
+        with open(self.journal_path, "w", encoding="utf-8") as journal_file:
+            journal_file.writelines(json.dumps(record) + "\n" for record in kept)
+        return kept
+
+    # Give a file a modification time no rewrite can produce
+    def mark(self, path: str) -> None:
+        os.utime(path, ns=(10 ** 9, 10 ** 9))
+
+    def assert_marked(self, path: str) -> None:
+        self.assertEqual(os.stat(path).st_mtime_ns, 10 ** 9, f"{path} was written again")
+
+    def test_interrupted_split_resumes(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=6)
+        output_dir = os.path.join(self.dir, "out")
+        outputs = self.manager.splitting_pdf_document(source, output_dir, chunk_size=2,
+                                                      journal=Job_journal(self.journal_path))
+        self.assertEqual(len(outputs), 3)
+
+        # Killed after the first two chunks: the third one was never written
+        kept = self.interrupt_journal(2)
+        self.assertEqual([record["part"] for record in kept], ["pages 1-2", "pages 3-4"])
+        os.remove(outputs[2])
+        for output in outputs[:2]:
+            self.mark(output)
+
+        self.events.clear()
+        resumed = self.manager.splitting_pdf_document(source, output_dir, chunk_size=2,
+                                                      journal=Job_journal(self.journal_path))
+        self.assertEqual(resumed, outputs)
+        for output in outputs[:2]:
+            self.assert_marked(output)
+        self.assertTrue(os.path.isfile(outputs[2]))
+        write_span = next(event for event in self.events if event["name"] == "split.write")
+        self.assertEqual(write_span["fields"]["chunks"], 1)
+
+    def test_resume_rewrites_a_changed_chunk(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=4)
+        output_dir = os.path.join(self.dir, "out")
+        outputs = self.manager.splitting_pdf_document(source, output_dir, chunk_size=2,
+                                                      journal=Job_journal(self.journal_path))
+        # A truncated output is not trusted
+        with open(outputs[0], "r+b") as output_file:
+            output_file.truncate(10)
+        self.mark(outputs[1])
+
+        self.manager.splitting_pdf_document(source, output_dir, chunk_size=2, journal=Job_journal(self.journal_path))
+        self.assertGreater(os.path.getsize(outputs[0]), 10)
+        self.assert_marked(outputs[1])
+
+    def test_resume_with_other_save_options_rewrites_the_chunks(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=4)
+        output_dir = os.path.join(self.dir, "out")
+        outputs = self.manager.splitting_pdf_document(source, output_dir, chunk_size=2,
+                                                      journal=Job_journal(self.journal_path))
+        for output in outputs:
+            self.mark(output)
+
+        self.events.clear()
+        self.manager.splitting_pdf_document(source, output_dir, chunk_size=2, journal=Job_journal(self.journal_path),
+                                            save_options={"linearize": True})
+        for output in outputs:
+            self.assertNotEqual(os.stat(output).st_mtime_ns, 10 ** 9)
+        write_span = next(event for event in self.events if event["name"] == "split.write")
+        self.assertEqual(write_span["fields"]["chunks"], 2)
+
+        # The chunks of the new options are kept by a rerun with them
+        for output in outputs:
+            self.mark(output)
+        self.manager.splitting_pdf_document(source, output_dir, chunk_size=2, journal=Job_journal(self.journal_path),
+                                            save_options={"linearize": True})
+        for output in outputs:
+            self.assert_marked(output)
+
+    def test_interrupted_extraction_resumes(self):
+        from reportlab.pdfgen import canvas
+
+        source = os.path.join(self.dir, "images.pdf")
+        can = canvas.Canvas(source)
+        for number, color in enumerate([(200, 30, 30), (30, 200, 30), (30, 30, 200)]):
+            can.drawImage(make_image(os.path.join(self.dir, f"image{number}.png"), color=color), 72, 72)
+            can.showPage()
+        can.save()
+
+        output_dir = os.path.join(self.dir, "images")
+        manifest = self.manager.extract_images_from_pdf(source, output_dir, journal=Job_journal(self.journal_path))
+        self.assertEqual(len(manifest["images"]), 3)
+
+        # Killed after the first image was recorded
+        kept_image = self.interrupt_journal(1)[0]["output"]
+        self.mark(kept_image)
+        for image in manifest["images"].values():
+            path = os.path.join(output_dir, image["filename"])
+            if path != kept_image:
+                os.remove(path)
+
+        self.events.clear()
+        resumed = self.manager.extract_images_from_pdf(source, output_dir, journal=Job_journal(self.journal_path))
+        self.assertEqual(resumed["pages"], manifest["pages"])
+        self.assert_marked(kept_image)
+        for image in manifest["images"].values():
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, image["filename"])))
+        self.assertEqual(sum(event["name"] == "extract_images.saved" for event in self.events), 2)
+
+    def test_options_key(self):
+        self.assertEqual(options_key({"angle": 90, "pages": "1"}), options_key({"pages": "1", "angle": 90}))
+        self.assertNotEqual(options_key({"angle": 90}), options_key({"angle": 180}))
+        # Runtime options and passwords do not change the outputs
+        self.assertEqual(options_key({"angle": 90}),
+                         options_key({"angle": 90, "workers": 8, "journal": "job.jsonl", "password": "secret"}))
+
+    def test_changed_options_are_processed_again(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"))
+        options = {"output_dir": os.path.join(self.dir, "out"), "journal": self.journal_path, "angle": 90}
+        first, = run_batch("rotate", [source], options)
+        self.assertTrue(first["ok"])
+        self.assertNotIn("resumed", first)
+
+        again, = run_batch("rotate", [source], dict(options, workers=4))
+        self.assertTrue(again.get("resumed"))
+
+        changed, = run_batch("rotate", [source], dict(options, angle=180))
+        self.assertTrue(changed["ok"])
+        self.assertNotIn("resumed", changed)
+        self.assertEqual([record["options"] for record in self.read_journal()],
+                         [options_key(options), options_key(dict(options, angle=180))])
+
+    def test_failing_input_is_quarantined(self):
+        source = os.path.join(self.dir, "broken.pdf")
+        with open(source, "wb") as broken_file:
+            broken_file.write(b"%PDF-1.7\nnot a document")
+        quarantine_dir = os.path.join(self.dir, "quarantine")
+        options = {"output_dir": os.path.join(self.dir, "out"), "journal": self.journal_path,
+                   "quarantine_dir": quarantine_dir, "angle": 90}
+
+        result = run_operation("rotate", source, options)
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["quarantined"], os.path.join(quarantine_dir, "broken.pdf"))
+        self.assertFalse(os.path.exists(source))
+        self.assertTrue(os.path.isfile(result["quarantined"]))
+        record, = self.read_journal()
+        self.assertEqual(record["type"], "quarantined")
+        self.assertEqual(record["destination"], result["quarantined"])
+
+        # A second input of the same name does not overwrite the first
+        with open(source, "wb") as broken_file:
+            broken_file.write(b"garbage")
+        self.assertEqual(run_operation("rotate", source, options)["quarantined"],
+                         os.path.join(quarantine_dir, "broken_1.pdf"))
+
+    def test_readable_failure_is_not_quarantined(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"))
+        quarantine_dir = os.path.join(self.dir, "quarantine")
+        result = run_operation("rotate", source, {"output_dir": os.path.join(self.dir, "out"),
+                                                  "quarantine_dir": quarantine_dir, "angle": 45})
+        self.assertFalse(result["ok"])
+        self.assertNotIn("quarantined", result)
+        self.assertTrue(os.path.isfile(source))
+
+    def test_atomic_output_leaves_no_partial_file(self):
+        path = os.path.join(self.dir, "output.txt")
+        with self.assertRaises(RuntimeError):
+            with atomic_output(path, "w", encoding="utf-8") as output_file:
+                output_file.write("partial")
+                raise RuntimeError("interrupted")
+        self.assertEqual(os.listdir(self.dir), [])
+
+        # An earlier output is kept as it was
+        with atomic_output(path, "w", encoding="utf-8") as output_file:
+            output_file.write("complete")
+        with self.assertRaises(RuntimeError):
+            with atomic_output(path, "w", encoding="utf-8") as output_file:
+                output_file.write("partial")
+                raise RuntimeError("interrupted")
+        self.assertEqual(os.listdir(self.dir), ["output.txt"])
+        with open(path, "r", encoding="utf-8") as output_file:
+            self.assertEqual(output_file.read(), "complete")
+
+
+if __name__ == "__main__":
+    unittest.main()
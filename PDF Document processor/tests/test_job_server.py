@@ -0,0 +1,174 @@
+# Tests of the job server, over HTTP on an ephemeral port
+import asyncio
+import http.client
+import io
+import json
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import pikepdf
+
+from tests import dummy_pdf
+from instrumentation import Instrumentation
+from job_server import Job_server
+
+
+class Job_server_test(unittest.TestCase):
+    # Largest upload accepted by the server under test, in bytes
+    max_upload_bytes = 64 * 1024
+
+    # Run the server in its own event loop, on a background thread
+    @classmethod
+    def setUpClass(cls):
+        cls.temporary_dir = tempfile.TemporaryDirectory()
+        cls.job_server = Job_server(cls.temporary_dir.name, workers=1, max_upload_bytes=cls.max_upload_bytes,
+                                    instrumentation=Instrumentation(hooks=[]))
+        cls.job_server.head_timeout = 1
+        cls.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def serve():
+            cls.stopping = asyncio.Event()
+            server = await cls.job_server.start("127.0.0.1", 0)
+            cls.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            try:
+                await cls.stopping.wait()
+            finally:
+                server.close()
+                await server.wait_closed()
+                await cls.job_server.stop()
+
+        cls.thread = threading.Thread(target=cls.loop.run_until_complete, args=(serve(),), daemon=True)
+        cls.thread.start()
+        if not ready.wait(60):
+            raise RuntimeError("The job server did not start.")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.stopping.set)
+        cls.thread.join(60)
+        cls.loop.close()
+        cls.temporary_dir.cleanup()
+
+    # Send one request, the server closes every connection after its response
+    def request(self, method: str, path: str, body=None, headers: dict = None) -> tuple:
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    def upload(self, path: str, filename: str = "dummy.pdf") -> str:
+        with open(path, "rb") as upload_file:
+            status, _, body = self.request("POST", f"/uploads?filename={filename}", upload_file.read())
+        self.assertEqual(status, 201, body)
+        return json.loads(body)["upload_id"]
+
+    # Queue a job and wait until it is finished
+    def run_job(self, command: str, inputs: list, options: dict = None) -> dict:
+        status, headers, body = self.request("POST", "/jobs", {"command": command, "inputs": inputs,
+                                                               "options": options or {}})
+        self.assertEqual(status, 202, body)
+        location = headers["Location"]
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            status, _, body = self.request("GET", location)
+            self.assertEqual(status, 200, body)
+            job = json.loads(body)
+            if job["finished"] is not None:
+                return job
+            time.sleep(0.1)
+        self.fail(f"The {command} job did not finish.")
+
+    def test_upload_run_fetch_and_delete(self):
+        upload_id = self.upload(dummy_pdf)
+        job = self.run_job("rotate", [upload_id], {"angle": 90})
+        self.assertEqual(job["status"], "done", job)
+        self.assertEqual(job["results"][0]["outputs"], ["dummy_rotated.pdf"])
+
+        status, headers, body = self.request("GET", f"/jobs/{job['job_id']}/result")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "application/pdf")
+        self.assertEqual(int(headers["Content-Length"]), len(body))
+        with pikepdf.open(io.BytesIO(body)) as pdf:
+            self.assertEqual(int(pdf.pages[0].Rotate), 90)
+
+        status, _, body = self.request("DELETE", f"/jobs/{job['job_id']}")
+        self.assertEqual(status, 200, body)
+        self.assertEqual(self.request("GET", f"/jobs/{job['job_id']}")[0], 404)
+        self.assertEqual(self.request("DELETE", f"/uploads/{upload_id}")[0], 200)
+        self.assertEqual(self.request("DELETE", f"/uploads/{upload_id}")[0], 404)
+
+    def test_status(self):
+        status, _, body = self.request("GET", "/status")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["workers"], 1)
+
+    def test_unknown_job(self):
+        for method, path in [("GET", "/jobs/missing"), ("GET", "/jobs/missing/result"), ("DELETE", "/jobs/missing")]:
+            status, _, body = self.request(method, path)
+            self.assertEqual(status, 404, path)
+            self.assertIn("error", json.loads(body))
+
+    def test_bad_command(self):
+        upload_id = self.upload(dummy_pdf)
+        status, _, body = self.request("POST", "/jobs", {"command": "explode", "inputs": [upload_id]})
+        self.assertEqual(status, 400)
+        self.assertIn("Unknown command", json.loads(body)["error"])
+
+        status, _, _ = self.request("POST", "/jobs", {"command": "rotate", "inputs": [upload_id],
+                                                      "options": {"colour": "red"}})
+        self.assertEqual(status, 400)
+        self.assertEqual(self.request("POST", "/jobs", {"command": "rotate", "inputs": ["missing"]})[0], 400)
+        self.assertEqual(self.request("POST", "/jobs", b"{not json")[0], 400)
+
+    def test_worker_counts_are_not_job_options(self):
+        upload_id = self.upload(dummy_pdf)
+        for command, option in [("split", "split_workers"), ("optimize", "image_workers")]:
+            status, _, body = self.request("POST", "/jobs", {"command": command, "inputs": [upload_id],
+                                                             "options": {option: 64}})
+            self.assertEqual(status, 400, command)
+            self.assertIn(option, json.loads(body)["error"])
+
+    def test_slow_request_head(self):
+        with socket.create_connection(("127.0.0.1", self.port), timeout=60) as connection:
+            connection.sendall(b"GET /status HTTP/1.1\r\nHost: 127.0.0.1\r\n")
+            response = b""
+            while block := connection.recv(4096):
+                response += block
+        self.assertTrue(response.startswith(b"HTTP/1.1 408"), response)
+        # The server still answers the other clients
+        self.assertEqual(self.request("GET", "/status")[0], 200)
+
+    def test_oversized_upload(self):
+        status, _, body = self.request("POST", "/uploads?filename=big.pdf", b"%" * (self.max_upload_bytes + 1))
+        self.assertEqual(status, 413)
+        self.assertIn("exceeds", json.loads(body)["error"])
+        # The refused upload is not kept
+        self.assertNotIn("big.pdf", [upload["filename"] for upload in self.job_server.uploads.values()])
+
+    def test_optimize_dry_run_job(self):
+        upload_id = self.upload(dummy_pdf)
+        job = self.run_job("optimize", [upload_id], {"dry_run": True})
+        self.assertEqual(job["status"], "done", job)
+        self.assertTrue(job["ok"])
+        result = job["results"][0]
+        self.assertEqual(result["outputs"], [])
+        self.assertIsNone(result["report"]["output_filename"])
+
+        # Nothing was written, so there is nothing to download
+        status, _, _ = self.request("GET", f"/jobs/{job['job_id']}/result")
+        self.assertEqual(status, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
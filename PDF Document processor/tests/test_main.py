@@ -0,0 +1,50 @@
+# Tests of the interactive menu
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import main
+from tests import make_pdf
+
+
+class Menu_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=3)
+        self.output = os.path.join(self.dir, "out.pdf")
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    # Answer the prompts of the menu in turn, until it exits
+    def run_menu(self, *answers: str) -> str:
+        output = io.StringIO()
+        with mock.patch("builtins.input", side_effect=[*answers, "-1"]), redirect_stdout(output):
+            with self.assertRaises(SystemExit):
+                main.main()
+        return output.getvalue()
+
+    def test_invalid_rotation_and_crop_keep_the_menu_running(self):
+        output = self.run_menu("5", self.source, self.output, "90", "7",
+                               "9", self.source, self.output, "700 800 900 900", "",
+                               "5", os.path.join(self.dir, "missing.pdf"), self.output, "90", "")
+        self.assertIn("An error occurred while rotating the PDF", output)
+        self.assertIn("An error occurred while cropping the PDF", output)
+        self.assertIn("Thank you for using the App", output)
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_text_of_an_unreadable_document(self):
+        broken = os.path.join(self.dir, "broken.pdf")
+        with open(broken, "wb") as broken_file:
+            broken_file.write(b"%PDF-1.7\nnot a document")
+        output = self.run_menu("1", broken, "1", self.source)
+        self.assertIn("An error occurred while reading the PDF", output)
+        self.assertIn("Page 3", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
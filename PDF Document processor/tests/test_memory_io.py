@@ -0,0 +1,136 @@
+# Tests of the memory-mapped and in-memory sources and outputs
+import io
+import mmap
+import os
+import tempfile
+import unittest
+from contextlib import ExitStack
+from unittest import mock
+
+import pikepdf
+
+import pdf_manager
+from tests import dummy_pdf, make_pdf, quiet_manager
+from pdf_manager import _Memory_reader, _Memory_writer, _open_source
+
+
+class Memory_stream_test(unittest.TestCase):
+    def test_reader(self):
+        reader = _Memory_reader(bytearray(b"0123456789"))
+        self.assertEqual(reader.read(3), b"012")
+        self.assertEqual(reader.seek(-2, io.SEEK_END), 8)
+        self.assertEqual(reader.read(), b"89")
+        self.assertEqual(reader.read(1), b"")
+        reader.seek(2, io.SEEK_SET)
+        self.assertEqual(reader.seek(3, io.SEEK_CUR), 5)
+        buffer = bytearray(4)
+        self.assertEqual(reader.readinto(buffer), 4)
+        self.assertEqual(buffer, b"5678")
+        self.assertEqual(reader.readinto(buffer), 1)
+        with self.assertRaises(ValueError):
+            reader.seek(-1)
+
+    def test_reader_releases_the_buffer(self):
+        data = bytearray(b"%PDF")
+        with _Memory_reader(data) as reader:
+            self.assertEqual(reader.read(), b"%PDF")
+            with self.assertRaises(BufferError):
+                data.extend(b"-1.7")
+        # Once closed, the owner can resize its buffer again
+        data.extend(b"-1.7")
+        self.assertEqual(data, b"%PDF-1.7")
+
+    def test_writer(self):
+        output = bytearray(b"previous content")
+        with _Memory_writer(output) as writer:
+            writer.write(b"abc")
+            writer.seek(5)
+            writer.write(b"xy")
+            writer.seek(1)
+            writer.write(b"B")
+            self.assertEqual(writer.size, 7)
+        self.assertEqual(output, b"aBc\0\0xy")
+
+        # A fixed-size buffer is written from its start and must be large enough
+        output = memoryview(bytearray(4))
+        with _Memory_writer(output) as writer:
+            writer.write(b"abc")
+            with self.assertRaises(ValueError):
+                writer.write(b"de")
+        self.assertEqual(output.tobytes(), b"abc\0")
+
+    def test_open_source(self):
+        with ExitStack() as stack:
+            self.assertIsInstance(_open_source(dummy_pdf, stack), io.BufferedReader)
+            with mock.patch.object(pdf_manager, "mmap_threshold", 0):
+                self.assertIsInstance(_open_source(dummy_pdf, stack), mmap.mmap)
+            self.assertIsInstance(_open_source(b"%PDF", stack), _Memory_reader)
+            stream = io.BytesIO(b"%PDF")
+            stream.read()
+            self.assertIs(_open_source(stream, stack), stream)
+            self.assertEqual(stream.tell(), 0)
+            with self.assertRaises(TypeError):
+                _open_source(1234, stack)
+
+
+class Memory_round_trip_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=3)
+        with open(self.source, "rb") as source_file:
+            self.data = source_file.read()
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def rotations(self, output) -> list:
+        with pikepdf.open(io.BytesIO(bytes(output))) as pdf:
+            return [int(page.get("/Rotate", 0)) for page in pdf.pages]
+
+    def test_sources(self):
+        expected = self.manager.read_pdf_document(self.source)
+        self.assertEqual(expected[0], 3)
+        with open(self.source, "rb") as source_file, \
+                mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            sources = {"bytes": self.data, "bytearray": bytearray(self.data), "memoryview": memoryview(self.data),
+                       "mmap": mapped, "BytesIO": io.BytesIO(self.data)}
+            for name, source in sources.items():
+                with self.subTest(source=name):
+                    self.assertEqual(self.manager.read_pdf_document(source), expected)
+
+        # Large files are memory-mapped
+        with mock.patch.object(pdf_manager, "mmap_threshold", 0):
+            self.assertEqual(self.manager.read_pdf_document(self.source), expected)
+
+    def test_outputs(self):
+        outputs = {"bytearray": bytearray(b"stale"), "memoryview": memoryview(bytearray(len(self.data) * 2)),
+                   "mmap": mmap.mmap(-1, len(self.data) * 2), "BytesIO": io.BytesIO()}
+        for name, output in outputs.items():
+            with self.subTest(output=name):
+                written = self.manager.rotate_pdf(self.data, output, 90, pages="2")
+                if isinstance(output, io.BytesIO):
+                    written = output.getvalue()
+                elif isinstance(output, mmap.mmap):
+                    written = output[:]
+                self.assertEqual(self.rotations(written), [0, 90, 0])
+        outputs["mmap"].close()
+
+    def test_output_buffer_too_small(self):
+        output = memoryview(bytearray(16))
+        with self.assertRaises(ValueError):
+            self.manager.rotate_pdf(self.data, output, 90)
+
+    def test_chained_in_memory(self):
+        # The output of one operation is the source of the next, without touching the disk
+        rotated = self.manager.rotate_pdf(io.BytesIO(self.data), bytearray(), 180)
+        encrypted = io.BytesIO()
+        self.assertTrue(self.manager.encrypt_pdf_aes256(rotated, "secret", encrypted))
+        decrypted = bytearray()
+        self.assertTrue(self.manager.decrypt_pdf_aes256(encrypted.getvalue(), "secret", decrypted))
+        self.assertEqual(self.rotations(decrypted), [180, 180, 180])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Tests of the merge, with both engines and with the deduplication of shared objects
+import io
+import os
+import tempfile
+import unittest
+
+import pikepdf
+
+from tests import dummy_pdf, make_image, make_pdf, quiet_manager
+
+
+class Merge_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.output = os.path.join(self.dir, "out", "merged.pdf")
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    # Documents of a few pages, each drawing the same image in its own copy
+    def make_documents(self, count: int, pages: int = 2) -> list:
+        image = make_image(os.path.join(self.dir, "image.png"), size=(200, 150))
+        return [make_pdf(os.path.join(self.dir, f"doc{number}.pdf"), pages=pages, text=f"Document {number} page",
+                         image_path=image) for number in range(count)]
+
+    # Page texts of the merged document, in order
+    def page_texts(self, source) -> list:
+        with pikepdf.open(source) as pdf:
+            return [page.Contents.read_bytes().split(b"(")[1].split(b")")[0].decode() if "/Contents" in page else None
+                    for page in pdf.pages]
+
+    def image_objects(self, source) -> int:
+        with pikepdf.open(source) as pdf:
+            return sum(1 for obj in pdf.objects
+                       if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == pikepdf.Name.Image)
+
+    def test_merge_keeps_the_page_order(self):
+        sources = self.make_documents(3)
+        for engine in ["pypdf2", "pikepdf"]:
+            with self.subTest(engine=engine):
+                report = self.manager.merge_pdf_documents(sources, self.output, engine=engine)
+                self.assertEqual(report["output_filename"], self.output)
+                self.assertEqual(report["documents"], 3)
+                self.assertEqual(report["pages"], 6)
+                self.assertEqual(report["output_bytes"], os.path.getsize(self.output))
+                self.assertEqual(report["deduplicated_objects"], 0)
+                self.assertEqual(self.page_texts(self.output),
+                                 [f"Document {number} page {page}" for number in range(3) for page in (1, 2)])
+
+    def test_merge_with_dummy(self):
+        with pikepdf.open(dummy_pdf) as pdf:
+            dummy_pages = len(pdf.pages)
+        report = self.manager.merge_pdf_documents([dummy_pdf, *self.make_documents(1)], self.output)
+        self.assertEqual(report["pages"], dummy_pages + 2)
+        with pikepdf.open(self.output) as pdf:
+            self.assertEqual(len(pdf.pages), dummy_pages + 2)
+
+    def test_deduplicate(self):
+        sources = self.make_documents(3)
+        plain = self.manager.merge_pdf_documents(sources, self.output, engine="pikepdf")
+        self.assertEqual(self.image_objects(self.output), 3)
+
+        deduplicated_output = os.path.join(self.dir, "deduplicated.pdf")
+        deduplicated = self.manager.merge_pdf_documents(sources, deduplicated_output, deduplicate=True)
+        self.assertGreaterEqual(deduplicated["deduplicated_objects"], 2)
+        self.assertEqual(self.image_objects(deduplicated_output), 1)
+        self.assertLess(deduplicated["output_bytes"], plain["output_bytes"])
+        self.assertEqual(self.page_texts(deduplicated_output), self.page_texts(self.output))
+
+    def test_limited_open_readers(self):
+        sources = self.make_documents(5, pages=1)
+        report = self.manager.merge_pdf_documents(sources, self.output, max_open_readers=2)
+        self.assertEqual(report["pages"], 5)
+        self.assertEqual(self.page_texts(self.output), [f"Document {number} page 1" for number in range(5)])
+        # The intermediate documents are removed
+        self.assertEqual(os.listdir(os.path.dirname(self.output)), ["merged.pdf"])
+
+    def test_merge_in_memory(self):
+        sources = []
+        for source in self.make_documents(2):
+            with open(source, "rb") as source_file:
+                sources.append(source_file.read())
+        output = io.BytesIO()
+        report = self.manager.merge_pdf_documents(sources, output, deduplicate=True)
+        self.assertIsNone(report["output_filename"])
+        self.assertEqual(report["output_bytes"], len(output.getvalue()))
+        self.assertEqual(len(self.page_texts(io.BytesIO(output.getvalue()))), 4)
+
+    def test_missing_input(self):
+        self.assertIsNone(self.manager.merge_pdf_documents([dummy_pdf, os.path.join(self.dir, "missing.pdf")],
+                                                           self.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# Tests of the metadata scanner records, directory walks and scan outputs
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import pikepdf
+
+from tests import make_pdf, quiet_manager
+from metadata_scanner import scan_documents, scan_fields, scan_metadata, walk_pdf_files, write_scan
+
+
+class Metadata_scanner_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.plain = make_pdf(os.path.join(self.dir, "plain.pdf"), pages=3)
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def path(self, *names: str) -> str:
+        return os.path.join(self.dir, *names)
+
+    # Save a copy of the plain document, encrypted
+    def encrypted(self, name: str, user: str, owner: str = "owner") -> str:
+        with pikepdf.open(self.plain) as pdf:
+            pdf.save(self.path(name), encryption=pikepdf.Encryption(user=user, owner=owner, R=6))
+        return self.path(name)
+
+    def write(self, name: str, data: bytes) -> str:
+        with open(self.path(name), "wb") as file:
+            file.write(data)
+        return self.path(name)
+
+    def test_plain_document(self):
+        titled = self.path("titled.pdf")
+        quiet_manager().set_pdf_metadata(self.plain, titled, {"title": "Report", "author": "Someone"})
+        record = scan_metadata(titled)
+        self.assertEqual(list(record), scan_fields)
+        self.assertEqual(record["path"], titled)
+        self.assertEqual(record["size"], os.path.getsize(titled))
+        self.assertEqual((record["pages"], record["encrypted"], record["error"]), (3, False, None))
+        self.assertEqual((record["title"], record["author"]), ("Report", "Someone"))
+        self.assertRegex(record["version"], r"^1\.\d$")
+
+    def test_encrypted_document(self):
+        record = scan_metadata(self.encrypted("locked.pdf", user="secret"))
+        self.assertTrue(record["encrypted"])
+        self.assertIsNone(record["error"])
+        # Without the password, only what the file itself tells
+        self.assertIsNone(record["pages"])
+        self.assertIsNone(record["title"])
+        self.assertIsNotNone(record["version"])
+        self.assertEqual(record["size"], os.path.getsize(self.path("locked.pdf")))
+
+        unlocked = scan_metadata(self.path("locked.pdf"), password="secret")
+        self.assertEqual((unlocked["encrypted"], unlocked["pages"], unlocked["error"]), (True, 3, None))
+
+    def test_owner_password_only(self):
+        # Encrypted against editing only, so the empty user password opens it
+        record = scan_metadata(self.encrypted("restricted.pdf", user=""))
+        self.assertEqual((record["encrypted"], record["pages"], record["error"]), (True, 3, None))
+
+    def test_corrupt_documents(self):
+        sources = {
+            "garbage": self.write("garbage.pdf", b"%PDF-1.4\n" + bytes(range(256))),
+            "not a pdf": self.write("text.pdf", b"hello"),
+            "empty": self.write("empty.pdf", b""),
+            "missing": self.path("missing.pdf"),
+        }
+        for name, source in sources.items():
+            with self.subTest(source=name):
+                record = scan_metadata(source)
+                self.assertIsNotNone(record["error"])
+                self.assertIsNone(record["pages"])
+                self.assertEqual(record["path"], source)
+        self.assertEqual(scan_metadata(sources["garbage"])["version"], "1.4")
+
+    def test_stream_source(self):
+        with open(self.plain, "rb") as source_file:
+            record = scan_metadata(io.BytesIO(source_file.read()))
+        self.assertIsNone(record["path"])
+        self.assertEqual((record["pages"], record["error"]), (3, None))
+
+    def test_walk_and_scan(self):
+        os.makedirs(self.path("archive", "b", "deep"))
+        os.makedirs(self.path("archive", "a"))
+        make_pdf(self.path("archive", "b", "deep", "three.pdf"), pages=1)
+        make_pdf(self.path("archive", "a", "ONE.PDF"), pages=2)
+        self.write(os.path.join("archive", "a", "notes.txt"), b"not scanned")
+        self.write(os.path.join("archive", "b", "two.pdf"), b"broken")
+        locked = self.encrypted(os.path.join("archive", "locked.pdf"), user="secret")
+
+        walked = list(walk_pdf_files([self.path("archive"), self.plain]))
+        self.assertEqual([os.path.relpath(path, self.dir) for path in walked],
+                         [os.path.join("archive", "locked.pdf"), os.path.join("archive", "a", "ONE.PDF"),
+                          os.path.join("archive", "b", "two.pdf"), os.path.join("archive", "b", "deep", "three.pdf"),
+                          "plain.pdf"])
+
+        records = list(scan_documents(walked))
+        self.assertEqual(sorted(records, key=lambda record: record["path"]),
+                         sorted(scan_documents(iter(walked), workers=2, chunk_size=2),
+                                key=lambda record: record["path"]))
+        self.assertEqual(next(record for record in records if record["path"] == locked)["encrypted"], True)
+
+        output = io.StringIO()
+        totals = write_scan(records, output)
+        self.assertEqual(totals, {"documents": 5, "pages": 6, "bytes": sum(map(os.path.getsize, walked)),
+                                  "encrypted": 1, "errors": 1})
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()], records)
+
+        output = io.StringIO(newline="")
+        self.assertEqual(write_scan(records, output, "csv"), totals)
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual([row["path"] for row in rows], walked)
+        with self.assertRaises(ValueError):
+            write_scan(records, io.StringIO(), "xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
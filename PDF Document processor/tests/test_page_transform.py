@@ -0,0 +1,136 @@
+# Tests of the page geometry and of the page-selective rotations and crops
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pikepdf
+
+from tests import make_image, make_pdf, quiet_manager
+from page_transform import combine_rotations, content_bounding_box, normalize_boxes, resolve_crop_boxes
+
+
+class Page_geometry_test(unittest.TestCase):
+    def test_normalize_boxes(self):
+        np.testing.assert_array_equal(normalize_boxes([300, 400, 100, 200]), [[100, 200, 300, 400]])
+        np.testing.assert_array_equal(normalize_boxes([[0, 10, 5, 0], [1, 2, 3, 4]]), [[0, 0, 5, 10], [1, 2, 3, 4]])
+
+    def test_combine_rotations(self):
+        np.testing.assert_array_equal(combine_rotations([0, 90, 270], [90, 360, 180]), [90, 90, 90])
+        np.testing.assert_array_equal(combine_rotations([0, 90, 270], [-90, 450, 0], relative=False), [270, 90, 0])
+        with self.assertRaises(ValueError):
+            combine_rotations([0, 0], [90, 45])
+
+    def test_resolve_crop_boxes(self):
+        mediaboxes = [[0, 0, 612, 792], [0, 0, 200, 200]]
+        boxes = [[100, 100, 300, 400], [150, 150, 400, 400]]
+        np.testing.assert_array_equal(resolve_crop_boxes(mediaboxes, boxes, margin=10),
+                                      [[90, 90, 310, 410], [140, 140, 200, 200]])
+        with self.assertRaises(ValueError):
+            resolve_crop_boxes([[0, 0, 100, 100]], [[200, 200, 300, 300]])
+
+
+class Content_bounding_box_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def test_content_bounding_box(self):
+        from reportlab.pdfgen import canvas
+
+        path = os.path.join(self.dir, "shapes.pdf")
+        can = canvas.Canvas(path)
+        can.rect(100, 200, 50, 80, fill=1)
+        can.showPage()
+        can.drawImage(make_image(os.path.join(self.dir, "image.png")), 72, 72, width=144, height=144)
+        can.showPage()
+        can.showPage()
+        can.save()
+
+        with pikepdf.open(path) as pdf:
+            self.assertEqual(content_bounding_box(pdf.pages[0]), (100, 200, 150, 280))
+            self.assertEqual(content_bounding_box(pdf.pages[1]), (72, 72, 216, 216))
+            self.assertIsNone(content_bounding_box(pdf.pages[2]))
+
+
+class Page_transform_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=4)
+        self.output = os.path.join(self.dir, "out.pdf")
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def rotations(self, path: str) -> list:
+        with pikepdf.open(path) as pdf:
+            return [int(page.obj.get("/Rotate", 0)) for page in pdf.pages]
+
+    def crop_boxes(self, path: str) -> list:
+        with pikepdf.open(path) as pdf:
+            return [[float(value) for value in page.obj.CropBox] if "/CropBox" in page.obj else None
+                    for page in pdf.pages]
+
+    def test_rotate_selected_pages(self):
+        self.manager.rotate_pdf(self.source, self.output, 90, pages="2-3")
+        self.assertEqual(self.rotations(self.output), [0, 90, 90, 0])
+
+        # Rotations add to the current ones
+        twice = os.path.join(self.dir, "twice.pdf")
+        self.manager.rotate_pdf(self.output, twice, 270, pages=[3, 4])
+        self.assertEqual(self.rotations(twice), [0, 90, 0, 270])
+
+    def test_rotation_per_page(self):
+        self.manager.transform_pages(self.source, self.output, rotation={"1-2": 90, 4: 180})
+        self.assertEqual(self.rotations(self.output), [90, 90, 0, 180])
+
+        absolute = os.path.join(self.dir, "absolute.pdf")
+        self.manager.transform_pages(self.output, absolute, rotation=270, pages="2-", relative=False)
+        self.assertEqual(self.rotations(absolute), [90, 270, 270, 270])
+
+    def test_crop_selected_pages(self):
+        self.manager.cropping_pdf_document(self.source, self.output, (50, 60, 300, 400), pages="1,3", margin=5)
+        self.assertEqual(self.crop_boxes(self.output), [[45, 55, 305, 405], None, [45, 55, 305, 405], None])
+
+    def test_crop_per_page(self):
+        self.manager.cropping_pdf_document(self.source, self.output, {1: (0, 0, 100, 100), "3-": (10, 10, 900, 900)})
+        self.assertEqual(self.crop_boxes(self.output), [[0, 0, 100, 100], None, [10, 10, 612, 792], [10, 10, 612, 792]])
+
+    def test_auto_crop_selected_pages(self):
+        self.manager.cropping_pdf_document(self.source, self.output, pages=[2])
+        boxes = self.crop_boxes(self.output)
+        self.assertEqual(boxes[:1] + boxes[2:], [None, None, None])
+        # The text line drawn at (72, 720)
+        left, bottom, right, top = boxes[1]
+        self.assertEqual(left, 72)
+        self.assertLess(bottom, 720)
+        self.assertGreater(top, 720)
+        self.assertGreater(right, left)
+
+    def test_content_is_not_rewritten(self):
+        self.manager.transform_pages(self.source, self.output, rotation=90, crop_box=(0, 0, 300, 300), pages="1")
+        with pikepdf.open(self.source) as source, pikepdf.open(self.output) as output:
+            self.assertEqual([page.Contents.read_bytes() for page in source.pages],
+                             [page.Contents.read_bytes() for page in output.pages])
+
+    def test_invalid_selections(self):
+        with self.assertRaises(ValueError):
+            self.manager.rotate_pdf(self.source, self.output, 90, pages=[5])
+        with self.assertRaises(ValueError):
+            self.manager.rotate_pdf(self.source, self.output, 90, pages="0-2")
+        with self.assertRaises(ValueError):
+            self.manager.rotate_pdf(self.source, self.output, 45)
+        with self.assertRaises(ValueError):
+            self.manager.cropping_pdf_document(self.source, self.output, (700, 800, 900, 900))
+        with self.assertRaises(ValueError):
+            self.manager.transform_pages(self.source, self.output)
+        self.assertFalse(os.path.exists(self.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
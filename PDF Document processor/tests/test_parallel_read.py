@@ -0,0 +1,72 @@
+# Tests of the text extraction over worker processes
+import os
+import tempfile
+import unittest
+
+from tests import corrupt_page, dummy_pdf, make_pdf, quiet_manager
+from extraction_cache import Extraction_cache
+
+
+class Parallel_read_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.first = make_pdf(os.path.join(self.dir, "first.pdf"), pages=7, text="First")
+        self.second = make_pdf(os.path.join(self.dir, "second.pdf"), pages=3, text="Second")
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def test_same_text_as_a_single_reader(self):
+        pages_count, pages = self.manager.read_pdf_document(self.first)
+        self.assertEqual(self.manager.parallel_read_pdf_document(self.first, workers=3, pages_per_task=2),
+                         (pages_count, pages, []))
+        with open(self.first, "rb") as source_file:
+            self.assertEqual(self.manager.parallel_read_pdf_document(source_file.read(), workers=2),
+                             (pages_count, pages, []))
+
+    def test_many_documents(self):
+        results = self.manager.parallel_read_pdf_documents([self.first, self.second, dummy_pdf], workers=2)
+        self.assertEqual(list(results), [self.first, self.second, dummy_pdf])
+        for source, result in results.items():
+            self.assertEqual(result, (*self.manager.read_pdf_document(source), []))
+
+    def test_duplicate_paths_are_read_once(self):
+        results = self.manager.parallel_read_pdf_documents([self.second, self.first, self.second], workers=2)
+        self.assertEqual(list(results), [self.second, self.first])
+        self.assertEqual(len(results[self.second][1]), 3)
+
+    def test_unreadable_documents_are_failures(self):
+        broken = os.path.join(self.dir, "broken.pdf")
+        with open(broken, "wb") as broken_file:
+            broken_file.write(b"%PDF-1.7\nnot a document")
+        missing = os.path.join(self.dir, "missing.pdf")
+        results = self.manager.parallel_read_pdf_documents([broken, self.second, missing], workers=2)
+        for source in (broken, missing):
+            pages_count, pages, failures = results[source]
+            self.assertEqual((pages_count, pages), (0, []))
+            self.assertEqual(len(failures), 1)
+            self.assertIsNone(failures[0][0])
+        self.assertEqual(results[self.second][2], [])
+
+    def test_broken_page_fails_alone(self):
+        corrupt_page(self.first, 4)
+        pages_count, pages, failures = self.manager.parallel_read_pdf_document(self.first, workers=2, pages_per_task=3)
+        self.assertEqual(pages_count, 7)
+        self.assertEqual([page_number for page_number, _ in pages], [1, 2, 3, 5, 6, 7])
+        self.assertEqual([page_number for page_number, _ in failures], [4])
+
+    def test_cached_pages_are_not_extracted_again(self):
+        cache = Extraction_cache(os.path.join(self.dir, "cache"))
+        self.addCleanup(cache.close)
+        manager = quiet_manager(cache=cache)
+        expected = manager.parallel_read_pdf_document(self.second, workers=2)
+        counters = manager.instrumentation.counters
+        self.assertEqual(counters["cache_misses"], 4)  # The page count and the three pages
+        self.assertEqual(manager.parallel_read_pdf_document(self.second, workers=2), expected)
+        self.assertEqual(counters["cache_hits"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
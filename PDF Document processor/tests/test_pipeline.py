@@ -0,0 +1,79 @@
+# Tests of the pipelines against the same operations run one after another
+import io
+import os
+import tempfile
+import unittest
+
+import pikepdf
+import PyPDF2
+
+from tests import dummy_pdf, make_pdf, quiet_manager
+
+
+class Pipeline_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    # Rotation, boxes and text of each page
+    def page_states(self, source, password: str = "") -> list:
+        decrypted = io.BytesIO()
+        with pikepdf.open(source, password=password) as pdf:
+            boxes = [(int(page.get("/Rotate", 0)), [float(value) for value in page.mediabox],
+                      [float(value) for value in page.cropbox]) for page in pdf.pages]
+            pdf.save(decrypted)
+        reader = PyPDF2.PdfReader(decrypted)
+        return [(*box, " ".join(page.extract_text().split())) for box, page in zip(boxes, reader.pages)]
+
+    def test_chain_equals_single_operations(self):
+        source = make_pdf(self.path("doc.pdf"), pages=4)
+        self.assertTrue(self.manager.encrypt_pdf_aes256(source, "old", self.path("encrypted.pdf")))
+
+        # One operation after the other, each parsing and writing the document
+        self.assertTrue(self.manager.decrypt_pdf_aes256(self.path("encrypted.pdf"), "old", self.path("1.pdf")))
+        self.manager.rotate_pdf(self.path("1.pdf"), self.path("2.pdf"), 90, pages="1-2")
+        self.manager.cropping_pdf_document(self.path("2.pdf"), self.path("3.pdf"), (36, 36, 400, 700), pages="2-")
+        self.manager.add_watermark(self.path("3.pdf"), self.path("4.pdf"), "DRAFT")
+        self.assertTrue(self.manager.encrypt_pdf_aes256(self.path("4.pdf"), "new", self.path("chained.pdf")))
+
+        # The same steps in a single pass
+        self.manager.pipeline(self.path("encrypted.pdf")).decrypt("old").rotate(90, pages="1-2") \
+            .crop((36, 36, 400, 700), pages="2-").watermark("DRAFT").encrypt("new").save(self.path("pipeline.pdf"))
+
+        chained = self.page_states(self.path("chained.pdf"), "new")
+        self.assertEqual(self.page_states(self.path("pipeline.pdf"), "new"), chained)
+        self.assertEqual([state[0] for state in chained], [90, 90, 0, 0])
+        self.assertEqual([state[2] for state in chained], [[0, 0, 612, 792]] + [[36, 36, 400, 700]] * 3)
+        self.assertTrue(all("DRAFT" in state[3] for state in chained))
+
+    def test_single_step_equals_operation(self):
+        rotated = self.manager.rotate_pdf(dummy_pdf, self.path("rotated.pdf"), 270)
+        self.manager.pipeline(dummy_pdf).rotate(270).save(self.path("pipeline.pdf"))
+        self.assertEqual(self.page_states(self.path("pipeline.pdf")), self.page_states(rotated))
+
+    def test_steps_apply_in_order(self):
+        source = make_pdf(self.path("doc.pdf"), pages=2)
+        output = self.manager.pipeline(source).rotate(90).rotate(90, pages="2").rotate(-90, pages=[1]) \
+            .save(bytearray())
+        self.assertEqual([state[0] for state in self.page_states(io.BytesIO(bytes(output)))], [0, 180])
+
+    def test_invalid_steps(self):
+        pipeline = self.manager.pipeline(dummy_pdf)
+        with self.assertRaises(ValueError):
+            pipeline.rotate(45)
+        with self.assertRaises(ValueError):
+            pipeline.crop((10, 10, 5, 20))
+        with self.assertRaises(ValueError):
+            pipeline.watermark()
+        self.assertEqual(pipeline.steps, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
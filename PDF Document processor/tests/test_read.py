@@ -0,0 +1,83 @@
+# Tests of the page count and of the streaming text extraction
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import PyPDF2
+
+import extraction_cache
+import pdf_manager
+from tests import corrupt_page, dummy_pdf, make_pdf, quiet_manager
+from extraction_cache import Extraction_cache, hash_file
+
+
+class Read_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=4)
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def test_read_document(self):
+        pages_count, pages = self.manager.read_pdf_document(self.source)
+        self.assertEqual(pages_count, 4)
+        self.assertEqual([(number, text.strip()) for number, text in pages],
+                         [(1, "Page 1"), (2, "Page 2"), (3, "Page 3"), (4, "Page 4")])
+        # Ranges are clamped to the document
+        self.assertEqual([number for number, _ in self.manager.read_pdf_document(self.source, 3, 10)[1]], [3, 4])
+        self.assertEqual(self.manager.read_pdf_document(dummy_pdf)[0], self.manager.count_pdf_pages(dummy_pdf))
+
+    def test_iteration_is_lazy(self):
+        pages = self.manager.iter_pdf_pages(self.source, first_page=2)
+        self.assertEqual(next(pages)[0], 2)
+        self.assertEqual(next(pages)[0], 3)
+        pages.close()
+        self.assertEqual([number for number, _ in self.manager.iter_pdf_pages(self.source, 2, 3)], [2, 3])
+
+    def test_truncated_document(self):
+        with open(self.source, "rb") as source_file:
+            data = source_file.read()
+        with open(self.source, "wb") as source_file:
+            source_file.write(data[:len(data) // 2])
+
+        self.assertEqual(self.manager.count_pdf_pages(self.source), 0)
+        self.assertEqual(self.manager.read_pdf_document(self.source), (0, []))
+        with self.assertRaises(Exception):
+            list(self.manager.iter_pdf_pages(self.source))
+
+    def test_failure_mid_document(self):
+        corrupt_page(self.source, 3)
+        events = []
+        self.manager.instrumentation.add_hook(events.append)
+
+        # No part of the pages is returned as if the document had been read
+        self.assertEqual(self.manager.read_pdf_document(self.source), (0, []))
+        self.assertEqual(sum(event["name"] == "read.error" for event in events), 1)
+
+        # The pages before the broken one are streamed, then the error is raised
+        streamed = []
+        with self.assertRaises(Exception):
+            for page_number, _ in self.manager.iter_pdf_pages(self.source):
+                streamed.append(page_number)
+        self.assertEqual(streamed, [1, 2])
+
+    def test_document_is_parsed_and_hashed_once(self):
+        cache = Extraction_cache(os.path.join(self.dir, "cache"))
+        self.addCleanup(cache.close)
+        manager = quiet_manager(cache=cache)
+        with mock.patch.object(pdf_manager.PyPDF2, "PdfReader", wraps=PyPDF2.PdfReader) as parsing, \
+                mock.patch.object(extraction_cache, "hash_file", wraps=hash_file) as hashing:
+            self.assertEqual(manager.read_pdf_document(self.source)[0], 4)
+            self.assertEqual((parsing.call_count, hashing.call_count), (1, 1))
+
+            # Then served from the cache without parsing
+            self.assertEqual(len(manager.read_pdf_document(self.source)[1]), 4)
+            self.assertEqual(parsing.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
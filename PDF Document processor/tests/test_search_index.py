@@ -0,0 +1,128 @@
+# Tests of the full-text search index and of its incremental updates
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import extraction_cache
+import search_index
+from tests import corrupt_page, dummy_pdf, make_pdf, quiet_manager
+from extraction_cache import Extraction_cache
+from search_index import PDF_search_index
+
+
+class Search_index_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.index = PDF_search_index(os.path.join(self.dir, "index"), quiet_manager())
+        self.first = make_pdf(os.path.join(self.dir, "first.pdf"), pages=3, text="alpha")
+        self.second = make_pdf(os.path.join(self.dir, "second.pdf"), pages=2, text="bravo")
+
+    def tearDown(self):
+        self.index.close()
+        self.temporary_dir.cleanup()
+
+    # Paths and page numbers of the hits of a query
+    def hits(self, query: str) -> list:
+        return sorted((os.path.basename(hit["path"]), hit["page"]) for hit in self.index.search(query))
+
+    # Give a file a later modification time
+    def touch(self, path: str, seconds: int) -> None:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+    def test_search(self):
+        report = self.index.update([self.first, self.second])
+        self.assertEqual((report["indexed"], report["unchanged"], report["pages"], report["failed"]), (2, 0, 5, {}))
+        self.assertEqual(self.hits("alpha"), [("first.pdf", 1), ("first.pdf", 2), ("first.pdf", 3)])
+        self.assertEqual(self.hits("bravo 2"), [("second.pdf", 2)])
+        self.assertEqual(self.hits("charlie"), [])
+        self.assertIn("[bravo]", self.index.search("bravo")[0]["snippet"])
+        self.assertEqual(self.index.stats()["pages"], 5)
+
+        # Paging through the hits
+        self.assertEqual(len(self.index.search("alpha", limit=2)), 2)
+        self.assertEqual(len(self.index.search("alpha", limit=2, offset=2)), 1)
+        with self.assertRaises(ValueError):
+            self.index.search("alpha AND (", raw=True)
+
+    def test_unchanged_documents_are_skipped(self):
+        self.index.update([self.first, self.second])
+        report = self.index.update([self.first, self.second])
+        self.assertEqual((report["indexed"], report["unchanged"]), (0, 2))
+
+    def test_touched_document_is_not_extracted_again(self):
+        self.index.update([self.first])
+        self.touch(self.first, 10)
+        report = self.index.update([self.first])
+        self.assertEqual((report["indexed"], report["unchanged"], report["pages"]), (0, 1, 0))
+        # The new modification time is recorded, so the next update does not hash the file again
+        self.assertEqual(self.index.update([self.first])["unchanged"], 1)
+        self.assertEqual(len(self.hits("alpha")), 3)
+
+    def test_changed_document_is_reindexed(self):
+        self.index.update([self.first, self.second])
+        make_pdf(self.first, pages=1, text="charlie")
+        self.touch(self.first, 10)
+        report = self.index.update([self.first, self.second])
+        self.assertEqual((report["indexed"], report["unchanged"], report["pages"]), (1, 1, 1))
+        self.assertEqual(self.hits("alpha"), [])
+        self.assertEqual(self.hits("charlie"), [("first.pdf", 1)])
+        # The pages of the previous version are gone
+        stats = self.index.stats()
+        self.assertEqual((stats["documents"], stats["pages"]), (2, 3))
+
+    def test_changed_document_is_hashed_once(self):
+        cache = Extraction_cache(os.path.join(self.dir, "cache"))
+        self.index.close()
+        self.index = PDF_search_index(os.path.join(self.dir, "index"), quiet_manager(cache=cache))
+        self.index.update([self.first])
+        make_pdf(self.first, pages=2, text="charlie")
+        self.touch(self.first, 10)
+        with mock.patch.object(extraction_cache, "hash_file", wraps=extraction_cache.hash_file) as cache_hashing, \
+                mock.patch.object(search_index, "hash_file", wraps=search_index.hash_file) as index_hashing:
+            self.assertEqual(self.index.update([self.first])["indexed"], 1)
+        self.assertEqual(cache_hashing.call_count + index_hashing.call_count, 1)
+        self.assertEqual(self.hits("charlie 2"), [("first.pdf", 2)])
+        cache.close()
+
+    def test_unreadable_new_version_is_removed(self):
+        self.index.update([self.first, self.second])
+        corrupt_page(self.first, 2)
+        self.touch(self.first, 10)
+        report = self.index.update([self.first, self.second])
+        self.assertEqual(list(report["failed"]), [self.first])
+        # The text of the previous version no longer matches
+        self.assertEqual(self.hits("alpha"), [])
+        stats = self.index.stats()
+        self.assertEqual((stats["documents"], stats["pages"]), (1, 2))
+
+    def test_parallel_update(self):
+        report = self.index.update([self.first, self.second, dummy_pdf], workers=2)
+        self.assertEqual((report["indexed"], report["failed"]), (3, {}))
+        self.assertEqual(self.hits("bravo 1"), [("second.pdf", 1)])
+
+    def test_failures(self):
+        broken = os.path.join(self.dir, "broken.pdf")
+        with open(broken, "wb") as broken_file:
+            broken_file.write(b"%PDF-1.7\nnot a document")
+        missing = os.path.join(self.dir, "missing.pdf")
+        report = self.index.update([self.first, broken, missing])
+        self.assertEqual(report["indexed"], 1)
+        self.assertEqual(sorted(report["failed"]), [broken, missing])
+
+    def test_remove_and_prune(self):
+        self.index.update([self.first, self.second])
+        self.assertEqual(self.index.remove([self.second, os.path.join(self.dir, "missing.pdf")]), 1)
+        self.assertEqual(self.hits("bravo"), [])
+
+        self.index.update([self.second])
+        os.remove(self.first)
+        self.assertEqual(self.index.prune(), 1)
+        self.assertEqual(self.hits("alpha"), [])
+        self.assertEqual(self.index.stats()["documents"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+# Tests of the page range selectors and of the chunks of a split
+import io
+import os
+import tempfile
+import unittest
+
+import pikepdf
+
+from tests import dummy_pdf, make_pdf, quiet_manager
+from pdf_manager import parse_page_ranges
+
+
+class Parse_page_ranges_test(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_page_ranges("1-3,7,10-", 12), [(1, 3), (7, 7), (10, 12)])
+        self.assertEqual(parse_page_ranges("-5", 12), [(1, 5)])
+        self.assertEqual(parse_page_ranges(" 2 - 4 , 6 ", 6), [(2, 4), (6, 6)])
+        self.assertEqual(parse_page_ranges("1-", 1), [(1, 1)])
+        self.assertEqual(parse_page_ranges("-", 4), [(1, 4)])
+
+    def test_errors(self):
+        for selector in ["", ",", "1,,2", "a", "1-2-3", "1:3", "3-1", "0", "0-2", "13", "10-13"]:
+            with self.subTest(selector=selector), self.assertRaises(ValueError):
+                parse_page_ranges(selector, 12)
+
+
+class Split_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.output_dir = os.path.join(self.dir, "out")
+        self.manager = quiet_manager()
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    # First line of text of each page of each chunk
+    def chunk_pages(self, chunks: list) -> list:
+        pages = []
+        for chunk in chunks:
+            with pikepdf.open(io.BytesIO(chunk) if isinstance(chunk, bytes) else chunk) as pdf:
+                pages.append([int(page.Contents.read_bytes().split(b"(Page ")[1].split(b")")[0])
+                              for page in pdf.pages])
+        return pages
+
+    def test_page_ranges(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=10)
+        chunks = self.manager.splitting_pdf_document(source, self.output_dir, page_ranges="1-3,7,9-")
+        self.assertEqual([os.path.basename(chunk) for chunk in chunks],
+                         ["doc_pages_1-3.pdf", "doc_page_7.pdf", "doc_pages_9-10.pdf"])
+        self.assertEqual(self.chunk_pages(chunks), [[1, 2, 3], [7], [9, 10]])
+
+    def test_default_is_one_page_per_file(self):
+        chunks = self.manager.splitting_pdf_document(dummy_pdf, self.output_dir)
+        with pikepdf.open(dummy_pdf) as pdf:
+            self.assertEqual(len(chunks), len(pdf.pages))
+        self.assertEqual(os.path.basename(chunks[0]), "dummy_page_1.pdf")
+
+    def test_chunk_size(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=7)
+        chunks = self.manager.splitting_pdf_document(source, self.output_dir, chunk_size=3)
+        self.assertEqual(self.chunk_pages(chunks), [[1, 2, 3], [4, 5, 6], [7]])
+
+    def test_by_bookmarks(self):
+        # Bookmarks on pages 1, 3 and 5
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=6, bookmarks=True)
+        chunks = self.manager.splitting_pdf_document(source, self.output_dir, by_bookmarks=True)
+        self.assertEqual(self.chunk_pages(chunks), [[1, 2], [3, 4], [5, 6]])
+
+    def test_max_chunk_bytes(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=8)
+        page_bytes = os.path.getsize(source) / 8
+        chunks = self.manager.splitting_pdf_document(source, self.output_dir, max_chunk_bytes=int(page_bytes * 4))
+        self.assertEqual(self.chunk_pages(chunks), [[1, 2, 3, 4], [5, 6, 7, 8]])
+
+    def test_chunks_in_memory(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=5)
+        with open(source, "rb") as source_file:
+            chunks = self.manager.splitting_pdf_document(source_file.read(), None, chunk_size=2)
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertEqual(self.chunk_pages(chunks), [[1, 2], [3, 4], [5]])
+
+    def test_workers_write_the_same_chunks(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=9)
+        chunks = self.manager.splitting_pdf_document(source, self.output_dir, chunk_size=2, workers=3)
+        self.assertEqual(self.chunk_pages(chunks), [[1, 2], [3, 4], [5, 6], [7, 8], [9]])
+
+    def test_invalid_range_writes_nothing(self):
+        source = make_pdf(os.path.join(self.dir, "doc.pdf"), pages=3)
+        self.assertEqual(self.manager.splitting_pdf_document(source, self.output_dir, page_ranges="2-5"), [])
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# Tests of the warm worker and of the command line handing it its commands
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import pikepdf
+
+from tests import dummy_pdf, package_dir
+import warm_worker
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX") and hasattr(os, "fork"), "The warm worker needs Unix sockets and fork().")
+class Warm_worker_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.socket_path = os.path.join(self.dir, "worker.sock")
+        self.worker = None
+
+    def tearDown(self):
+        if self.worker is not None and self.worker.poll() is None:
+            warm_worker.stop(self.socket_path)
+            try:
+                self.worker.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.worker.kill()
+                self.worker.wait()
+        self.temporary_dir.cleanup()
+
+    # Run main.py with the worker variable set or not
+    def run_main(self, *arguments: str, worker: bool = False) -> subprocess.CompletedProcess:
+        env = {key: value for key, value in os.environ.items() if key != warm_worker.worker_variable}
+        if worker:
+            env[warm_worker.worker_variable] = self.socket_path
+        return subprocess.run([sys.executable, os.path.join(package_dir, "main.py"), *arguments], cwd=self.dir,
+                              env=env, capture_output=True, text=True, timeout=120)
+
+    # Hand a command to the worker only, exiting with 99 when no worker took it
+    def run_remote(self, *arguments: str) -> subprocess.CompletedProcess:
+        code = ("import sys, warm_worker; status = warm_worker.run_remote(sys.argv[2:], sys.argv[1]); "
+                "sys.exit(99 if status is None else status)")
+        return subprocess.run([sys.executable, "-c", code, self.socket_path, *arguments], cwd=self.dir,
+                              env=dict(os.environ, PYTHONPATH=package_dir), capture_output=True, text=True,
+                              timeout=120)
+
+    def start_worker(self) -> None:
+        self.worker = subprocess.Popen([sys.executable, os.path.join(package_dir, "warm_worker.py"),
+                                        "--socket", self.socket_path],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 60
+        while not os.path.exists(self.socket_path):
+            if self.worker.poll() is not None or time.monotonic() > deadline:
+                self.fail("The warm worker did not start.")
+            time.sleep(0.05)
+
+    def rotations(self, path: str) -> list:
+        with pikepdf.open(path) as pdf:
+            return [int(page.obj.get("/Rotate", 0)) for page in pdf.pages]
+
+    def test_no_worker(self):
+        self.assertIsNone(warm_worker.run_remote(["metadata", dummy_pdf], self.socket_path))
+        self.assertFalse(warm_worker.stop(self.socket_path))
+
+    def test_fallback_without_worker(self):
+        cold = self.run_main("metadata", dummy_pdf)
+        fallback = self.run_main("metadata", dummy_pdf, worker=True)
+        self.assertEqual(cold.returncode, 0, cold.stderr)
+        self.assertEqual((fallback.returncode, fallback.stdout), (cold.returncode, cold.stdout))
+        self.assertTrue(json.loads(fallback.stdout)["ok"])
+
+    def test_worker_matches_cold_run(self):
+        self.start_worker()
+        for arguments in [("metadata", dummy_pdf), ("metadata", os.path.join(self.dir, "missing.pdf")),
+                          ("bogus",)]:
+            with self.subTest(arguments=arguments):
+                cold = self.run_main(*arguments)
+                warm = self.run_remote(*arguments)
+                self.assertNotEqual(warm.returncode, 99)
+                self.assertEqual((warm.returncode, warm.stdout), (cold.returncode, cold.stdout))
+
+        # Relative paths are resolved in the directory of the caller
+        cold = self.run_main("rotate", dummy_pdf, "--angle", "90", "--output-dir", "cold")
+        warm = self.run_main("rotate", dummy_pdf, "--angle", "90", "--output-dir", "warm", worker=True)
+        self.assertEqual((warm.returncode, cold.returncode), (0, 0), warm.stderr)
+        self.assertEqual(os.listdir(os.path.join(self.dir, "warm")), os.listdir(os.path.join(self.dir, "cold")))
+        self.assertEqual(self.rotations(os.path.join(self.dir, "warm", "dummy_rotated.pdf")),
+                         self.rotations(os.path.join(self.dir, "cold", "dummy_rotated.pdf")))
+        self.assertEqual(self.worker.poll(), None)
+
+        self.assertTrue(warm_worker.stop(self.socket_path))
+        self.assertEqual(self.worker.wait(timeout=30), 0)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
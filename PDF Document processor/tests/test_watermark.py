@@ -0,0 +1,153 @@
+# Tests of the shared watermark Form XObjects, their placement and the rendered watermarks kept
+import math
+import os
+import tempfile
+import unittest
+
+import pikepdf
+import PyPDF2
+
+from tests import make_image, make_pdf, quiet_manager
+
+
+class Watermark_test(unittest.TestCase):
+    def setUp(self):
+        self.temporary_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temporary_dir.name
+        self.manager = quiet_manager()
+        self.output = self.path("out.pdf")
+
+    def tearDown(self):
+        self.temporary_dir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    # Document whose pages have the given rotations, boxes or sizes
+    def document(self, name: str, pages: int = 4, rotations: tuple = (), crop_boxes: dict = None,
+                 page_size: tuple = (612, 792)) -> str:
+        path = make_pdf(self.path(name), pages=pages, page_size=page_size)
+        with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+            for page, rotation in zip(pdf.pages, rotations):
+                page.obj.Rotate = rotation
+            for page_number, box in (crop_boxes or {}).items():
+                pdf.pages[page_number - 1].cropbox = pikepdf.Array(box)
+            pdf.save(path)
+        return path
+
+    # For each page: the watermark form (object number, bounding box, content) and its placement matrix
+    def stamps(self, path: str) -> list:
+        stamps = []
+        with pikepdf.open(path) as pdf:
+            for page in pdf.pages:
+                placement = page.obj.Contents[-1].read_bytes().split(b"\n")
+                matrix = [float(value) for value in placement[2].split()[:6]]
+                form = page.Resources.XObject[placement[3].split()[0].decode()]
+                stamps.append((form.objgen[0], [float(value) for value in form.BBox], form.read_bytes(), matrix))
+        return stamps
+
+    # Angle of the rotation part of a matrix, in degrees
+    @staticmethod
+    def angle(matrix: list) -> float:
+        return math.degrees(math.atan2(matrix[1], matrix[0])) % 360
+
+    # Angle of the text drawn in a text watermark form
+    def text_angle(self, content: bytes) -> float:
+        for line in content.split(b"\n"):
+            values = line.split()
+            if values[-1:] == [b"cm"] and len(values) == 7 and values[:4] != [b"1", b"0", b"0", b"1"]:
+                return self.angle([float(value) for value in values[:6]])
+        self.fail("No rotated text in the watermark.")
+
+    def test_text_watermark_is_shared(self):
+        source = self.document("doc.pdf")
+        self.assertEqual(self.manager.add_watermark(source, self.output, "DRAFT"), 4)
+        stamps = self.stamps(self.output)
+        self.assertEqual(len({stamp[0] for stamp in stamps}), 1)
+        reader = PyPDF2.PdfReader(self.output)
+        self.assertTrue(all("DRAFT" in page.extract_text() for page in reader.pages))
+
+        # The content of the pages is wrapped, not rewritten
+        with pikepdf.open(source) as original, pikepdf.open(self.output) as stamped:
+            for before, after in zip(original.pages, stamped.pages):
+                self.assertEqual(after.obj.Contents[1].read_bytes(), before.obj.Contents.read_bytes())
+
+    def test_rotated_pages_read_at_45_degrees(self):
+        source = self.document("doc.pdf", rotations=(0, 90, 180, 270))
+        self.manager.add_watermark(source, self.output, "DRAFT")
+        stamps = self.stamps(self.output)
+        self.assertEqual(len({stamp[0] for stamp in stamps}), 4)
+        for rotation, (_, bbox, content, matrix) in zip((0, 90, 180, 270), stamps):
+            with self.subTest(rotation=rotation):
+                # Placed unscaled over the page, turned by the page rotation once displayed
+                self.assertEqual(bbox, [0, 0, 612, 792])
+                self.assertEqual(matrix, [1, 0, 0, 1, 0, 0])
+                self.assertAlmostEqual((self.text_angle(content) + self.angle(matrix) - rotation) % 360, 45)
+
+    def test_image_watermark_follows_the_rotation(self):
+        source = self.document("doc.pdf", pages=2, rotations=(0, 90))
+        self.manager.add_watermark(source, self.output, watermark_image=make_image(self.path("logo.png")))
+        (first, _, first_content, first_matrix), (second, _, second_content, second_matrix) = self.stamps(self.output)
+        self.assertNotEqual(first, second)
+        self.assertEqual(first_matrix, second_matrix)
+        self.assertNotEqual(first_content, second_content)
+
+    def test_one_form_per_page_size(self):
+        small = self.document("small.pdf", pages=2, page_size=(300, 400))
+        large = self.document("large.pdf", pages=2)
+        merged = self.path("merged.pdf")
+        self.manager.merge_pdf_documents([small, large, small], merged)
+        self.manager.add_watermark(merged, self.output, "DRAFT")
+        stamps = self.stamps(self.output)
+        self.assertEqual([stamp[1] for stamp in stamps], [[0, 0, 300, 400]] * 2 + [[0, 0, 612, 792]] * 2
+                         + [[0, 0, 300, 400]] * 2)
+        self.assertEqual(len({stamp[0] for stamp in stamps}), 2)
+
+    def test_crop_box_is_covered_as_in_pipelines(self):
+        source = self.document("doc.pdf", pages=2, crop_boxes={2: [100, 100, 400, 500]})
+        self.manager.add_watermark(source, self.output, "DRAFT")
+        stamps = self.stamps(self.output)
+        self.assertEqual(stamps[1][1], [0, 0, 300, 400])
+        self.assertEqual(stamps[1][3], [1, 0, 0, 1, 100, 100])
+
+        piped = self.path("pipeline.pdf")
+        self.manager.pipeline(source).watermark("DRAFT").save(piped)
+        self.assertEqual([stamp[1:] for stamp in self.stamps(piped)], [stamp[1:] for stamp in stamps])
+
+    def test_edited_watermark_pdf_is_rendered_again(self):
+        watermark = make_pdf(self.path("watermark.pdf"), pages=1, text="First")
+        source = self.document("doc.pdf", pages=1)
+        self.manager.add_watermark(source, self.output, watermark_pdf=watermark)
+        self.assertIn(b"(First 1)", self.stamps(self.output)[0][2])
+
+        make_pdf(watermark, pages=1, text="Second")
+        stat = os.stat(watermark)
+        os.utime(watermark, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.manager.add_watermark(source, self.output, watermark_pdf=watermark)
+        self.assertIn(b"(Second 1)", self.stamps(self.output)[0][2])
+
+    def test_rendered_watermarks_are_bounded(self):
+        source = self.document("doc.pdf", pages=1)
+        kept = self.manager.watermark_renders_kept
+        for number in range(kept + 4):
+            self.manager.add_watermark(source, self.output, f"Text {number}")
+            self.manager.add_watermark(source, self.output, "Text 0")
+        self.assertEqual(len(self.manager._watermark_renders), kept)
+        # The watermark used most recently is kept
+        self.assertIn("Text 0", [key[0] for key in self.manager._watermark_renders])
+
+    def test_watermark_directory(self):
+        input_dir = self.path("inputs")
+        os.makedirs(input_dir)
+        make_pdf(os.path.join(input_dir, "first.pdf"), pages=2)
+        make_pdf(os.path.join(input_dir, "second.pdf"), pages=1)
+        with open(os.path.join(input_dir, "broken.pdf"), "wb") as broken_file:
+            broken_file.write(b"%PDF-1.7\nnot a document")
+        outputs = self.manager.add_watermark_to_directory(input_dir, self.path("outputs"), "DRAFT")
+        self.assertEqual([os.path.basename(output) for output in outputs], ["first.pdf", "second.pdf"])
+        with self.assertRaises(ValueError):
+            self.manager.add_watermark_to_directory(input_dir, self.path("outputs"))
+
+
+if __name__ == "__main__":
+    unittest.main()
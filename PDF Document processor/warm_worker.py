@@ -0,0 +1,253 @@
+"""
+    This module keeps the PDF manager loaded in a long-lived process that the command line hands
+    its commands to, so repeated invocations skip the library imports and most of the startup.
+    The worker imports every library once and listens on a Unix socket. Each command runs in a
+    child forked from it, in the working directory and environment of the caller, and writes
+    straight to the standard streams of the caller, which are passed over the socket.
+    The worker exits when its source files change, and the command line then runs commands itself.
+
+    Usage: python warm_worker.py [--socket PATH]           Start the worker (in the background: add &).
+           PDF_MANAGER_WORKER=PATH python main.py split ...  Hand the commands to it.
+           python warm_worker.py --stop [--socket PATH]    Stop it.
+"""
+# Necessary modules
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from typing import List, Optional
+
+from lazy_modules import lazy_import
+
+# Needed by the worker only, not by the command line handing it a command
+argparse = lazy_import("argparse")
+tempfile = lazy_import("tempfile")
+
+# Environment variable naming the socket of the worker the command line hands its commands to
+worker_variable = "PDF_MANAGER_WORKER"
+
+# Largest request accepted (command line and environment), in bytes
+max_request_bytes = 1024 * 1024
+
+
+# Default socket of the worker of the current user
+def default_socket_path() -> str:
+    return os.path.join(tempfile.gettempdir(), f"pdf_manager_worker_{os.getuid()}.sock")
+
+
+# Latest modification time of the modules the worker has loaded from its directory
+def _code_version() -> float:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return max(os.stat(os.path.join(script_dir, name)).st_mtime for name in os.listdir(script_dir)
+               if name.endswith(".py"))
+
+
+# Read a JSON line from a socket, with the file descriptors sent along
+def _receive_request(connection: socket.socket) -> tuple:
+    data, fds, _, _ = socket.recv_fds(connection, max_request_bytes, 3)
+    while data and not data.endswith(b"\n") and len(data) < max_request_bytes:
+        chunk = connection.recv(max_request_bytes - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data or b"{}"), fds
+
+
+# Send a JSON line over a socket
+def _send(connection: socket.socket, message: dict) -> None:
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+# Run a command in a child of the worker
+def _run_command(connection: socket.socket, request: dict, fds: List[int]) -> None:
+    # The children of the command (worker pools) must be waited for again
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    status = 1
+    try:
+        _send(connection, {"pid": os.getpid()})
+        # The standard streams of the caller replace those of the worker
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+
+        import batch
+        try:
+            status = batch.main(request["argv"])
+        except SystemExit as e:
+            # argparse exits on usage errors
+            status = e.code if isinstance(e.code, int) else 1
+        except KeyboardInterrupt:
+            status = 130
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            _send(connection, {"exit": status})
+        finally:
+            os._exit(0)
+    ## End _run_command() function ##
+
+
+# Serve commands until stopped
+def serve(socket_path: Optional[str] = None) -> None:
+    """
+    Loads the libraries and runs the commands sent to a Unix socket, each in a forked child.
+
+    Args:
+        socket_path (Optional[str]): Path of the socket. Defaults to default_socket_path().
+            The socket is readable and writable by the current user only.
+    """
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "fork"):
+        raise OSError("The warm worker needs Unix sockets and fork().")
+    socket_path = socket_path or default_socket_path()
+
+    # Import everything the commands use, once, so that the children inherit it
+    import batch  # noqa: F401
+    from lazy_modules import preload_modules
+    preload_modules()
+    code_version = _code_version()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(previous_umask)
+    server.listen(16)
+    # The children are reaped by the system
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print(f"Warm worker listening on {socket_path} (export {worker_variable}={socket_path})", file=sys.stderr)
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    request, fds = _receive_request(connection)
+                except (OSError, ValueError):
+                    continue
+                if request.get("stop"):
+                    _send(connection, {"exit": 0})
+                    break
+                # Commands must not run code older than the files
+                if _code_version() != code_version:
+                    _send(connection, {"stale": True})
+                    print("Source files changed, the warm worker stops.", file=sys.stderr)
+                    break
+                if os.fork() == 0:
+                    server.close()
+                    _run_command(connection, request, fds)
+                for fd in fds:
+                    os.close(fd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    ## End serve() function ##
+
+
+# Hand a command to the worker
+def run_remote(argv: List[str], socket_path: Optional[str] = None) -> Optional[int]:
+    """
+    Runs a batch command in the warm worker, with the standard streams of this process.
+
+    Args:
+        argv (List[str]): Command line arguments, as given to batch.main().
+        socket_path (Optional[str]): Path of the socket of the worker. Defaults to default_socket_path().
+
+    Returns:
+        Optional[int]: The exit status of the command, or None when no worker is available
+            (the command must then run in this process).
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path or default_socket_path())
+    except OSError:
+        connection.close()
+        return None
+
+    with connection:
+        request = json.dumps({"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}).encode("utf-8") + b"\n"
+        socket.send_fds(connection, [request], [0, 1, 2])
+        replies = connection.makefile("rb")
+        pid = None
+        try:
+            for line in replies:
+                reply = json.loads(line)
+                if reply.get("stale"):
+                    return None
+                if "pid" in reply:
+                    pid = reply["pid"]
+                if "exit" in reply:
+                    return reply["exit"]
+        except KeyboardInterrupt:
+            # Interrupt the command too, and wait for it to stop writing
+            if pid is not None:
+                os.kill(pid, signal.SIGINT)
+                for line in replies:
+                    if "exit" in json.loads(line):
+                        break
+            return 130
+    # The worker died while running the command
+    return 1
+    ## End run_remote() function ##
+
+
+# Stop the worker
+def stop(socket_path: Optional[str] = None) -> bool:
+    """
+    Asks the worker to stop.
+
+    Args:
+        socket_path (Optional[str]): Path of the socket of the worker. Defaults to default_socket_path().
+
+    Returns:
+        bool: True when a worker was running.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path or default_socket_path())
+    except OSError:
+        connection.close()
+        return False
+    with connection:
+        _send(connection, {"stop": True})
+        connection.recv(64)
+    return True
+
+
+# Command line of the worker
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Keep the PDF manager loaded for the command line.")
+    parser.add_argument("--socket", help=f"path of the socket (default: {default_socket_path()})")
+    parser.add_argument("--stop", action="store_true", help="stop the running worker")
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        if not stop(args.socket):
+            print("No warm worker is running.", file=sys.stderr)
+            return 1
+        return 0
+    start_time = time.perf_counter()
+    serve(args.socket)
+    print(f"Warm worker stopped after {time.perf_counter() - start_time:.0f} s", file=sys.stderr)
+    return 0
+
+
+# Running the worker
+if __name__ == "__main__":
+    sys.exit(main())